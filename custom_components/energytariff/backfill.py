@@ -0,0 +1,167 @@
+"""Energy of local hours, read back from the recorder.
+
+Used to seed the monthly peaks when the saved peaks and sensor states have
+been lost, and to fill gaps in the meter updates seen by the energy sensor.
+The history of the meter is read in one job on the recorder's executor:
+5-minute short-term statistics, and hourly long-term statistics for the time
+before them.  If the meter has no statistics, its recorded states are
+integrated like meter updates.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from logging import getLogger
+
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.recorder import async_wait_recorder, get_instance
+from homeassistant.util import dt
+
+from .engine import (
+    WATT_SECONDS_PER_KWH,
+    LocalHour,
+    hour_energies,
+    hour_energies_numpy,
+)
+from .utils import LOCAL_HOURS, convert_to_watt
+
+_LOGGER = getLogger(__name__)
+
+# Statistics of the meter are read in W
+_POWER_UNITS = {"power": "W"}
+
+
+def _statistics_hours(
+    hass: HomeAssistant, entity_id: str, start: datetime, end: datetime
+) -> tuple[dict[LocalHour, float], datetime]:
+    """Energy per local hour from mean power in 5-minute and hourly statistics,
+    and the time they cover up to.
+
+    Statistics periods that are partly outside start to end are counted for
+    the part inside, at their mean power."""
+    from homeassistant.components.recorder.statistics import (  # noqa: PLC0415
+        statistics_during_period,
+    )
+
+    first = start.timestamp()
+    energies: dict[LocalHour, float] = {}
+
+    def _read(period: str, seconds: int, until: float) -> list[dict]:
+        # Rows are returned by start, the one around first starts before it
+        rows = statistics_during_period(
+            hass,
+            dt.utc_from_timestamp(first - first % seconds),
+            dt.utc_from_timestamp(until),
+            {entity_id},
+            period,
+            _POWER_UNITS,
+            {"mean"},
+        ).get(entity_id, [])
+        for row in rows:
+            row_start = max(row["start"], first)
+            seconds_inside = min(row["end"], until) - row_start
+            if row.get("mean") is None or seconds_inside <= 0:
+                continue
+            hour = LOCAL_HOURS.hour_at(row_start)
+            energies[hour] = (
+                energies.get(hour, 0.0)
+                + row["mean"] * seconds_inside / WATT_SECONDS_PER_KWH
+            )
+        return rows
+
+    # Short-term statistics are only kept for some days, and the last minutes
+    # are not compiled yet
+    last = end.timestamp()
+    short_term = _read("5minute", 300, last)
+    covered = min(short_term[-1]["end"], last) if short_term else first
+    if not short_term or short_term[0]["start"] > first:
+        long_term = _read("hour", 3600, short_term[0]["start"] if short_term else last)
+        if long_term and not short_term:
+            covered = min(long_term[-1]["end"], last)
+    return energies, dt.utc_from_timestamp(max(covered, first))
+
+
+def _state_hours(
+    hass: HomeAssistant, entity_id: str, start: datetime, end: datetime
+) -> dict[LocalHour, float]:
+    """Energy per local hour integrated from recorded meter states"""
+    from homeassistant.components.recorder.history import (  # noqa: PLC0415
+        state_changes_during_period,
+    )
+
+    # A state changed exactly at start is neither the state at start nor a
+    # change after it
+    states = state_changes_during_period(
+        hass, start - timedelta(milliseconds=1), end, entity_id
+    ).get(entity_id, [])
+    first = start.timestamp()
+    times: list[float] = []
+    watts: list[float] = []
+    for state in states:
+        try:
+            watt = convert_to_watt(state)
+        except ValueError:
+            continue
+        if watt is None:
+            continue
+        # The state at start may be older
+        times.append(max(state.last_updated_timestamp, first))
+        watts.append(watt)
+    if not times:
+        return {}
+    # The hour clock of a live instance keeps the last power to the end of its hour
+    times.append(min(end.timestamp(), LOCAL_HOURS.hour_at(times[-1]).end))
+    watts.append(watts[-1])
+    # NumPy is not a requirement of the integration, it is used if installed
+    try:
+        import numpy  # noqa: F401, PLC0415
+    except ImportError:
+        energies = hour_energies
+    else:
+        energies = hour_energies_numpy
+    return dict(energies([(times, watts)], LOCAL_HOURS))
+
+
+def _read_hours(
+    hass: HomeAssistant, entity_id: str, start: datetime, end: datetime
+) -> list[tuple[LocalHour, float]]:
+    energies, covered = _statistics_hours(hass, entity_id, start, end)
+    if covered < end:
+        for hour, energy in _state_hours(hass, entity_id, covered, end).items():
+            energies[hour] = energies.get(hour, 0.0) + energy
+    return sorted(energies.items())
+
+
+async def async_read_hours(
+    hass: HomeAssistant, entity_id: str, start: float, end: float
+) -> list[tuple[LocalHour, float]]:
+    """Returns the energy in kWh used from start to end in each local hour.
+
+    Hours partly inside start to end get the energy of that part.  Returns an
+    empty list if the recorder is not running or has nothing for the meter."""
+    if end <= start or not await async_wait_recorder(hass):
+        return []
+    hours = await get_instance(hass).async_add_executor_job(
+        _read_hours,
+        hass,
+        entity_id,
+        dt.utc_from_timestamp(start),
+        dt.utc_from_timestamp(end),
+    )
+    _LOGGER.debug(
+        "Read %d hours of %s from %s to %s from the recorder",
+        len(hours),
+        entity_id,
+        start,
+        end,
+    )
+    return hours
+
+
+async def async_read_month_hours(
+    hass: HomeAssistant, entity_id: str, now: float
+) -> list[tuple[LocalHour, float]]:
+    """Returns the energy of each hour of the month of now, up to now, in kWh"""
+    hour = LOCAL_HOURS.hour_at(now)
+    month_start = LOCAL_HOURS.table(hour.year, hour.month).start
+    return await async_read_hours(hass, entity_id, month_start, now)
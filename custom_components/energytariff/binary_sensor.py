@@ -0,0 +1,186 @@
+"""Threshold alarms of energytariff, as binary sensors.
+
+Loaded by the sensor platform of an instance when alarms are configured.
+The alarms follow the meter updates and thresholds of the coordinator and
+only write their state when it changes, so automations trigger on them a
+few times per hour instead of on every meter update.
+"""
+
+from __future__ import annotations
+
+from abc import abstractmethod
+from logging import getLogger
+from typing import Any
+
+from homeassistant.components.binary_sensor import (
+    BinarySensorDeviceClass,
+    BinarySensorEntity,
+)
+from homeassistant.core import callback
+from homeassistant.helpers.device_registry import DeviceInfo
+
+from .const import (
+    ALARMS,
+    CONF_EFFECT_ENTITY,
+    DOMAIN,
+    GRID_LEVELS,
+    HYSTERESIS,
+    ICON,
+    LEAD_TIME,
+    TARGET_ENERGY,
+)
+from .coordinator import (
+    EnergyData,
+    GridCapacityCoordinator,
+    GridThresholdData,
+    async_get_coordinator,
+)
+from .engine import estimate_hour_energy
+from .utils import make_device_info
+
+_LOGGER = getLogger(__name__)
+
+
+async def async_setup_platform(hass, config, async_add_entities, discovery_info=None):
+    """Setup binary sensor platform, from the sensor platform of an instance."""
+    if discovery_info is None:
+        _LOGGER.warning(
+            "Threshold alarms are set up with alarms in the sensor configuration"
+        )
+        return
+    coordinator = async_get_coordinator(hass, discovery_info[CONF_EFFECT_ENTITY])
+    if coordinator is None:
+        return
+    has_levels = coordinator.config.get(GRID_LEVELS) is not None
+    alarms: list[GridCapWatcherAlarm] = []
+    # Without a number as target the projection is held against the level
+    # threshold, which needs levels
+    if has_levels or isinstance(coordinator.config.get(TARGET_ENERGY), float):
+        alarms.append(GridCapWatcherProjectedOverTarget(coordinator))
+    if has_levels:
+        alarms.append(GridCapWatcherOverLevelThreshold(coordinator))
+    if not alarms:
+        _LOGGER.warning(
+            "Threshold alarms need levels or a number as target_energy, none "
+            "are added for %s",
+            discovery_info[CONF_EFFECT_ENTITY],
+        )
+        return
+    async_add_entities(alarms)
+
+
+class GridCapWatcherAlarm(BinarySensorEntity):
+    """Alarm that is on while a value of the hour is above a limit.
+
+    It turns on when the value goes above the limit and off when it is
+    hysteresis kWh below it.  Without a limit the state is unknown.
+    """
+
+    _attr_should_poll = False
+    _attr_device_class = BinarySensorDeviceClass.PROBLEM
+    _attr_icon = ICON
+    _unique_id_suffix: str
+
+    def __init__(self, coordinator: GridCapacityCoordinator):
+        self._coordinator = coordinator
+        config = coordinator.config
+        self._effect_sensor_id = config.get(CONF_EFFECT_ENTITY)
+        alarms: dict[str, Any] = config.get(ALARMS) or {}
+        self._hysteresis = alarms.get(HYSTERESIS, 0.0)
+        self._lead_time: float | None = alarms.get(LEAD_TIME)
+        self._threshold: float | None = None
+        self._last: EnergyData | None = None
+        self._attr_is_on = None
+        self._attr_unique_id = (
+            f"{DOMAIN}_{self._effect_sensor_id}_{self._unique_id_suffix}".replace(
+                "sensor.", ""
+            )
+        )
+
+    async def async_added_to_hass(self) -> None:
+        """Call when entity about to be added to hass."""
+        await super().async_added_to_hass()
+        self.async_on_remove(
+            self._coordinator.thresholddata.subscribe(self._threshold_state_change)
+        )
+        self.async_on_remove(
+            self._coordinator.effectstate.subscribe(self._effect_state_change)
+        )
+
+    @callback
+    def _threshold_state_change(self, state: GridThresholdData):
+        self._threshold = state.level
+        self._update()
+
+    @callback
+    def _effect_state_change(self, state: EnergyData):
+        if state.energy_consumed is None or state.current_effect is None:
+            return
+        self._last = state
+        self._update()
+
+    def _limit(self) -> float | None:
+        """Limit of the value in kWh"""
+        return self._threshold
+
+    @abstractmethod
+    def _value(self, state: EnergyData) -> float:
+        """Value of the hour in kWh"""
+
+    def _update(self) -> None:
+        limit = self._limit()
+        if limit is None or self._last is None:
+            return
+        value = self._value(self._last)
+        is_on = self._attr_is_on
+        if value > limit:
+            is_on = True
+        elif value < limit - self._hysteresis or is_on is None:
+            is_on = False
+        if is_on is not self._attr_is_on:
+            self._attr_is_on = is_on
+            self.async_write_ha_state()
+
+    @property
+    def device_info(self) -> DeviceInfo:
+        return make_device_info(self._effect_sensor_id)
+
+
+class GridCapWatcherProjectedOverTarget(GridCapWatcherAlarm):
+    """On while the energy of the hour is projected to exceed the target.
+
+    The projection keeps the current power to the end of the hour, or for
+    the lead time if that ends earlier, so the alarm comes on at most lead
+    time seconds before the target would be reached.  The target is
+    target_energy if it is a number, else the threshold of the current level.
+    """
+
+    _attr_name = "Projected over target this hour"
+    _unique_id_suffix = "projected_over_target"
+
+    def __init__(self, coordinator: GridCapacityCoordinator):
+        super().__init__(coordinator)
+        target = coordinator.config.get(TARGET_ENERGY)
+        self._target = target if isinstance(target, float) else None
+
+    def _limit(self) -> float | None:
+        return self._threshold if self._target is None else self._target
+
+    def _value(self, state: EnergyData) -> float:
+        seconds = state.hour.end - state.epoch
+        if self._lead_time is not None:
+            seconds = min(seconds, self._lead_time)
+        return estimate_hour_energy(
+            state.energy_consumed, state.current_effect, seconds
+        )
+
+
+class GridCapWatcherOverLevelThreshold(GridCapWatcherAlarm):
+    """On while the energy used this hour is above the threshold of the
+    current level"""
+
+    _attr_name = "Over level threshold this hour"
+    _unique_id_suffix = "over_level_threshold"
+
+    def _value(self, state: EnergyData) -> float:
+        return state.energy_consumed
@@ -0,0 +1,485 @@
+"""Offline tariff calculation from files of meter readings.
+
+Streams timestamped power readings from a CSV or NumPy file through the
+tariff engine and writes the energy of each local hour, and the peak hours,
+capacity level and price of each month.  Home Assistant is not needed:
+
+    python -m custom_components.energytariff.cli meter.csv \\
+        --time-zone Europe/Oslo --config tariff.yaml --hours hours.csv
+
+Readings are read in chunks and hours are written as they end, so memory
+use does not depend on the size of the file.  Power is taken as constant
+from a reading to the next one, and intervals longer than an hour are not
+counted, as the sensors do with meter updates.  Readings in kWh or Wh are
+taken as the energy used in the hour starting at their timestamp, as in
+hourly exports of grid operators.  Peaks are taken from the energy of
+whole hours.  With NumPy installed, each chunk is integrated with array
+operations.  A NumPy file holds an array with epoch seconds in the first
+column and readings in the last column.
+
+Given a directory, each CSV or NumPy file in it is the history of a meter.
+The files are spread over a process pool and a table with the peaks, level
+and cost of each meter and month is written as CSV:
+
+    python -m custom_components.energytariff.cli exports/ --unit kWh \
+        --time-zone Europe/Oslo --config tariff.yaml --summary fleet.csv
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import csv
+import itertools
+import json
+import sys
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, tzinfo
+from pathlib import Path
+from typing import IO
+from zoneinfo import ZoneInfo
+
+from .const import GRID_LEVELS, LEVEL_NAME, LEVEL_PRICE, WATTS_PER_KW
+from .engine import (
+    Chunk,
+    LocalHour,
+    LocalHours,
+    PeakTracker,
+    TopHour,
+    hour_energies,
+    hour_energies_numpy,
+    hour_totals,
+)
+from .levels import LevelTable
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is optional
+    np = None
+
+# Readings per chunk
+CHUNK_SIZE = 100_000
+
+
+@dataclass
+class MonthResult:
+    """Energy, peak hours and level of a month"""
+
+    year: int
+    month: int
+    energy: float = 0.0
+    top_three: tuple[TopHour, ...] = ()
+    average: float | None = None
+    level_name: str | None = None
+    level_threshold: float | None = None
+    price: float | None = None
+
+
+@dataclass
+class TariffResult:
+    """Result of a run, one entry per month with readings"""
+
+    hours: int = 0
+    months: list[MonthResult] = field(default_factory=list)
+
+
+class MonthlyTariff:
+    """Collects hour energies into monthly peaks, levels and prices"""
+
+    def __init__(self, levels: LevelTable | None = None) -> None:
+        self._levels = levels
+        self._peaks = PeakTracker()
+        self.result = TariffResult()
+
+    def add(self, hour: LocalHour, energy: float) -> None:
+        """Add the energy of an hour, hours must come in order"""
+        months = self.result.months
+        if not months or (months[-1].year, months[-1].month) != (
+            hour.year,
+            hour.month,
+        ):
+            self._finish_month()
+            months.append(MonthResult(hour.year, hour.month))
+        months[-1].energy += energy
+        self.result.hours += 1
+        self._peaks.add(hour, energy)
+
+    def finish(self) -> TariffResult:
+        """Summarize the last month and return the result"""
+        self._finish_month()
+        return self.result
+
+    def _finish_month(self) -> None:
+        if not self.result.months:
+            return
+        month = self.result.months[-1]
+        peaks = self._peaks.data
+        month.top_three = tuple(sorted(peaks.top_three, key=lambda hour: hour.day))
+        month.average = peaks.average
+        if self._levels is None or peaks.average is None:
+            return
+        index = self._levels.find(peaks.average)
+        if index is None:
+            return
+        level = self._levels.levels[index]
+        month.level_name = level.name
+        month.level_threshold = level.threshold
+        month.price = level.price
+
+
+def _parse_time(value: str, time_zone: tzinfo) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        local = datetime.fromisoformat(value)
+    if local.tzinfo is None:
+        local = local.replace(tzinfo=time_zone)
+    return local.timestamp()
+
+
+def read_csv(
+    stream: IO[str], time_zone: tzinfo, scale: float = 1, chunk_size: int = CHUNK_SIZE
+) -> Iterator[tuple[list[float], list[float]]]:
+    """Returns chunks of readings from CSV with a timestamp in the first column
+    and power or energy in the last.  Timestamps are epoch seconds or ISO 8601, local to
+    time_zone unless they have an offset.  A header row is skipped"""
+    times: list[float] = []
+    watts: list[float] = []
+    for number, row in enumerate(csv.reader(stream)):
+        if not row:
+            continue
+        try:
+            timestamp = _parse_time(row[0].strip(), time_zone)
+            power = float(row[-1]) * scale
+        except ValueError:
+            if number == 0:
+                continue
+            raise ValueError(f"Line {number + 1}: cannot read {row}") from None
+        times.append(timestamp)
+        watts.append(power)
+        if len(times) == chunk_size:
+            yield times, watts
+            times = []
+            watts = []
+    if times:
+        yield times, watts
+
+
+def read_npy(
+    path: Path, scale: float = 1, chunk_size: int = CHUNK_SIZE
+) -> Iterator[Chunk]:
+    """Returns chunks of readings from a NumPy file, which is memory mapped"""
+    readings = np.load(path, mmap_mode="r")
+    if readings.ndim != 2 or readings.shape[1] < 2:
+        raise ValueError(f"{path} must hold an array of shape (readings, 2)")
+    for start in range(0, readings.shape[0], chunk_size):
+        chunk = readings[start : start + chunk_size]
+        yield chunk[:, 0], chunk[:, -1] * scale
+
+
+def read_file(
+    path: Path, time_zone: tzinfo, scale: float = 1, chunk_size: int = CHUNK_SIZE
+) -> Iterator[Chunk]:
+    """Returns chunks of readings from a .npy file or else a CSV file"""
+    if path.suffix == ".npy":
+        if np is None:
+            raise ValueError(f"NumPy is needed to read {path}")
+        yield from read_npy(path, scale, chunk_size)
+        return
+    with open(path, newline="", encoding="utf-8") as stream:
+        yield from read_csv(stream, time_zone, scale, chunk_size)
+
+
+def load_levels(path: Path, prices: dict[str, float] | None = None) -> LevelTable:
+    """Reads levels from a JSON or YAML file laid out like the sensor config.
+
+    Prices given by level name replace those of the file.  Template prices
+    are rendered by Home Assistant, so they must be given, else ValueError is
+    raised."""
+    text = path.read_text(encoding="utf-8")
+    if path.suffix in (".yaml", ".yml"):
+        import yaml  # noqa: PLC0415
+
+        config = yaml.safe_load(text)
+    else:
+        config = json.loads(text)
+    prices = prices or {}
+    levels = []
+    for level in config[GRID_LEVELS]:
+        name = str(level[LEVEL_NAME])
+        price = prices.get(name, level[LEVEL_PRICE])
+        try:
+            price = float(price)
+        except (TypeError, ValueError):
+            raise ValueError(
+                f"Level '{name}' has the template price {price!r}, "
+                f"give the price with --price '{name}=<price>'"
+            ) from None
+        levels.append({**level, LEVEL_PRICE: price})
+    return LevelTable(levels)
+
+
+def _level_price(text: str) -> tuple[str, float]:
+    """Parses a --price argument, NAME=PRICE"""
+    name, separator, price = text.rpartition("=")
+    if separator and name:
+        try:
+            return name, float(price)
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError(f"expected NAME=PRICE, got {text!r}")
+
+
+def run(
+    chunks: Iterable[Chunk],
+    time_zone: tzinfo,
+    levels: LevelTable | None = None,
+    hours_out: IO[str] | None = None,
+    vectorized: bool | None = None,
+    energy_readings: bool = False,
+) -> TariffResult:
+    """Calculates the tariff of readings, writing hours to hours_out as CSV.
+    Readings are power in W, or energy in kWh if energy_readings is set"""
+    if vectorized is None:
+        vectorized = np is not None
+    local_hours = LocalHours(lambda: time_zone)
+    energies: Callable[..., Iterator[tuple[LocalHour, float]]] = hour_energies
+    if energy_readings:
+        energies = hour_totals
+    elif vectorized:
+        energies = hour_energies_numpy
+    tariff = MonthlyTariff(levels)
+    writer = csv.writer(hours_out) if hours_out is not None else None
+    if writer is not None:
+        writer.writerow(("start", "energy_kwh"))
+    for hour, energy in energies(chunks, local_hours):
+        tariff.add(hour, energy)
+        if writer is not None:
+            start = datetime.fromtimestamp(hour.start, time_zone)
+            writer.writerow((start.isoformat(), f"{energy:.6f}"))
+    return tariff.finish()
+
+
+@dataclass(frozen=True)
+class FleetOptions:
+    """How the files of a fleet are read and priced, sent to each worker"""
+
+    time_zone: tzinfo
+    levels: LevelTable | None = None
+    unit: str = "W"
+    chunk_size: int = CHUNK_SIZE
+    vectorized: bool | None = None
+
+
+# Factor to W for power units, or to kWh for energy units
+UNITS = {"W": 1, "kW": WATTS_PER_KW, "kWh": 1, "Wh": 1 / WATTS_PER_KW}
+ENERGY_UNITS = ("kWh", "Wh")
+
+
+def analyze_file(path: Path, options: FleetOptions) -> TariffResult:
+    """Calculates the tariff of the readings of one meter"""
+    return run(
+        read_file(path, options.time_zone, UNITS[options.unit], options.chunk_size),
+        options.time_zone,
+        options.levels,
+        vectorized=options.vectorized,
+        energy_readings=options.unit in ENERGY_UNITS,
+    )
+
+
+def _analyze_fleet_file(path: Path, options: FleetOptions) -> TariffResult | str:
+    """Calculates the tariff of one meter of a fleet, or returns why its file
+    could not be read, so one bad file does not end the run"""
+    try:
+        return analyze_file(path, options)
+    except (OSError, EOFError, ValueError, csv.Error) as err:
+        return str(err) or type(err).__name__
+
+
+def fleet_files(directory: Path) -> list[Path]:
+    """Returns the reading files of a directory, one per meter"""
+    return sorted(
+        path
+        for path in directory.iterdir()
+        if path.is_file() and path.suffix in (".csv", ".npy")
+    )
+
+
+FLEET_COLUMNS = (
+    "meter",
+    "month",
+    "energy_kwh",
+    "peak_1_kwh",
+    "peak_2_kwh",
+    "peak_3_kwh",
+    "average_kwh",
+    "level",
+    "threshold_kwh",
+    "cost",
+)
+
+
+def _fleet_rows(meter: str, result: TariffResult) -> Iterator[tuple]:
+    for month in result.months:
+        peaks = sorted((hour.energy for hour in month.top_three), reverse=True)
+        peaks += [None] * (3 - len(peaks))
+        yield (
+            meter,
+            f"{month.year}-{month.month:02d}",
+            _number(month.energy),
+            *(_number(peak) for peak in peaks[:3]),
+            _number(month.average),
+            month.level_name or "",
+            _number(month.level_threshold),
+            _number(month.price),
+        )
+
+
+def _number(value: float | None) -> str:
+    return "" if value is None else f"{value:.3f}"
+
+
+def analyze_fleet(
+    paths: Iterable[Path],
+    options: FleetOptions,
+    out: IO[str],
+    workers: int | None = None,
+    errors: IO[str] | None = None,
+) -> int:
+    """Calculates the tariff of each file in a process pool and writes a CSV
+    table with a row per meter and month, in the order of paths.
+
+    Each worker reads its file in chunks, and only the monthly results are
+    sent back, so memory use depends on the number of workers and not on the
+    size of the files.  The meter is the file name without suffix.  Meters
+    whose file cannot be read are left out of the table and reported to
+    errors, standard error by default.  Returns the number of meters in the
+    table."""
+    paths = list(paths)
+    writer = csv.writer(out)
+    writer.writerow(FLEET_COLUMNS)
+    if not paths:
+        return 0
+    if errors is None:
+        errors = sys.stderr
+    done = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(_analyze_fleet_file, paths, itertools.repeat(options))
+        for path, result in zip(paths, results):
+            if isinstance(result, str):
+                errors.write(f"{path.stem}: {result}\n")
+                continue
+            writer.writerows(_fleet_rows(path.stem, result))
+            done += 1
+    return done
+
+
+def _format_month(month: MonthResult) -> str:
+    peaks = ", ".join(f"{hour.energy:.2f}" for hour in month.top_three)
+    average = "" if month.average is None else f"{month.average:.2f}"
+    price = "" if month.price is None else f"{month.price:g}"
+    return (
+        f"{month.year}-{month.month:02d}  {month.energy:12.2f}  {peaks:<20}"
+        f"  {average:>7}  {month.level_name or '':<12}  {price:>8}"
+    )
+
+
+def print_summary(result: TariffResult, out: IO[str]) -> None:
+    """Writes a table with a line per month"""
+    out.write(
+        f"{'Month':<7}  {'Energy kWh':>12}  {'Peak hours kWh':<20}"
+        f"  {'Average':>7}  {'Level':<12}  {'Price':>8}\n"
+    )
+    for month in result.months:
+        out.write(_format_month(month) + "\n")
+    out.write(f"{result.hours} hours\n")
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m custom_components.energytariff.cli",
+        description="Hourly energy, monthly peaks, levels and prices "
+        "from meter readings",
+    )
+    parser.add_argument(
+        "readings",
+        type=Path,
+        help="CSV or .npy file of readings, or a directory with a file per meter",
+    )
+    parser.add_argument(
+        "--time-zone", required=True, help="time zone of local hours, e.g. Europe/Oslo"
+    )
+    parser.add_argument("--config", type=Path, help="JSON or YAML file with levels")
+    parser.add_argument(
+        "--price",
+        type=_level_price,
+        action="append",
+        default=[],
+        metavar="NAME=PRICE",
+        help="price of a level, for levels with a template price",
+    )
+    parser.add_argument("--hours", type=Path, help="write hourly energy to CSV file")
+    parser.add_argument(
+        "--summary", type=Path, help="write the table of a directory to CSV file"
+    )
+    parser.add_argument(
+        "--unit",
+        choices=tuple(UNITS),
+        default="W",
+        help="unit of readings, kWh and Wh for energy used per hour",
+    )
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument(
+        "--workers", type=int, help="processes for a directory, default one per CPU"
+    )
+    parser.add_argument(
+        "--no-numpy", action="store_true", help="integrate one reading at a time"
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        levels = load_levels(args.config, dict(args.price)) if args.config else None
+    except ValueError as err:
+        parser.error(str(err))
+    options = FleetOptions(
+        ZoneInfo(args.time_zone),
+        levels,
+        args.unit,
+        args.chunk_size,
+        np is not None and not args.no_numpy,
+    )
+
+    if args.readings.is_dir():
+        with (
+            open(args.summary, "w", newline="", encoding="utf-8")
+            if args.summary
+            else contextlib.nullcontext(sys.stdout) as out,
+        ):
+            paths = fleet_files(args.readings)
+            done = analyze_fleet(paths, options, out, args.workers)
+        # Results of the other meters are written, but the run failed
+        return 0 if done == len(paths) else 1
+
+    with (
+        open(args.hours, "w", newline="", encoding="utf-8")
+        if args.hours
+        else contextlib.nullcontext() as hours_out,
+    ):
+        result = run(
+            read_file(
+                args.readings, options.time_zone, UNITS[args.unit], args.chunk_size
+            ),
+            options.time_zone,
+            options.levels,
+            hours_out,
+            options.vectorized,
+            args.unit in ENERGY_UNITS,
+        )
+    print_summary(result, sys.stdout)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,190 @@
+"""Clocks of energytariff coordinators."""
+
+from __future__ import annotations
+
+import heapq
+import itertools
+import time
+from collections.abc import Callable
+
+from homeassistant.const import EVENT_HOMEASSISTANT_STOP
+from homeassistant.core import CALLBACK_TYPE, Event, HomeAssistant, callback
+from homeassistant.helpers.event import (
+    async_call_later,
+    async_track_point_in_utc_time,
+)
+from homeassistant.util import dt
+
+from .const import DOMAIN_DATA
+from .engine import LocalHour
+from .utils import LOCAL_HOURS
+
+# Key of the shared HourClock in hass.data[DOMAIN_DATA]
+HOUR_CLOCK = "hour_clock"
+
+
+class HourClock:
+    """Calls listeners with each local hour when it ends.
+
+    One timer serves all coordinators of a Home Assistant instance, so the
+    number of timers does not grow with the number of meters.  The timer runs
+    while there are listeners, until Home Assistant stops.
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        self._hass = hass
+        self._listeners: tuple[Callable[[LocalHour], None], ...] = ()
+        self._hour: LocalHour | None = None
+        self._unsub_timer: CALLBACK_TYPE | None = None
+
+    def subscribe(self, listener: Callable[[LocalHour], None]) -> CALLBACK_TYPE:
+        """Add a listener, returns a function that removes it"""
+        if not self._listeners:
+            self._schedule()
+        self._listeners = (*self._listeners, listener)
+
+        @callback
+        def _unsubscribe() -> None:
+            self._listeners = tuple(
+                item for item in self._listeners if item is not listener
+            )
+            if not self._listeners and self._unsub_timer is not None:
+                self._unsub_timer()
+                self._unsub_timer = None
+
+        return _unsubscribe
+
+    def _schedule(self) -> None:
+        self._hour = LOCAL_HOURS.hour_at(time.time())
+        self._unsub_timer = async_track_point_in_utc_time(
+            self._hass, self._async_hour_end, dt.utc_from_timestamp(self._hour.end)
+        )
+
+    @callback
+    def _async_hour_end(self, _) -> None:
+        self._unsub_timer = None
+        for listener in self._listeners:
+            listener(self._hour)
+        if self._listeners:
+            self._schedule()
+
+    @callback
+    def async_stop(self, _event: Event | None = None) -> None:
+        """Stop the timer, hours are not closed while Home Assistant stops"""
+        self._listeners = ()
+        if self._unsub_timer is not None:
+            self._unsub_timer()
+            self._unsub_timer = None
+
+
+def hour_clock(hass: HomeAssistant) -> HourClock:
+    """Returns the hour clock shared by all coordinators"""
+    domain_data = hass.data.setdefault(DOMAIN_DATA, {})
+    clock = domain_data.get(HOUR_CLOCK)
+    if clock is None:
+        clock = domain_data[HOUR_CLOCK] = HourClock(hass)
+        hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, clock.async_stop)
+    return clock
+
+
+class Clock:
+    """Time source of a coordinator and its sensors.
+
+    Everything that depends on the current time, rather than on the time of a
+    meter update, asks the clock of its coordinator.  This one follows the
+    system clock and the shared hour clock of Home Assistant.
+    """
+
+    def time(self) -> float:
+        """Return the current time in epoch seconds"""
+        return time.time()
+
+    def monotonic(self) -> float:
+        """Return seconds for measuring intervals, such as between writes"""
+        return time.monotonic()
+
+    def track_hours(
+        self, hass: HomeAssistant, listener: Callable[[LocalHour], None]
+    ) -> CALLBACK_TYPE:
+        """Call listener with each local hour when it ends, returns a function
+        that stops it"""
+        return hour_clock(hass).subscribe(listener)
+
+    def call_later(
+        self, hass: HomeAssistant, delay: float, action: Callable[[], None]
+    ) -> CALLBACK_TYPE:
+        """Call action after delay seconds, returns a function that cancels it"""
+
+        @callback
+        def _run(_now) -> None:
+            action()
+
+        return async_call_later(hass, delay, _run)
+
+
+class ReplayClock(Clock):
+    """Clock that is moved forward by its owner, for replaying recorded meter
+    updates faster than real time.
+
+    Hours end and actions of call_later run when the clock is moved past
+    them, in order and before advance returns, so replays do not depend on
+    timers.
+    """
+
+    def __init__(self, start: float) -> None:
+        self._now = start
+        self._listeners: tuple[Callable[[LocalHour], None], ...] = ()
+        # Pending actions as (due, order, action), action is None if cancelled
+        self._timers: list[list] = []
+        self._order = itertools.count()
+
+    def time(self) -> float:
+        return self._now
+
+    def monotonic(self) -> float:
+        return self._now
+
+    def track_hours(
+        self, hass: HomeAssistant, listener: Callable[[LocalHour], None]
+    ) -> CALLBACK_TYPE:
+        self._listeners = (*self._listeners, listener)
+
+        @callback
+        def _unsubscribe() -> None:
+            self._listeners = tuple(
+                item for item in self._listeners if item is not listener
+            )
+
+        return _unsubscribe
+
+    def call_later(
+        self, hass: HomeAssistant, delay: float, action: Callable[[], None]
+    ) -> CALLBACK_TYPE:
+        timer = [self._now + delay, next(self._order), action]
+        heapq.heappush(self._timers, timer)
+
+        @callback
+        def _cancel() -> None:
+            timer[2] = None
+
+        return _cancel
+
+    def advance(self, timestamp: float) -> None:
+        """Move the clock to timestamp, ending the hours that end and running
+        the actions that are due on the way.  The clock does not go back."""
+        hour = LOCAL_HOURS.hour_at(self._now)
+        timers = self._timers
+        while True:
+            if timers and timers[0][0] <= min(hour.end, timestamp):
+                due, _, action = heapq.heappop(timers)
+                self._now = max(self._now, due)
+                if action is not None:
+                    action()
+            elif hour.end <= timestamp:
+                self._now = hour.end
+                for listener in self._listeners:
+                    listener(hour)
+                hour = LOCAL_HOURS.hour_at(hour.end)
+            else:
+                break
+        self._now = max(self._now, timestamp)
@@ -11,6 +11,7 @@ ISSUE_URL = "https://github.com/epaulsen/grid-cap-watcher/issues"
 ICON = "mdi:lightning-bolt"
 
 SENSOR = "sensor"
+BINARY_SENSOR = "binary_sensor"
 SWITCH = "switch"
 PLATFORMS = [SENSOR]
 
@@ -31,8 +32,35 @@ LEVEL_PRICE = "price"
 ROUNDING_PRECISION = "precision"
 PEAK_HOUR = "peak_hour"
 TARGET_ENERGY = "target_energy"
+PUBLISH_INTERVAL = "publish_interval"
+BACKFILL = "backfill"
+HOUR_STATISTICS = "hour_statistics"
+ALARMS = "alarms"
+HYSTERESIS = "hysteresis"
+LEAD_TIME = "lead_time"
+DIAGNOSTICS = "diagnostics"
+
+# Keys used to configure publish_interval per sensor
+SENSOR_ENERGY = "energy"
+SENSOR_ESTIMATE = "estimate"
+SENSOR_AVAILABLE_POWER = "available_power"
+SENSOR_THRESHOLD = "threshold"
+SENSOR_AVERAGE = "average"
+SENSOR_LEVEL_NAME = "level_name"
+SENSOR_LEVEL_PRICE = "level_price"
+SENSOR_KEYS = [
+    SENSOR_ENERGY,
+    SENSOR_ESTIMATE,
+    SENSOR_AVAILABLE_POWER,
+    SENSOR_THRESHOLD,
+    SENSOR_AVERAGE,
+    SENSOR_LEVEL_NAME,
+    SENSOR_LEVEL_PRICE,
+]
 
 RESET_TOP_THREE = "energytariff_reset_top_three_hours"
+EVENT_HOUR_CLOSED = "energytariff_hour_closed"
+EVENT_MONTH_CLOSED = "energytariff_month_closed"
 
 # Numeric constants
 SECONDS_PER_HOUR = 3600
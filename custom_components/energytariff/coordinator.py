@@ -1,44 +1,646 @@
+from __future__ import annotations
+
+import asyncio
 import datetime
-from typing import Any
+import time
+from collections.abc import Callable
+from logging import getLogger
+from typing import TYPE_CHECKING, Any, Generic, NamedTuple, TypeVar
 
-from reactivex.subject import BehaviorSubject
+from homeassistant.components.sensor import SensorExtraStoredData
+from homeassistant.const import STATE_UNAVAILABLE, STATE_UNKNOWN
 from homeassistant.core import (
+    CALLBACK_TYPE,
+    Event,
     HomeAssistant,
+    State,
+    callback,
+)
+from homeassistant.helpers import entity_registry as er
+from homeassistant.helpers import restore_state
+from homeassistant.util import dt
+
+from .clock import Clock
+from .const import (
+    BACKFILL,
+    CONF_EFFECT_ENTITY,
+    DIAGNOSTICS,
+    DOMAIN,
+    DOMAIN_DATA,
+    EVENT_HOUR_CLOSED,
+    EVENT_MONTH_CLOSED,
+    GRID_LEVELS,
+    HOUR_STATISTICS,
+    RESET_TOP_THREE,
+    SENSOR_AVAILABLE_POWER,
+    SENSOR_AVERAGE,
+    SENSOR_ENERGY,
+    SENSOR_LEVEL_NAME,
+    SENSOR_LEVEL_PRICE,
+    SENSOR_THRESHOLD,
 )
+from .engine import LocalHour, PeakData, PeakTracker, TopHour
+from .levels import Level, LevelTable
+from .store import MONTH_PEAKS, PeakStore
+from .utils import LOCAL_HOURS
+
+if TYPE_CHECKING:
+    from .hour_statistics import HourStatistics
+    from .metrics import InstanceMetrics
+    from .publisher import StatePublisher
+
+_LOGGER = getLogger(__name__)
+
+_DataT = TypeVar("_DataT")
+
+# Key of the coordinators by meter entity id in hass.data[DOMAIN_DATA]
+COORDINATORS = "coordinators"
 
 
 class EnergyData:
-    """Class used to transmit sensor notification via rx"""
+    """Class used to transmit meter updates to sensors.
+    One instance is created per meter event and shared by all listeners,
+    which must treat it as read-only"""
+
+    __slots__ = ("energy_consumed", "current_effect", "epoch", "_timestamp", "_hour")
 
-    def __init__(self, energy: float, effect: float, timestamp: datetime.datetime):
+    def __init__(
+        self,
+        energy: float,
+        effect: float,
+        timestamp: datetime.datetime | None = None,
+        epoch: float | None = None,
+        hour: LocalHour | None = None,
+    ):
         self.energy_consumed = energy
         self.current_effect = effect
-        self.timestamp = timestamp
-
+        if epoch is None and timestamp is not None:
+            epoch = timestamp.timestamp()
+        self.epoch = epoch
+        self._timestamp = timestamp
+        self._hour = hour
 
-class TopHour:
-    """Holds data for an hour of consumption"""
+    @property
+    def timestamp(self) -> datetime.datetime:
+        """Time of the update as a datetime, created on first use"""
+        if self._timestamp is None:
+            self._timestamp = dt.utc_from_timestamp(self.epoch)
+        return self._timestamp
 
-    def __init__(self, day: int, hour: int, energy: float):
-        self.day = day
-        self.hour = hour
-        self.energy = energy
+    @property
+    def hour(self) -> LocalHour:
+        """Local hour of the update, looked up once and shared by all listeners"""
+        if self._hour is None:
+            self._hour = LOCAL_HOURS.hour_at(self.epoch)
+        return self._hour
 
 
 class GridThresholdData:
-    """Class used to transmit changes of level threshold changes"""
+    """Class used to transmit changes of level threshold changes.
+    top_three is an immutable snapshot, taken when the level, price or the
+    set of peak hours last changed"""
 
-    def __init__(self, name, level: float, price: float, top_three: Any):
+    __slots__ = ("name", "level", "price", "top_three")
+
+    def __init__(
+        self, name, level: float, price: float, top_three: tuple[TopHour, ...]
+    ):
         self.name = name
         self.level = level
         self.price = price
         self.top_three = top_three
 
 
+class ClosedHour(NamedTuple):
+    """Final energy of an hour, with the peaks of its month when it closed"""
+
+    hour: LocalHour
+    energy: float
+    # The hour is one of the peak hours of the month
+    peak: bool
+    average: float | None
+    level: Level | None
+
+
+class EmissionCounters:
+    """Counts values published on a signal and values suppressed as unchanged"""
+
+    __slots__ = ("emitted", "suppressed")
+
+    def __init__(self) -> None:
+        self.emitted = 0
+        self.suppressed = 0
+
+
+class ReplaySignal(Generic[_DataT]):
+    """In-process notification channel between sensors.
+
+    Listeners are called synchronously, in subscription order.  The last
+    published value is replayed to new listeners when they subscribe.
+    """
+
+    __slots__ = ("_listeners", "value")
+
+    def __init__(self) -> None:
+        # Replaced rather than mutated, so publish can iterate it safely
+        # while listeners subscribe or unsubscribe.
+        self._listeners: tuple[Callable[[_DataT], None], ...] = ()
+        self.value: _DataT | None = None
+
+    def publish(self, value: _DataT) -> None:
+        """Store value and notify all listeners"""
+        self.value = value
+        for listener in self._listeners:
+            listener(value)
+
+    def subscribe(self, listener: Callable[[_DataT], None]) -> CALLBACK_TYPE:
+        """Add a listener and replay the last value to it.
+        Returns a function that removes the listener, usable with async_on_remove"""
+        self._listeners = (*self._listeners, listener)
+        if self.value is not None:
+            listener(self.value)
+
+        def _unsubscribe() -> None:
+            self._listeners = tuple(
+                item for item in self._listeners if item is not listener
+            )
+
+        return _unsubscribe
+
+
+def _restore_top_three(savedstate: State, current_month: int) -> list[dict[str, Any]]:
+    """Return top_three from saved HA state, filtered to current month only.
+
+    Entries without a month were saved by versions before 0.3.2 and are taken
+    to be from the current month."""
+    if "top_three" not in savedstate.attributes:
+        return []
+    restored = []
+    for item in savedstate.attributes["top_three"]:
+        item_month = int(item.get("month", current_month))
+        if item_month != current_month:
+            continue
+        restored.append(
+            {
+                "month": int(item_month),
+                "day": item["day"],
+                "hour": item["hour"],
+                "energy": item["energy"],
+            }
+        )
+    return restored
+
+
+def _restored_number(savedstate: State | None) -> float | None:
+    if savedstate is None or savedstate.state in (STATE_UNKNOWN, STATE_UNAVAILABLE):
+        return None
+    try:
+        return float(savedstate.state)
+    except ValueError:
+        return None
+
+
+def _level_data(average: float | None, level: Level | None) -> dict[str, Any]:
+    """Average of the peak hours and level, as in event data"""
+    return {
+        "average": None if average is None else round(average, 3),
+        "level": None if level is None else level.name,
+        "threshold": None if level is None else level.threshold,
+    }
+
+
+class RestoredState:
+    """Saved state of all sensors of an instance, keyed by sensor key.
+
+    Read by the coordinator in one pass before any sensor is added, so the
+    sensors start from the same snapshot.  Values are validated here, each
+    sensor takes its part as is.  native_values holds the unrounded values
+    of RestoreSensor extra data, now is the time of the restore and defaults
+    to the system clock.  saved_at holds the times the extra data was saved,
+    which can be later than the last state write of a sensor whose writes
+    are held back; the last write is used where it is missing.
+    """
+
+    def __init__(
+        self,
+        states: dict[str, State] | None = None,
+        native_values: dict[str, Any] | None = None,
+        now: float | None = None,
+        saved_at: dict[str, float] | None = None,
+    ):
+        states = states or {}
+        native_values = native_values or {}
+        saved_at = saved_at or {}
+        hour = LOCAL_HOURS.hour_at(time.time() if now is None else now)
+
+        # Energy of the current hour, if it was saved within the hour
+        self.hour_energy: float | None = None
+        # Energy of the hour of the last save and the time of the save, the
+        # energy sensor reads the time after it from the recorder
+        self.saved_energy: float | None = None
+        self.energy_saved_at: float | None = None
+        energy = states.get(SENSOR_ENERGY)
+        energy_value = native_values.get(SENSOR_ENERGY)
+        energy_saved_at = None
+        if energy is not None:
+            energy_saved_at = saved_at.get(SENSOR_ENERGY, energy.last_updated_timestamp)
+        if energy_value is not None and (
+            energy_saved_at is None or energy_saved_at >= hour.start
+        ):
+            self.hour_energy = float(energy_value)
+        if energy_value is not None and energy_saved_at is not None:
+            self.saved_energy = float(energy_value)
+            self.energy_saved_at = energy_saved_at
+
+        self.threshold = _restored_number(states.get(SENSOR_THRESHOLD))
+        self.average = _restored_number(states.get(SENSOR_AVERAGE))
+        self.level_price = _restored_number(states.get(SENSOR_LEVEL_PRICE))
+        level_name = states.get(SENSOR_LEVEL_NAME)
+        self.level_name: str | None = None
+        if level_name is not None and level_name.state not in (
+            STATE_UNKNOWN,
+            STATE_UNAVAILABLE,
+        ):
+            self.level_name = level_name.state
+
+        available = states.get(SENSOR_AVAILABLE_POWER)
+        self.available_power = _restored_number(available)
+        self.target_energy = (
+            available.attributes.get("grid_threshold_level") if available else None
+        )
+
+        # Peaks were kept in recorded attributes before PeakStore was added,
+        # one copy per sensor
+        self.legacy_top_three: tuple[list[dict[str, Any]], ...] = tuple(
+            top_three
+            for key in (SENSOR_THRESHOLD, SENSOR_AVERAGE)
+            if key in states
+            and (top_three := _restore_top_three(states[key], hour.month))
+        )
+
+
 class GridCapacityCoordinator:
-    """Coordinator entity that signals notifications for sensors"""
+    """Coordinator entity that signals notifications for sensors.
 
-    def __init__(self, hass: HomeAssistant):
+    Sensors of the coordinator read the current time from its clock, a
+    ReplayClock drives them through recorded meter updates."""
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        config: dict[str, Any] | None = None,
+        clock: Clock | None = None,
+    ):
         self._hass = hass
-        self.effectstate = BehaviorSubject(None)
-        self.thresholddata = BehaviorSubject(None)
+        self._config = config or {}
+        self.clock = clock or Clock()
+        self.peak_store = PeakStore(
+            hass, self._config.get(CONF_EFFECT_ENTITY), self.clock
+        )
+        self.peaks = PeakTracker()
+        self.metrics: InstanceMetrics | None = None
+        if self._config.get(DIAGNOSTICS):
+            # Listeners are only timed with diagnostics on
+            from .metrics import InstanceMetrics  # noqa: PLC0415
+
+            self.metrics = InstanceMetrics()
+        self.effectstate: ReplaySignal[EnergyData] = self._signal()
+        self.thresholddata: ReplaySignal[GridThresholdData] = self._signal()
+        self.threshold_counters = EmissionCounters()
+        self.peakdata: ReplaySignal[PeakData] = ReplaySignal()
+        self.hourclose: ReplaySignal[LocalHour] = ReplaySignal()
+        self._publishers: list[StatePublisher] = []
+        self._peaks_lock = asyncio.Lock()
+        self._peak_users = 0
+        self._peaks_from_store = False
+        self._unsub_peaks: list[CALLBACK_TYPE] = []
+        self._backfill: asyncio.Task | None = None
+        self._hour_users = 0
+        self._closed_until = 0.0
+        self._unsub_hour_clock: CALLBACK_TYPE | None = None
+        self.restored = RestoredState()
+        levels = self._config.get(GRID_LEVELS)
+        self._levels = LevelTable(levels) if levels else None
+        self.hour_statistics: HourStatistics | None = None
+        if self._config.get(HOUR_STATISTICS):
+            # Recorder statistics stay off the startup path unless enabled
+            from .hour_statistics import HourStatistics  # noqa: PLC0415
+
+            self.hour_statistics = HourStatistics(
+                hass, self._config[CONF_EFFECT_ENTITY]
+            )
+
+    def _signal(self) -> ReplaySignal:
+        if self.metrics is None:
+            return ReplaySignal()
+        return self.metrics.signal()
+
+    @property
+    def config(self) -> dict[str, Any]:
+        """Configuration of the instance"""
+        return self._config
+
+    def register_publisher(self, publisher: StatePublisher) -> CALLBACK_TYPE:
+        """Register a sensor publisher so it is flushed at hour and month boundaries"""
+        self._publishers.append(publisher)
+
+        def _unregister() -> None:
+            publisher.cancel()
+            if publisher in self._publishers:
+                self._publishers.remove(publisher)
+
+        return _unregister
+
+    def call_later(self, delay: float, action: Callable[[], None]) -> CALLBACK_TYPE:
+        """Call action after delay seconds by the clock, returns a function
+        that cancels it.  Used by publishers to flush held back values"""
+        return self.clock.call_later(self._hass, delay, action)
+
+    def flush_publishers(self) -> None:
+        """Write all pending sensor values, called before hourly and monthly resets"""
+        for publisher in list(self._publishers):
+            publisher.flush()
+
+    @callback
+    def track_hours(self) -> CALLBACK_TYPE:
+        """Close hours and months when they end by the clock.
+
+        The hour clock is followed while there are users, the returned function
+        ends the use of the caller.  Hours are usually closed earlier, by the
+        meter update that crosses the end of the hour, the clock covers a
+        silent meter."""
+        if self._hour_users == 0:
+            self._unsub_hour_clock = self.clock.track_hours(self._hass, self.close_hour)
+        self._hour_users += 1
+
+        released = False
+
+        @callback
+        def _release() -> None:
+            nonlocal released
+            if released:
+                return
+            released = True
+            self._hour_users -= 1
+            if self._hour_users == 0 and self._unsub_hour_clock is not None:
+                self._unsub_hour_clock()
+                self._unsub_hour_clock = None
+
+        return _release
+
+    def close_hour(self, hour: LocalHour) -> None:
+        """Close an hour and, at the end of a month, the month.
+
+        Listeners of hourclose finish the hour first, then pending sensor values
+        are written, so the final value of each hour is recorded.  An hour is
+        closed once, further calls for it or earlier hours are ignored."""
+        if hour.end <= self._closed_until:
+            return
+        self._closed_until = hour.end
+        self.hourclose.publish(hour)
+        self.flush_publishers()
+        next_hour = LOCAL_HOURS.hour_at(hour.end)
+        if next_hour.month != hour.month:
+            self._close_month(next_hour)
+
+    def record_hour(self, hour: LocalHour, energy: float) -> None:
+        """Publish the final energy of an hour, with whether it is a peak hour
+        of the month and the level of the month.
+
+        Fires the hour closed event, and writes the hour to the hour
+        statistics if they are enabled."""
+        peaks = self.peaks
+        in_month = (hour.year, hour.month) == (peaks.year, peaks.month)
+        peak = in_month and any(
+            item["day"] == hour.day and item["hour"] == hour.hour
+            for item in peaks.top_three
+        )
+        average = peaks.data.average if in_month else None
+        closed = ClosedHour(hour, energy, peak, average, self._level(average))
+        self._hass.bus.async_fire(
+            EVENT_HOUR_CLOSED,
+            {
+                "entity_id": self._config.get(CONF_EFFECT_ENTITY),
+                "start": hour.isoformat(),
+                "energy": round(energy, 3),
+                "peak": peak,
+                **_level_data(average, closed.level),
+            },
+        )
+        if self.hour_statistics is not None:
+            self.hour_statistics.add(closed)
+
+    def _level(self, average: float | None) -> Level | None:
+        if self._levels is None or average is None:
+            return None
+        index = self._levels.find(average)
+        return None if index is None else self._levels.levels[index]
+
+    def _close_month(self, next_hour: LocalHour) -> None:
+        """Clears peaks so that we don't carry over old values to new month"""
+        # Meter updates from the new month may already have started it
+        if self._peak_users and (self.peaks.year, self.peaks.month) < (
+            next_hour.year,
+            next_hour.month,
+        ):
+            self._fire_month_closed()
+            self._reset_peaks(next_hour.year, next_hour.month)
+
+    def _fire_month_closed(self) -> None:
+        """Fire the month closed event with the committed peaks of the month"""
+        data = self.peaks.data
+        self._hass.bus.async_fire(
+            EVENT_MONTH_CLOSED,
+            {
+                "entity_id": self._config.get(CONF_EFFECT_ENTITY),
+                "year": self.peaks.year,
+                "month": self.peaks.month,
+                "peaks": [
+                    {
+                        "day": peak.day,
+                        "hour": peak.hour,
+                        "energy": round(peak.energy, 3),
+                    }
+                    for peak in sorted(data.top_three, key=lambda peak: peak.day)
+                ],
+                **_level_data(data.average, self._level(data.average)),
+            },
+        )
+
+    async def async_restore(self, unique_ids: dict[str, str]) -> None:
+        """Read the saved state of all sensors of the instance, and stored peaks.
+
+        unique_ids maps sensor keys to the unique ids of the sensors.  Called
+        before the sensors are added, which take their part from restored."""
+        registry = er.async_get(self._hass)
+        last_states = restore_state.async_get(self._hass).last_states
+        states: dict[str, State] = {}
+        native_values: dict[str, Any] = {}
+        saved_at: dict[str, float] = {}
+        for key, unique_id in unique_ids.items():
+            entity_id = registry.async_get_entity_id("sensor", DOMAIN, unique_id)
+            stored = last_states.get(entity_id) if entity_id else None
+            if stored is None:
+                continue
+            states[key] = stored.state
+            # The extra data is the value at the time of the dump, not of
+            # the last state write
+            saved_at[key] = stored.last_seen.timestamp()
+            if stored.extra_data is not None:
+                data = SensorExtraStoredData.from_dict(stored.extra_data.as_dict())
+                if data is not None:
+                    native_values[key] = data.native_value
+        self.restored = RestoredState(
+            states, native_values, self.clock.time(), saved_at
+        )
+        await self.peak_store.async_load()
+
+    async def async_track_peaks(self) -> CALLBACK_TYPE:
+        """Restore monthly peaks and track them from meter updates.
+
+        Peaks are tracked while at least one sensor uses them, the returned
+        function ends the use of the calling sensor.  Peaks kept in sensor
+        attributes by earlier versions are used when nothing has been stored."""
+        async with self._peaks_lock:
+            if self._peak_users == 0:
+                await self._async_restore_peaks()
+                if not self._peaks_from_store:
+                    # Sensors may hold different copies, the highest hour of
+                    # each day wins
+                    changed = False
+                    for top_three in self.restored.legacy_top_three:
+                        changed = self.peaks.merge(top_three) or changed
+                    if changed:
+                        self._peaks_changed()
+                # Restored peaks are in place before the first meter update arrives
+                self._unsub_peaks = [
+                    self.effectstate.subscribe(self._meter_update),
+                    self._hass.bus.async_listen(
+                        RESET_TOP_THREE, self._handle_reset_event
+                    ),
+                    self.track_hours(),
+                ]
+                if self._config.get(BACKFILL):
+                    # Sensors are not held up by the recorder
+                    self._backfill = self._hass.async_create_background_task(
+                        self._async_backfill(),
+                        f"{DOMAIN} backfill {self._config[CONF_EFFECT_ENTITY]}",
+                    )
+            self._peak_users += 1
+
+        released = False
+
+        @callback
+        def _release() -> None:
+            nonlocal released
+            if released:
+                return
+            released = True
+            self._peak_users -= 1
+            if self._peak_users == 0:
+                self._stop_tracking_peaks()
+
+        return _release
+
+    async def _async_restore_peaks(self) -> None:
+        stored = await self.peak_store.async_get_top_three(MONTH_PEAKS)
+        if stored is None:
+            # Stored by versions that kept a copy of the peaks per sensor
+            for key in (SENSOR_AVERAGE, SENSOR_THRESHOLD):
+                stored = await self.peak_store.async_get_top_three(key)
+                if stored is not None:
+                    break
+        self._peaks_from_store = stored is not None
+        now = LOCAL_HOURS.hour_at(self.clock.time())
+        self.peaks.restore(stored or [], now.year, now.month)
+        self.peakdata.publish(self.peaks.data)
+
+    async def _async_backfill(self) -> None:
+        """Seed the peaks of the month from the history of the meter.
+
+        Hours read from the recorder are merged with the restored and live
+        peaks, the highest hour of each day wins."""
+        # Recorder helpers stay off the startup path until a read is needed
+        from .backfill import async_read_month_hours  # noqa: PLC0415
+
+        self.add_hours(
+            await async_read_month_hours(
+                self._hass, self._config[CONF_EFFECT_ENTITY], self.clock.time()
+            )
+        )
+
+    async def async_read_hours(
+        self, start: float, end: float
+    ) -> list[tuple[LocalHour, float]]:
+        """Read the energy used in each hour from start to end from the
+        recorder, see backfill.async_read_hours"""
+        # Recorder helpers stay off the startup path until a read is needed
+        from .backfill import async_read_hours  # noqa: PLC0415
+
+        return await async_read_hours(
+            self._hass, self._config[CONF_EFFECT_ENTITY], start, end
+        )
+
+    def add_hours(self, hours: list[tuple[LocalHour, float]]) -> None:
+        """Add the energy of whole hours of the tracked month to the peaks,
+        such as hours read back from the recorder"""
+        if not self._peak_users:
+            return
+        peaks = self.peaks
+        changed = False
+        for hour, energy in hours:
+            if (hour.year, hour.month) == (peaks.year, peaks.month):
+                changed = peaks.add(hour, energy) or changed
+        if changed:
+            self._peaks_changed()
+
+    def _stop_tracking_peaks(self) -> None:
+        for unsub in self._unsub_peaks:
+            unsub()
+        self._unsub_peaks = []
+        if self._backfill is not None:
+            self._backfill.cancel()
+            self._backfill = None
+
+    @callback
+    def _meter_update(self, state: EnergyData) -> None:
+        if self.peaks.update(state):
+            self._peaks_changed()
+
+    def _peaks_changed(self) -> None:
+        peaks = self.peaks
+        self.peak_store.async_set_top_three(
+            MONTH_PEAKS, peaks.top_three, peaks.year, peaks.month
+        )
+        self.peakdata.publish(peaks.data)
+
+    def _reset_peaks(self, year: int, month: int) -> None:
+        # Write the final values of the ending month before peaks are cleared
+        self.flush_publishers()
+        self.peaks.reset(year, month)
+        self._peaks_changed()
+        _LOGGER.debug("Monthly reset")
+
+    @callback
+    def _handle_reset_event(self, _: Event) -> None:
+        """Handle reset event to reset top three hours"""
+        now = LOCAL_HOURS.hour_at(self.clock.time())
+        self._reset_peaks(now.year, now.month)
+
+
+@callback
+def async_register_coordinator(
+    hass: HomeAssistant, coordinator: GridCapacityCoordinator
+) -> None:
+    """Make an instance available to the platforms and commands that find it
+    by its meter"""
+    coordinators = hass.data.setdefault(DOMAIN_DATA, {}).setdefault(COORDINATORS, {})
+    coordinators[coordinator.config[CONF_EFFECT_ENTITY]] = coordinator
+
+
+@callback
+def async_get_coordinator(
+    hass: HomeAssistant, meter_entity_id: str
+) -> GridCapacityCoordinator | None:
+    """Returns the instance of a meter, if it is set up"""
+    return hass.data.get(DOMAIN_DATA, {}).get(COORDINATORS, {}).get(meter_entity_id)
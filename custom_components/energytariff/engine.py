@@ -0,0 +1,578 @@
+"""Tariff calculations of energytariff, without Home Assistant.
+
+Local hours, energy of an hour from meter power, the estimate and available
+power of an hour, and monthly peaks.  The sensors wrap these, and they can
+be used on their own to process meter exports offline, see cli.py.  Only
+the standard library is used, except by hour_energies_numpy.
+"""
+
+from __future__ import annotations
+
+from bisect import bisect_right
+from calendar import timegm
+from collections.abc import Callable, Iterable, Iterator
+from datetime import datetime, tzinfo
+from typing import Any, NamedTuple, Protocol
+
+from .const import SECONDS_PER_HOUR, WATTS_PER_KW
+
+# Watt seconds in a kWh
+WATT_SECONDS_PER_KWH = SECONDS_PER_HOUR * WATTS_PER_KW
+
+
+class LocalHour(NamedTuple):
+    """A local clock hour.  start and end are epoch seconds, end is exclusive"""
+
+    start: float
+    end: float
+    year: int
+    month: int
+    day: int
+    hour: int
+
+    def isoformat(self) -> str:
+        """Start of the hour in ISO 8601 with its UTC offset, without a time
+        zone lookup"""
+        local = timegm((self.year, self.month, self.day, self.hour, 0, 0))
+        offset = round(local - self.start) // 60
+        sign = "-" if offset < 0 else "+"
+        hours, minutes = divmod(abs(offset), 60)
+        return (
+            f"{self.year:04d}-{self.month:02d}-{self.day:02d}T{self.hour:02d}:00:00"
+            f"{sign}{hours:02d}:{minutes:02d}"
+        )
+
+
+# Step used to find hour boundaries, all UTC offsets in use are whole quarters
+_BOUNDARY_STEP = 900
+
+
+class HourTable:
+    """Local hour and day boundaries of a month, as epoch seconds.
+
+    Built once per month by walking the month hour by hour, in quarter hour
+    steps around a change of UTC offset, so days with a daylight saving time
+    change get 23 or 25 hours.  When clocks are
+    turned back the repeated hour is a separate entry with the same hour number.
+    """
+
+    __slots__ = ("year", "month", "start", "end", "hours", "day_starts", "_starts")
+
+    def __init__(self, year: int, month: int, time_zone: tzinfo):
+        self.year = year
+        self.month = month
+        first = datetime(year, month, 1, tzinfo=time_zone).timestamp()
+        last = datetime(
+            year + month // 12, month % 12 + 1, 1, tzinfo=time_zone
+        ).timestamp()
+
+        # Start a few hours early, midnight may not exist in all time zones
+        timestamp = float(int(first // _BOUNDARY_STEP - 12) * _BOUNDARY_STEP)
+        local = datetime.fromtimestamp(timestamp, time_zone)
+        offset = local.utcoffset()
+        bounds: list[tuple[float, int, int, int, int]] = []
+        label = None
+        while timestamp < last + 3 * 3600:
+            current = (local.year, local.month, local.day, local.hour, offset)
+            if current != label:
+                label = current
+                bounds.append(
+                    (timestamp, local.year, local.month, local.day, local.hour)
+                )
+            # Go to the start of the next local hour, or in quarter hour steps
+            # through an hour where the UTC offset changes
+            step = 3600 - (timestamp + offset.total_seconds()) % 3600
+            following = datetime.fromtimestamp(timestamp + step, time_zone)
+            following_offset = following.utcoffset()
+            if step > _BOUNDARY_STEP and following_offset != offset:
+                step = _BOUNDARY_STEP
+                following = datetime.fromtimestamp(timestamp + step, time_zone)
+                following_offset = following.utcoffset()
+            timestamp += step
+            local = following
+            offset = following_offset
+
+        hours: list[LocalHour] = []
+        day_starts = [0.0] * 33
+        for index, (start, year_, month_, day, hour) in enumerate(bounds):
+            if (year_, month_) != (year, month) or index + 1 == len(bounds):
+                continue
+            if not hours or hours[-1].day != day:
+                day_starts[day] = start
+            hours.append(LocalHour(start, bounds[index + 1][0], year, month, day, hour))
+
+        self.hours: tuple[LocalHour, ...] = tuple(hours)
+        self.start = hours[0].start
+        self.end = hours[-1].end
+        day_starts[hours[-1].day + 1] = self.end
+        # Indexed by day of month, the entry after the last day is the end of month
+        self.day_starts = tuple(day_starts[: hours[-1].day + 2])
+        self._starts = tuple(hour.start for hour in hours)
+
+    def find(self, timestamp: float) -> LocalHour | None:
+        """Returns the local hour of timestamp, None if it is outside the month"""
+        if not self.start <= timestamp < self.end:
+            return None
+        return self.hours[bisect_right(self._starts, timestamp) - 1]
+
+
+_NO_HOUR = LocalHour(0.0, 0.0, 0, 0, 0, 0)
+# Current month, with room for late updates and replays across a month change
+_MAX_TABLES = 3
+
+
+class LocalHours:
+    """Maps epoch timestamps to local hours of a time zone.
+
+    time_zone returns the time zone to use, it is asked on every lookup so a
+    change of time zone takes effect at once.  The hour of the previous
+    lookup is kept, so for a stream of meter updates most lookups are two
+    comparisons.  Other hours of the month are found in the month's
+    HourTable, tables are built on first use and a few are kept.
+    """
+
+    __slots__ = ("_get_time_zone", "_time_zone", "_hour", "_table", "_tables")
+
+    def __init__(self, time_zone: Callable[[], tzinfo]) -> None:
+        self._get_time_zone = time_zone
+        self._time_zone: tzinfo | None = None
+        self._hour = _NO_HOUR
+        self._table: HourTable | None = None
+        self._tables: dict[tuple[int, int], HourTable] = {}
+
+    def hour_at(self, timestamp: float) -> LocalHour:
+        """Returns the local hour that timestamp belongs to"""
+        hour = self._hour
+        if (
+            hour.start <= timestamp < hour.end
+            and self._time_zone is self._get_time_zone()
+        ):
+            return hour
+        hour = self._find(timestamp)
+        self._hour = hour
+        return hour
+
+    def seconds_to_next_hour(self, timestamp: float) -> float:
+        """Returns seconds from timestamp to the start of the next local hour"""
+        return self.hour_at(timestamp).end - timestamp
+
+    def table(self, year: int, month: int) -> HourTable:
+        """Returns the hour table of a month in the current time zone"""
+        self._check_time_zone()
+        table = self._tables.get((year, month))
+        if table is None:
+            if len(self._tables) >= _MAX_TABLES:
+                # Oldest table first, in insertion order
+                del self._tables[next(iter(self._tables))]
+            table = HourTable(year, month, self._time_zone)
+            self._tables[(year, month)] = table
+        return table
+
+    def _find(self, timestamp: float) -> LocalHour:
+        self._check_time_zone()
+        table = self._table
+        hour = table.find(timestamp) if table is not None else None
+        if hour is None:
+            local = datetime.fromtimestamp(timestamp, self._time_zone)
+            table = self._table = self.table(local.year, local.month)
+            hour = table.find(timestamp)
+        return hour
+
+    def _check_time_zone(self) -> None:
+        time_zone = self._get_time_zone()
+        if time_zone is not self._time_zone:
+            self._time_zone = time_zone
+            self._hour = _NO_HOUR
+            self._table = None
+            self._tables = {}
+
+
+def estimate_hour_energy(energy: float, power: float, seconds_left: float) -> float:
+    """Returns the energy of an hour in kWh if power in W is kept for the
+    seconds left of it"""
+    return energy + power * seconds_left / WATT_SECONDS_PER_KWH
+
+
+def available_power(
+    target_energy: float,
+    energy: float,
+    power: float,
+    seconds_left: float,
+    max_power: float | None = None,
+) -> float:
+    """Returns the power in W that can be added to power for the rest of the
+    hour without using more than target_energy kWh in the hour.
+
+    The result is negative when power must be reduced.  It is limited to
+    max_power - power, and to -max_power."""
+    watt_seconds = (target_energy - energy) * WATT_SECONDS_PER_KWH
+    result = watt_seconds / max(seconds_left, 1) - power
+    if max_power is not None:
+        if max_power < result:
+            result = max_power - power
+        if result < 0 and -max_power > result:
+            # Purely cosmetic, but it messes up scale on graph
+            result = -max_power
+    return result
+
+
+class HourEnergy:
+    """Energy used in local hours, integrated from meter power.
+
+    Power is taken as constant from a meter update to the next one, intervals
+    longer than an hour are not counted.  Intervals are split where hours
+    end.  When an hour ends, on_hour_end is called with it while energy still
+    holds its total, then energy is reset and on_hour_start is called with
+    the next hour.
+    """
+
+    __slots__ = (
+        "energy",
+        "hour",
+        "counted_until",
+        "last_update",
+        "last_power",
+        "_hours",
+        "_on_hour_end",
+        "_on_hour_start",
+    )
+
+    def __init__(
+        self,
+        hours: LocalHours,
+        on_hour_end: Callable[[LocalHour], None],
+        on_hour_start: Callable[[LocalHour], None] | None = None,
+    ) -> None:
+        self._hours = hours
+        self._on_hour_end = on_hour_end
+        self._on_hour_start = on_hour_start
+        # kWh used in hour, None until the first meter update is counted
+        self.energy: float | None = None
+        self.hour: LocalHour | None = None
+        # Energy is counted up to this time, the end of the last interval or
+        # the end of the last closed hour
+        self.counted_until: float | None = None
+        self.last_update: float | None = None
+        self.last_power: float | None = None
+
+    def update(self, start: float, end: float, power: float) -> float | None:
+        """Count power in W from start to end, ending the hours on the way.
+
+        Returns the start of the part counted in the hour of end, None if the
+        interval was too long to be counted."""
+        if self.energy is None:
+            self.energy = 0.0
+        if end - start > SECONDS_PER_HOUR:
+            return None
+
+        hour = self.hour
+        if hour is None:
+            hour = self.hour = self._hours.hour_at(start)
+        # Energy before this has been counted, or belongs to a closed hour
+        start = max(start, hour.start, self.counted_until or start)
+        self.last_update = end
+        self.last_power = power
+
+        while end > hour.end:
+            if start < hour.end:
+                self._count(power, start, hour.end)
+                start = hour.end
+            self._end_hour()
+            hour = self.hour
+        if end > start:
+            self._count(power, start, end)
+        return start
+
+    def close(self, hour_end: float) -> None:
+        """End the hours that end at or before hour_end.
+
+        Used when the meter has not reported since, the last power is taken
+        as unchanged up to the end of the hour if it was reported within
+        the hour before."""
+        while self.hour is not None and self.hour.end <= hour_end:
+            end = self.hour.end
+            if (
+                self.last_power is not None
+                and self.counted_until is not None
+                and self.counted_until < end
+                and end - self.last_update <= SECONDS_PER_HOUR
+            ):
+                self._count(self.last_power, self.counted_until, end)
+            self._end_hour()
+
+    def _count(self, power: float, start: float, end: float) -> None:
+        self.energy += (end - start) * power / WATT_SECONDS_PER_KWH
+        self.counted_until = end
+
+    def _end_hour(self) -> None:
+        hour = self.hour
+        self.hour = self._hours.hour_at(hour.end)
+        self._on_hour_end(hour)
+        self.energy = 0.0
+        if self._on_hour_start is not None:
+            self._on_hour_start(self.hour)
+
+
+class TopHour(NamedTuple):
+    """Holds data for an hour of consumption"""
+
+    month: int | None
+    day: int
+    hour: int
+    energy: float
+
+
+class PeakData:
+    """Class used to transmit changes of the monthly peak hours"""
+
+    __slots__ = ("month", "top_three", "average")
+
+    def __init__(
+        self, month: int | None, top_three: tuple[TopHour, ...], average: float | None
+    ):
+        self.month = month
+        self.top_three = top_three
+        self.average = average
+
+
+class HourUpdate(Protocol):
+    """Energy used so far in a local hour, such as a meter update"""
+
+    @property
+    def hour(self) -> LocalHour: ...
+
+    @property
+    def energy_consumed(self) -> float: ...
+
+
+# Marks days of the month without any meter updates yet
+_NO_PEAK = -1.0
+
+
+class PeakTracker:
+    """Tracks the top hours of consumption for a month.
+
+    The highest hourly energy of each day is kept in a fixed table indexed by
+    day of month.  An update that does not raise the maximum of its day is
+    discarded after a single comparison, other updates touch at most ``size``
+    entries of the top hours.
+    """
+
+    __slots__ = ("size", "year", "month", "top_three", "data", "_day_max")
+
+    def __init__(self, size: int = 3) -> None:
+        self.size = size
+        self.year: int | None = None
+        self.month: int | None = None
+        # Top hours in attribute and storage format, updated in place
+        self.top_three: list[dict[str, Any]] = []
+        self.data = PeakData(None, (), None)
+        self._day_max = [_NO_PEAK] * 32
+
+    def reset(self, year: int, month: int) -> None:
+        """Start tracking a month without any peaks"""
+        self.restore([], year, month)
+
+    def restore(self, top_three: list[dict[str, Any]], year: int, month: int) -> None:
+        """Start tracking a month from previously saved top hours"""
+        self.year = year
+        self.month = month
+        self.top_three = []
+        self._day_max = [_NO_PEAK] * 32
+        self.merge(top_three)
+        self._update_data()
+
+    def merge(self, top_three: list[dict[str, Any]]) -> bool:
+        """Add saved top hours of the tracked month, keeping the highest hour of
+        each day.  Returns True if the top hours changed"""
+        changed = False
+        for item in top_three:
+            day = int(item["day"])
+            energy = float(item["energy"])
+            if energy > self._day_max[day] and self._raise_day(
+                day, int(item["hour"]), energy
+            ):
+                changed = True
+        if changed:
+            self._update_data()
+        return changed
+
+    def update(self, state: HourUpdate) -> bool:
+        """Add energy used so far in the hour of a meter update.
+        Returns True if the top hours changed"""
+        return self.add(state.hour, state.energy_consumed)
+
+    def add(self, hour: LocalHour, energy: float) -> bool:
+        """Add energy used so far in hour.  Returns True if the top hours
+        changed"""
+        if hour.month != self.month or hour.year != self.year:
+            if self.year is not None and (hour.year, hour.month) < (
+                self.year,
+                self.month,
+            ):
+                # Late update from a month that has already been closed
+                return False
+            self.reset(hour.year, hour.month)
+
+        # Solar or wind production can cause the energy meter to have negative values
+        # Set this to 0, as tariffs are only for consumption and we don't have negative
+        # tariff values in the tariff config section.
+        energy = max(energy, 0)
+        day = hour.day
+        if energy <= self._day_max[day]:
+            return False
+        if not self._raise_day(day, hour.hour, energy):
+            return False
+        self._update_data()
+        return True
+
+    def _raise_day(self, day: int, hour: int, energy: float) -> bool:
+        """Set a new maximum for a day, returns True if the top hours changed"""
+        self._day_max[day] = energy
+        top_three = self.top_three
+        for item in top_three:
+            if item["day"] == day:
+                item["energy"] = energy
+                item["hour"] = hour
+                return True
+
+        entry = {"month": self.month, "day": day, "hour": hour, "energy": energy}
+        if len(top_three) < self.size:
+            top_three.append(entry)
+            return True
+
+        lowest = 0
+        for i in range(1, len(top_three)):
+            if top_three[i]["energy"] < top_three[lowest]["energy"]:
+                lowest = i
+        if top_three[lowest]["energy"] >= energy:
+            return False
+        top_three[lowest] = entry
+        return True
+
+    def _update_data(self) -> None:
+        top_three = tuple(
+            TopHour(item["month"], item["day"], item["hour"], item["energy"])
+            for item in self.top_three
+        )
+        average = None
+        if top_three:
+            average = sum(hour.energy for hour in top_three) / len(top_three)
+        self.data = PeakData(self.month, top_three, average)
+
+
+# Timestamps and values of consecutive readings, sequences or arrays
+Chunk = tuple[Any, Any]
+
+
+def _check_order(previous: float, timestamp: float) -> None:
+    if timestamp < previous:
+        raise ValueError(f"Readings are not in time order at {timestamp}")
+
+
+def hour_energies(
+    chunks: Iterable[Chunk], hours: LocalHours
+) -> Iterator[tuple[LocalHour, float]]:
+    """Returns the energy in kWh of each local hour, one reading at a time.
+
+    The last hour is counted up to the last reading."""
+    ended: list[tuple[LocalHour, float]] = []
+    meter = HourEnergy(hours, lambda hour: ended.append((hour, meter.energy or 0.0)))
+    previous: tuple[float, float] | None = None
+    for timestamps, powers in chunks:
+        for timestamp, power in zip(timestamps, powers):
+            timestamp = float(timestamp)
+            if previous is None:
+                meter.hour = hours.hour_at(timestamp)
+            else:
+                _check_order(previous[0], timestamp)
+                start, watt = previous
+                if timestamp - start > SECONDS_PER_HOUR:
+                    # Not counted, but the hours on the way are ended
+                    watt = 0.0
+                    while timestamp - start > SECONDS_PER_HOUR:
+                        meter.update(start, start + SECONDS_PER_HOUR, watt)
+                        start += SECONDS_PER_HOUR
+                meter.update(start, timestamp, watt)
+                yield from ended
+                ended.clear()
+            previous = (timestamp, float(power))
+    if previous is not None and previous[0] > meter.hour.start:
+        yield meter.hour, meter.energy or 0.0
+
+
+def hour_energies_numpy(
+    chunks: Iterable[Chunk], hours: LocalHours
+) -> Iterator[tuple[LocalHour, float]]:
+    """Same as hour_energies, with each chunk integrated by array operations.
+
+    The energy of a chunk is summed up at each reading, and the energy of an
+    hour is the difference of the sums at its start and end, interpolated
+    between the readings around them."""
+    import numpy as np  # noqa: PLC0415
+
+    hour: LocalHour | None = None
+    # Counted in hour before the current chunk
+    energy = 0.0
+    previous: tuple[float, float] | None = None
+    for timestamps, powers in chunks:
+        times = np.asarray(timestamps, dtype=np.float64)
+        watts = np.asarray(powers, dtype=np.float64)
+        if times.size == 0:
+            continue
+        if previous is None:
+            hour = hours.hour_at(float(times[0]))
+        else:
+            times = np.concatenate(((previous[0],), times))
+            watts = np.concatenate(((previous[1],), watts))
+
+        seconds = np.diff(times)
+        if seconds.size and seconds.min() < 0:
+            index = int(np.argmax(seconds < 0))
+            _check_order(times[index], times[index + 1])
+        rates = watts[:-1] / WATT_SECONDS_PER_KWH
+        rates[seconds > SECONDS_PER_HOUR] = 0.0
+        counted = np.zeros(times.size)
+        np.cumsum(rates * seconds, out=counted[1:])
+
+        start = 0.0
+        while hour.end <= times[-1]:
+            end = hour.end
+            index = int(np.searchsorted(times, end, side="right")) - 1
+            at_end = float(counted[index])
+            if index < rates.size:
+                at_end += float(rates[index]) * (end - float(times[index]))
+            yield hour, energy + at_end - start
+            start = at_end
+            energy = 0.0
+            hour = hours.hour_at(end)
+        energy += float(counted[-1]) - start
+        previous = (float(times[-1]), float(watts[-1]))
+
+    if hour is not None and previous[0] > hour.start:
+        yield hour, energy
+
+
+def hour_totals(
+    chunks: Iterable[Chunk], hours: LocalHours
+) -> Iterator[tuple[LocalHour, float]]:
+    """Returns the energy in kWh of each local hour from readings of energy,
+    such as the hourly export of a grid operator.  Each reading is the energy
+    used in the hour, or part of an hour, starting at its timestamp"""
+    hour: LocalHour | None = None
+    energy = 0.0
+    previous: float | None = None
+    for timestamps, values in chunks:
+        for timestamp, value in zip(timestamps, values):
+            timestamp = float(timestamp)
+            if previous is not None:
+                _check_order(previous, timestamp)
+            previous = timestamp
+            if hour is None or timestamp >= hour.end:
+                if hour is not None:
+                    yield hour, energy
+                hour = hours.hour_at(timestamp)
+                energy = 0.0
+            energy += float(value)
+    if hour is not None:
+        yield hour, energy
@@ -0,0 +1,147 @@
+"""Closed hours of an energytariff instance as external long-term statistics.
+
+Each hour is written once when it closes, through the recorder statistics
+API, so reports read one row per hour instead of the statistics compiled
+from the states of the energy sensor.  Three statistics are kept per meter:
+
+- ``energytariff:<meter>_hour_energy``: energy of the hour in kWh as state,
+  with a running sum
+- ``energytariff:<meter>_peak_candidate``: 1 if the hour was one of the
+  peak hours of the month when it closed, else 0
+- ``energytariff:<meter>_level_threshold``: upper threshold in kWh of the
+  capacity level of the month when the hour closed, if levels are configured
+"""
+
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime
+from logging import getLogger
+from typing import TYPE_CHECKING
+
+from homeassistant.components.recorder.models import (
+    StatisticData,
+    StatisticMetaData,
+)
+from homeassistant.components.recorder.statistics import (
+    async_add_external_statistics,
+    get_last_statistics,
+)
+from homeassistant.const import UnitOfEnergy
+from homeassistant.core import HomeAssistant, callback, split_entity_id
+from homeassistant.helpers.recorder import async_wait_recorder, get_instance
+from homeassistant.util import dt
+
+from .const import DOMAIN, SECONDS_PER_HOUR
+from .engine import LocalHour
+
+if TYPE_CHECKING:
+    from .coordinator import ClosedHour
+
+_LOGGER = getLogger(__name__)
+
+HOUR_ENERGY = "hour_energy"
+PEAK_CANDIDATE = "peak_candidate"
+LEVEL_THRESHOLD = "level_threshold"
+
+
+def statistic_id(meter_entity_id: str, key: str) -> str:
+    """Returns the id of a statistic of a meter"""
+    return f"{DOMAIN}:{split_entity_id(meter_entity_id)[1]}_{key}"
+
+
+def _start(hour: LocalHour) -> datetime:
+    # Statistics start on whole UTC hours, local hours may not in time zones
+    # with a half hour offset
+    return dt.utc_from_timestamp(hour.start - hour.start % SECONDS_PER_HOUR)
+
+
+def _constant(start: datetime, value: float) -> StatisticData:
+    return {"start": start, "mean": value, "min": value, "max": value}
+
+
+class HourStatistics:
+    """Writes the closed hours of a meter to the recorder.
+
+    The running sum of the hour energy continues from the last stored row,
+    which is read on the first write.  Hours closed before that are held
+    back, hours at or before the last stored row are not written again.
+    """
+
+    def __init__(self, hass: HomeAssistant, meter_entity_id: str) -> None:
+        self._hass = hass
+        self._ids = {
+            key: statistic_id(meter_entity_id, key)
+            for key in (HOUR_ENERGY, PEAK_CANDIDATE, LEVEL_THRESHOLD)
+        }
+        self._sum: float | None = None
+        self._last_start = 0.0
+        self._pending: list[ClosedHour] = []
+        self._loading: asyncio.Task | None = None
+        self._disabled = False
+
+    @callback
+    def add(self, closed: ClosedHour) -> None:
+        """Write a closed hour, once the last stored row is known"""
+        if self._disabled:
+            return
+        if self._sum is None:
+            self._pending.append(closed)
+            if self._loading is None:
+                self._loading = self._hass.async_create_background_task(
+                    self._async_load(), f"{DOMAIN} hour statistics"
+                )
+            return
+        self._write([closed])
+
+    async def _async_load(self) -> None:
+        if not await async_wait_recorder(self._hass):
+            _LOGGER.warning("The recorder is not running, hours are not stored")
+            self._disabled = True
+            self._pending.clear()
+            return
+        energy_id = self._ids[HOUR_ENERGY]
+        last = await get_instance(self._hass).async_add_executor_job(
+            get_last_statistics, self._hass, 1, energy_id, False, {"sum"}
+        )
+        rows = last.get(energy_id)
+        if rows:
+            self._sum = rows[0].get("sum") or 0.0
+            self._last_start = rows[0]["start"]
+        else:
+            self._sum = 0.0
+        pending, self._pending = self._pending, []
+        self._write(pending)
+
+    def _write(self, hours: list[ClosedHour]) -> None:
+        energy: list[StatisticData] = []
+        peak: list[StatisticData] = []
+        level: list[StatisticData] = []
+        for closed in hours:
+            start = _start(closed.hour)
+            if start.timestamp() <= self._last_start:
+                continue
+            self._last_start = start.timestamp()
+            self._sum += closed.energy
+            energy.append({"start": start, "state": closed.energy, "sum": self._sum})
+            peak.append(_constant(start, 1.0 if closed.peak else 0.0))
+            if closed.level is not None:
+                level.append(_constant(start, closed.level.threshold))
+        if energy:
+            self._add(HOUR_ENERGY, energy, True, UnitOfEnergy.KILO_WATT_HOUR)
+            self._add(PEAK_CANDIDATE, peak, False, None)
+        if level:
+            self._add(LEVEL_THRESHOLD, level, False, UnitOfEnergy.KILO_WATT_HOUR)
+
+    def _add(
+        self, key: str, rows: list[StatisticData], has_sum: bool, unit: str | None
+    ) -> None:
+        metadata: StatisticMetaData = {
+            "has_mean": not has_sum,
+            "has_sum": has_sum,
+            "name": None,
+            "source": DOMAIN,
+            "statistic_id": self._ids[key],
+            "unit_of_measurement": unit,
+        }
+        async_add_external_statistics(self._hass, metadata, rows)
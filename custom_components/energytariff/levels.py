@@ -0,0 +1,72 @@
+"""Grid capacity level lookup for energytariff, without Home Assistant."""
+
+from __future__ import annotations
+
+from bisect import bisect_right
+from collections.abc import Iterator
+from typing import TYPE_CHECKING, Any, NamedTuple
+
+from .const import LEVEL_NAME, LEVEL_PRICE, LEVEL_THRESHOLD
+
+if TYPE_CHECKING:
+    from homeassistant.helpers.template import Template
+
+
+class Level(NamedTuple):
+    """A configured capacity level, price is a number or a template"""
+
+    name: str
+    threshold: float
+    price: float | Template
+
+
+def _price(price: Any) -> float | Template:
+    """Numbers are converted, templates are rendered by the sensors"""
+    if isinstance(price, (int, float, str)):
+        return float(price)
+    return price
+
+
+class LevelTable:
+    """Capacity levels sorted by threshold.
+
+    Built once from the ``levels`` config.  Thresholds must be unique, levels
+    may be configured in any order.
+    """
+
+    __slots__ = ("levels", "_thresholds")
+
+    def __init__(self, levels: list[dict[str, Any]]):
+        table = sorted(
+            (
+                Level(
+                    str(level[LEVEL_NAME]),
+                    float(level[LEVEL_THRESHOLD]),
+                    _price(level[LEVEL_PRICE]),
+                )
+                for level in levels
+            ),
+            key=lambda level: level.threshold,
+        )
+        for lower, upper in zip(table, table[1:]):
+            if lower.threshold == upper.threshold:
+                raise ValueError(
+                    f"Levels '{lower.name}' and '{upper.name}' have the same "
+                    f"threshold {lower.threshold}"
+                )
+        self.levels: tuple[Level, ...] = tuple(table)
+        self._thresholds = tuple(level.threshold for level in table)
+
+    def __len__(self) -> int:
+        return len(self.levels)
+
+    def __iter__(self) -> Iterator[Level]:
+        return iter(self.levels)
+
+    def find(self, energy: float) -> int | None:
+        """Returns index of the lowest level with a threshold above energy.
+        Returns None if energy is above all levels"""
+        index = bisect_right(self._thresholds, energy)
+        if index == len(self._thresholds):
+            return None
+        return index
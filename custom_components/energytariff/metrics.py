@@ -0,0 +1,234 @@
+"""Diagnostic metrics of an energytariff instance.
+
+Only loaded with ``diagnostics: true``.  The meter callback and the listeners
+of the coordinator signals are timed, and a diagnostic sensor reports once a
+minute:
+
+- meter events per second, as its state
+- the interval between meter states and its jitter, in seconds
+- p50 and p99 of the time spent in the meter callback and in each listener,
+  in milliseconds, over the last calls
+- state writes per minute of each sensor, and the values it did not write as
+  unchanged (deduped) or within its publish_interval (held_back)
+- threshold changes sent to the other sensors and the ones suppressed as
+  unchanged
+
+Without diagnostics the instance uses plain signals and callbacks, nothing
+here is imported or counted apart from the counters of the publishers.
+"""
+
+from __future__ import annotations
+
+import statistics
+import time
+from collections import deque
+from collections.abc import Callable
+from datetime import timedelta
+from typing import TypeVar
+
+from homeassistant.components.sensor import SensorEntity, SensorStateClass
+from homeassistant.const import EntityCategory
+from homeassistant.core import Event, EventStateChangedData, callback
+from homeassistant.helpers.device_registry import DeviceInfo
+from homeassistant.helpers.event import async_track_time_interval
+
+from .const import CONF_EFFECT_ENTITY, DOMAIN, ICON
+from .coordinator import GridCapacityCoordinator, ReplaySignal
+from .publisher import StatePublisher
+from .utils import make_device_info
+
+# Calls kept per timing, and meter intervals kept for the jitter
+SAMPLES_KEPT = 1000
+
+REPORT_INTERVAL = timedelta(minutes=1)
+
+_DataT = TypeVar("_DataT")
+
+
+class Timings:
+    """Durations of the last calls of a function, in seconds"""
+
+    __slots__ = ("_samples",)
+
+    def __init__(self) -> None:
+        self._samples: deque[float] = deque(maxlen=SAMPLES_KEPT)
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentiles(self) -> dict[str, float]:
+        """p50 and p99 in milliseconds, empty before the first call"""
+        if not self._samples:
+            return {}
+        ordered = sorted(self._samples)
+        last = len(ordered) - 1
+        return {
+            "p50": round(ordered[last // 2] * 1000, 3),
+            "p99": round(ordered[round(last * 0.99)] * 1000, 3),
+        }
+
+
+class TimedSignal(ReplaySignal[_DataT]):
+    """ReplaySignal that times each of its listeners on publish, by the
+    qualified name of the listener"""
+
+    __slots__ = ("_timings",)
+
+    def __init__(self, timings: dict[str, Timings]) -> None:
+        super().__init__()
+        self._timings = timings
+
+    def publish(self, value: _DataT) -> None:
+        self.value = value
+        for listener in self._listeners:
+            begin = time.perf_counter()
+            listener(value)
+            elapsed = time.perf_counter() - begin
+            name = getattr(listener, "__qualname__", type(listener).__name__)
+            timings = self._timings.get(name)
+            if timings is None:
+                timings = self._timings[name] = Timings()
+            timings.add(elapsed)
+
+
+class InstanceMetrics:
+    """Counters and timings of an instance, kept while diagnostics are on"""
+
+    def __init__(self) -> None:
+        self.meter_events = 0
+        self.on_change = Timings()
+        self.listeners: dict[str, Timings] = {}
+        # Seconds between the last meter states
+        self._intervals: deque[float] = deque(maxlen=SAMPLES_KEPT)
+        self._last_update: float | None = None
+
+    def signal(self) -> TimedSignal:
+        """A signal whose listeners are timed"""
+        return TimedSignal(self.listeners)
+
+    def timed_meter(
+        self, on_change: Callable[[Event[EventStateChangedData]], None]
+    ) -> Callable[[Event[EventStateChangedData]], None]:
+        """Wraps the meter callback to count and time meter events"""
+
+        @callback
+        def _on_change(event: Event[EventStateChangedData]) -> None:
+            self.meter_events += 1
+            new_state = event.data["new_state"]
+            if new_state is not None:
+                updated = new_state.last_updated_timestamp
+                if self._last_update is not None:
+                    self._intervals.append(updated - self._last_update)
+                self._last_update = updated
+            begin = time.perf_counter()
+            on_change(event)
+            self.on_change.add(time.perf_counter() - begin)
+
+        return _on_change
+
+    def sample_interval(self) -> tuple[float | None, float | None]:
+        """Mean and standard deviation of the seconds between meter states"""
+        if not self._intervals:
+            return None, None
+        return (
+            round(statistics.fmean(self._intervals), 3),
+            round(statistics.pstdev(self._intervals), 3),
+        )
+
+
+class GridCapWatcherMetrics(SensorEntity):
+    """Diagnostic sensor with the metrics of an instance.
+
+    The state is meter events per second over the last report interval,
+    the other metrics are attributes that are not recorded."""
+
+    _attr_should_poll = False
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_state_class = SensorStateClass.MEASUREMENT
+    _attr_native_unit_of_measurement = "events/s"
+    _attr_icon = ICON
+    _unrecorded_attributes = frozenset(
+        {
+            "sample_interval",
+            "sample_jitter",
+            "on_change_ms",
+            "listeners_ms",
+            "writes_per_minute",
+            "deduped",
+            "held_back",
+            "threshold_emitted",
+            "threshold_suppressed",
+        }
+    )
+
+    def __init__(
+        self,
+        rx_coord: GridCapacityCoordinator,
+        metrics: InstanceMetrics,
+        publishers: dict[str, StatePublisher],
+    ):
+        self._metrics = metrics
+        self._coordinator = rx_coord
+        self._publishers = publishers
+        self._effect_sensor_id = rx_coord.config.get(CONF_EFFECT_ENTITY)
+        self._attr_unique_id = f"{DOMAIN}_{self._effect_sensor_id}_diagnostics".replace(
+            "sensor.", ""
+        )
+        self._reported_at = rx_coord.clock.monotonic()
+        self._meter_events = 0
+        self._writes = {key: 0 for key in publishers}
+
+    async def async_added_to_hass(self) -> None:
+        """Call when entity about to be added to hass."""
+        await super().async_added_to_hass()
+        self.async_on_remove(
+            async_track_time_interval(
+                self.hass, self._async_report, REPORT_INTERVAL, cancel_on_shutdown=True
+            )
+        )
+
+    @callback
+    def _async_report(self, _now=None) -> None:
+        """Report the metrics since the last report"""
+        metrics = self._metrics
+        now = self._coordinator.clock.monotonic()
+        seconds = now - self._reported_at
+        self._reported_at = now
+        if seconds <= 0:
+            return
+        events = metrics.meter_events - self._meter_events
+        self._meter_events = metrics.meter_events
+        writes_per_minute: dict[str, float] = {}
+        for key, publisher in self._publishers.items():
+            writes = publisher.writes - self._writes[key]
+            self._writes[key] = publisher.writes
+            writes_per_minute[key] = round(writes * 60 / seconds, 2)
+        interval, jitter = metrics.sample_interval()
+        counters = self._coordinator.threshold_counters
+        self._attr_native_value = round(events / seconds, 3)
+        self._attr_extra_state_attributes = {
+            "sample_interval": interval,
+            "sample_jitter": jitter,
+            "on_change_ms": metrics.on_change.percentiles(),
+            "listeners_ms": {
+                name: timings.percentiles()
+                for name, timings in metrics.listeners.items()
+            },
+            "writes_per_minute": writes_per_minute,
+            "deduped": {key: item.deduped for key, item in self._publishers.items()},
+            "held_back": {
+                key: item.held_back for key, item in self._publishers.items()
+            },
+            "threshold_emitted": counters.emitted,
+            "threshold_suppressed": counters.suppressed,
+        }
+        self.async_write_ha_state()
+
+    @property
+    def name(self):
+        """Return the name of the sensor."""
+        return "Energy tariff diagnostics"
+
+    @property
+    def device_info(self) -> DeviceInfo:
+        return make_device_info(self._effect_sensor_id)
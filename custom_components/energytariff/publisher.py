@@ -0,0 +1,99 @@
+"""Rate-limited state publishing for energytariff sensors."""
+
+from __future__ import annotations
+
+import time
+from collections.abc import Callable
+from typing import Any
+
+_UNSET = object()
+
+
+class StatePublisher:
+    """Coalesces state writes for a single entity.
+
+    A write is issued only when the published signature differs from the last
+    written one, and at most once per ``min_interval`` seconds.  A suppressed
+    change is kept as pending until the next allowed write or ``flush``.
+    With ``call_later``, which calls a function after a number of seconds and
+    returns a function that cancels it, the pending change is also flushed
+    when the interval ends, so a meter that goes quiet leaves no stale state.
+    """
+
+    def __init__(
+        self,
+        write: Callable[[], None],
+        min_interval: float = 0,
+        clock: Callable[[], float] = time.monotonic,
+        call_later: Callable[[float, Callable[[], None]], Callable[[], None]]
+        | None = None,
+    ):
+        self._write = write
+        self._min_interval = min_interval
+        self._clock = clock
+        self._call_later = call_later
+        self._cancel_flush: Callable[[], None] | None = None
+        self._last_signature: Any = _UNSET
+        self._last_write: float | None = None
+        self._pending_signature: Any = _UNSET
+        # Counted for diagnostics: writes, unchanged values and held back ones
+        self.writes = 0
+        self.deduped = 0
+        self.held_back = 0
+
+    @property
+    def pending(self) -> bool:
+        """Return True if a change is waiting to be written."""
+        return self._pending_signature is not _UNSET
+
+    def publish(self, signature: Any, immediate: bool = False) -> bool:
+        """Write state if signature changed and the minimum interval has passed"""
+        if signature == self._last_signature:
+            # State already shows this value, anything pending is obsolete
+            self._pending_signature = _UNSET
+            self.deduped += 1
+            return False
+
+        now = self._clock()
+        if (
+            not immediate
+            and self._last_write is not None
+            and now - self._last_write < self._min_interval
+        ):
+            self._pending_signature = signature
+            self.held_back += 1
+            if self._call_later is not None and self._cancel_flush is None:
+                self._cancel_flush = self._call_later(
+                    self._last_write + self._min_interval - now, self._trailing_flush
+                )
+            return False
+
+        self._do_write(signature, now)
+        return True
+
+    def flush(self) -> bool:
+        """Write any pending change regardless of the minimum interval"""
+        if self._pending_signature is _UNSET:
+            return False
+        self._do_write(self._pending_signature, self._clock())
+        return True
+
+    def cancel(self) -> None:
+        """Cancel the flush at the end of the interval, when the entity is
+        removed"""
+        if self._cancel_flush is not None:
+            self._cancel_flush()
+            self._cancel_flush = None
+
+    def _trailing_flush(self) -> None:
+        self._cancel_flush = None
+        self.flush()
+
+    def _do_write(self, signature: Any, now: float) -> None:
+        # A new interval starts, a flush scheduled for the last one is early
+        self.cancel()
+        self._last_signature = signature
+        self._last_write = now
+        self._pending_signature = _UNSET
+        self.writes += 1
+        self._write()
@@ -0,0 +1,173 @@
+"""Replay of recorded meter updates through the energytariff sensors.
+
+Used to check a tariff configuration against past consumption before it is
+put to use.  The sensors of an instance are set up with a ReplayClock, and
+meter updates are fed through the state machine with their recorded
+timestamps, so a month of updates takes seconds.  Hours and months are
+closed by the clock in the order a live instance would close them.
+
+A replay sets states and adds entities, so it is meant for a Home Assistant
+instance of its own, such as the one of the test harness.
+"""
+
+from __future__ import annotations
+
+import itertools
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+from datetime import timedelta
+from logging import getLogger
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.entity_platform import EntityPlatform
+
+from .clock import ReplayClock
+from .const import CONF_EFFECT_ENTITY, DOMAIN, PUBLISH_INTERVAL
+from .coordinator import (
+    EnergyData,
+    GridCapacityCoordinator,
+    TopHour,
+)
+from .engine import LocalHour
+from .sensor import create_sensors
+from .utils import LOCAL_HOURS
+
+_LOGGER = getLogger(__name__)
+
+# Meter of replayed instances, kept apart from meters of live instances
+REPLAY_METER = "sensor.energytariff_replay_meter"
+
+# Sensor states are not part of the result, so unless configured otherwise
+# they are written when an hour is closed, by replayed time
+REPLAY_PUBLISH_INTERVAL = 3600
+
+_METER_ATTRIBUTES = {"unit_of_measurement": "W"}
+
+
+@dataclass
+class MonthSummary:
+    """Peaks and level of a replayed month, as they were when it ended"""
+
+    year: int
+    month: int
+    top_three: tuple[TopHour, ...]
+    average: float | None
+    level_name: str | None = None
+    level_price: float | None = None
+
+
+@dataclass
+class ReplayResult:
+    """Energy of each closed hour and a summary of each month of a replay.
+    The last month is summarized as it was after the last meter update"""
+
+    hours: list[tuple[LocalHour, float]] = field(default_factory=list)
+    months: list[MonthSummary] = field(default_factory=list)
+
+
+class _Recorder:
+    """Collects the result of a replay from the signals of the coordinator"""
+
+    def __init__(self, coordinator: GridCapacityCoordinator) -> None:
+        self._coordinator = coordinator
+        self._energy: EnergyData | None = None
+        self.result = ReplayResult()
+
+    @callback
+    def energy(self, data: EnergyData) -> None:
+        self._energy = data
+
+    @callback
+    def hour_closed(self, hour: LocalHour) -> None:
+        energy = self._energy
+        if energy is not None and energy.hour.start == hour.start:
+            self.result.hours.append((hour, energy.energy_consumed))
+        # Peaks of a month are cleared after its last hour is closed
+        if LOCAL_HOURS.hour_at(hour.end).month != hour.month:
+            self.summarize_month(hour)
+
+    def summarize_month(self, hour: LocalHour) -> None:
+        """Add the month of hour to the result, once"""
+        months = self.result.months
+        if months and (months[-1].year, months[-1].month) == (hour.year, hour.month):
+            return
+        peaks = self._coordinator.peakdata.value
+        if peaks is None:
+            return
+        summary = MonthSummary(hour.year, hour.month, peaks.top_three, peaks.average)
+        threshold = self._coordinator.thresholddata.value
+        if threshold is not None:
+            summary.level_name = threshold.name
+            summary.level_price = threshold.price
+        self.result.months.append(summary)
+
+
+async def async_replay(
+    hass: HomeAssistant, config: dict, samples: Iterable[tuple[float, float]]
+) -> ReplayResult:
+    """Replay meter updates through the sensors of an instance.
+
+    samples are (epoch seconds, power in W) in time order.  The instance is
+    set up from config, with REPLAY_METER as its meter, and removed when the
+    replay is done.  Peaks of the instance are not stored."""
+    samples = iter(samples)
+    first = next(samples, None)
+    if first is None:
+        return ReplayResult()
+
+    config = {
+        PUBLISH_INTERVAL: REPLAY_PUBLISH_INTERVAL,
+        **config,
+        CONF_EFFECT_ENTITY: REPLAY_METER,
+    }
+    clock = ReplayClock(first[0])
+    coordinator = GridCapacityCoordinator(hass, config, clock)
+    platform = EntityPlatform(
+        hass=hass,
+        logger=_LOGGER,
+        domain="sensor",
+        platform_name=DOMAIN,
+        platform=None,
+        scan_interval=timedelta(seconds=30),
+        entity_namespace=None,
+    )
+    # Peaks are not carried over from an earlier replay
+    await coordinator.peak_store.async_remove()
+    hass.states.async_remove(REPLAY_METER)
+    await platform.async_add_entities(
+        create_sensors(hass, config, coordinator).values()
+    )
+    # After the sensors, which finish an hour before it is recorded
+    recorder = _Recorder(coordinator)
+    unsubs = [
+        coordinator.effectstate.subscribe(recorder.energy),
+        coordinator.hourclose.subscribe(recorder.hour_closed),
+    ]
+
+    try:
+        hour_end = LOCAL_HOURS.hour_at(first[0]).end
+        last = first[0]
+        for timestamp, power in itertools.chain((first,), samples):
+            if timestamp >= hour_end:
+                await hass.async_block_till_done()
+                hour_end = LOCAL_HOURS.hour_at(timestamp).end
+            # Sensors get meter updates in a later call, the clock is moved
+            # in line with them, so each update is handled at its own time
+            hass.loop.call_soon(clock.advance, timestamp)
+            hass.states.async_set(
+                REPLAY_METER,
+                str(power),
+                _METER_ATTRIBUTES,
+                force_update=True,
+                timestamp=timestamp,
+            )
+            last = timestamp
+        await hass.async_block_till_done()
+        recorder.summarize_month(LOCAL_HOURS.hour_at(last))
+    finally:
+        await platform.async_reset()
+        for unsub in unsubs:
+            unsub()
+        hass.states.async_remove(REPLAY_METER)
+        await coordinator.peak_store.async_remove()
+    return recorder.result
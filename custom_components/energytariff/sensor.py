@@ -2,7 +2,7 @@
 
 from __future__ import annotations
 
-from datetime import datetime
+import asyncio
 from logging import getLogger
 from typing import Any
 
@@ -22,42 +22,67 @@ from homeassistant.const import (
 )
 from homeassistant.core import Event, EventStateChangedData, callback
 from homeassistant.exceptions import TemplateError
+from homeassistant.helpers import entity_registry as er
 from homeassistant.helpers import template as template_helper
 from homeassistant.helpers.device_registry import DeviceInfo
 from homeassistant.helpers.event import (
     TrackTemplate,
     TrackTemplateResult,
     TrackTemplateResultInfo,
-    async_track_point_in_time,
     async_track_state_change_event,
     async_track_template_result,
 )
-from homeassistant.util import dt
 
 from .const import (
+    ALARMS,
+    BACKFILL,
+    BINARY_SENSOR,
     CONF_EFFECT_ENTITY,
+    DIAGNOSTICS,
     DOMAIN,
     GRID_LEVELS,
+    HOUR_STATISTICS,
+    HYSTERESIS,
     ICON,
+    LEAD_TIME,
     LEVEL_NAME,
     LEVEL_PRICE,
     LEVEL_THRESHOLD,
     MAX_EFFECT_ALLOWED,
-    RESET_TOP_THREE,
+    PUBLISH_INTERVAL,
     ROUNDING_PRECISION,
-    SECONDS_PER_HOUR,
+    SENSOR_AVAILABLE_POWER,
+    SENSOR_AVERAGE,
+    SENSOR_ENERGY,
+    SENSOR_ESTIMATE,
+    SENSOR_KEYS,
+    SENSOR_LEVEL_NAME,
+    SENSOR_LEVEL_PRICE,
+    SENSOR_THRESHOLD,
     TARGET_ENERGY,
-    WATTS_PER_KW,
 )
-from .coordinator import EnergyData, GridCapacityCoordinator, GridThresholdData
+from .coordinator import (
+    EnergyData,
+    GridCapacityCoordinator,
+    GridThresholdData,
+    PeakData,
+    TopHour,
+    async_register_coordinator,
+)
+from .engine import (
+    HourEnergy,
+    LocalHour,
+    available_power,
+    estimate_hour_energy,
+)
+from .levels import Level, LevelTable
+from .publisher import StatePublisher
 from .utils import (
-    calculate_top_three,
+    LOCAL_HOURS,
     convert_to_watt,
+    get_publish_interval,
     get_rounding_precision,
-    seconds_between,
-    start_of_current_hour,
-    start_of_next_hour,
-    start_of_next_month,
+    make_device_info,
 )
 
 _LOGGER = getLogger(__name__)
@@ -70,6 +95,29 @@ LEVEL_SCHEMA = vol.Schema(
     }
 )
 
+
+def _validate_levels(levels: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Validate that levels can be compiled into a level table"""
+    try:
+        LevelTable(levels)
+    except ValueError as err:
+        raise vol.Invalid(str(err)) from err
+    return levels
+
+
+# Unique id suffixes that did not include the meter before 0.6.0
+LEGACY_UNIQUE_IDS = ("effect_level_name", "effect_level_price")
+
+# Closed hours whose energy is kept for gaps that are read back later
+CLOSED_HOURS_KEPT = 3
+
+PUBLISH_INTERVAL_VALUE = vol.All(vol.Coerce(float), vol.Range(min=0))
+
+PUBLISH_INTERVAL_SCHEMA = vol.Any(
+    PUBLISH_INTERVAL_VALUE,
+    vol.Schema({vol.Optional(key): PUBLISH_INTERVAL_VALUE for key in SENSOR_KEYS}),
+)
+
 PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(
     {
         vol.Required(CONF_EFFECT_ENTITY): cv.string,
@@ -79,73 +127,156 @@ PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(
         ),
         vol.Optional(MAX_EFFECT_ALLOWED): cv.positive_float,
         vol.Optional(ROUNDING_PRECISION): cv.positive_int,
-        vol.Optional(GRID_LEVELS): vol.All(cv.ensure_list, [LEVEL_SCHEMA]),
+        vol.Optional(GRID_LEVELS): vol.All(
+            cv.ensure_list, [LEVEL_SCHEMA], _validate_levels
+        ),
+        vol.Optional(PUBLISH_INTERVAL): PUBLISH_INTERVAL_SCHEMA,
+        vol.Optional(BACKFILL): cv.boolean,
+        vol.Optional(HOUR_STATISTICS): cv.boolean,
+        vol.Optional(DIAGNOSTICS): cv.boolean,
+        vol.Optional(ALARMS): vol.Schema(
+            {
+                vol.Optional(HYSTERESIS, default=0.0): vol.All(
+                    vol.Coerce(float), vol.Range(min=0)
+                ),
+                vol.Optional(LEAD_TIME): vol.All(vol.Coerce(float), vol.Range(min=0)),
+            }
+        ),
     }
 )
 
 
 async def async_setup_platform(hass, config, async_add_entities, discovery_info=None):
     """Setup sensor platform."""
-    rx_coord = GridCapacityCoordinator(hass)
-
-    # Both sensors subscribe to effectstate independently; order is not
-    # functionally significant.  avg maintains its own top_three and does NOT
-    # consume thresholddata.
-    entities: list = [
-        GridCapWatcherEnergySensor(hass, config, rx_coord),
-        GridCapWatcherEstimatedEnergySensor(hass, config, rx_coord),
-        GridCapWatcherAvailableEffectRemainingHour(hass, config, rx_coord),
-    ]
-    if config.get(GRID_LEVELS) is not None:
-        entities.extend(
-            [
-                GridCapWatcherCurrentEffectLevelThreshold(hass, config, rx_coord),
-                GridCapacityWatcherCurrentLevelName(hass, config, rx_coord),
-                GridCapacityWatcherCurrentLevelPrice(hass, config, rx_coord),
-            ]
+    _async_migrate_unique_ids(hass, config.get(CONF_EFFECT_ENTITY))
+    rx_coord = GridCapacityCoordinator(hass, config)
+    sensors = create_sensors(hass, config, rx_coord)
+
+    # Saved state of all sensors is read at once, before any sensor is added
+    await rx_coord.async_restore(
+        {key: sensor.unique_id for key, sensor in sensors.items()}
+    )
+    entities: list[SensorEntity] = list(sensors.values())
+    if rx_coord.metrics is not None:
+        from .metrics import GridCapWatcherMetrics  # noqa: PLC0415
+
+        entities.append(
+            GridCapWatcherMetrics(
+                rx_coord,
+                rx_coord.metrics,
+                {key: sensor._publisher for key, sensor in sensors.items()},
+            )
         )
-    # Average sensor last.
-    entities.append(GridCapWatcherAverageThreePeakHours(hass, config, rx_coord))
     async_add_entities(entities)
 
+    async_register_coordinator(hass, rx_coord)
+    # The websocket API stays off the import path of the platform
+    from .websocket import async_register_websocket  # noqa: PLC0415
+
+    async_register_websocket(hass)
 
-def _make_device_info(effect_sensor_id: str) -> DeviceInfo:
-    """Return shared DeviceInfo for all energytariff sensors."""
-    return DeviceInfo(
-        identifiers={(DOMAIN, effect_sensor_id)},
-        name="Energy Tariff",
-        manufacturer="energytariff",
+    if config.get(ALARMS) is not None:
+        from homeassistant.helpers import discovery  # noqa: PLC0415
+
+        hass.async_create_task(
+            discovery.async_load_platform(
+                hass,
+                BINARY_SENSOR,
+                DOMAIN,
+                {CONF_EFFECT_ENTITY: config[CONF_EFFECT_ENTITY]},
+                {},
+            )
+        )
+
+
+def create_sensors(
+    hass, config, rx_coord: GridCapacityCoordinator
+) -> dict[str, SensorEntity]:
+    """Create the sensors of an instance, keyed by sensor key"""
+    # Threshold and average sensors both read the monthly peaks tracked by
+    # the coordinator, entity order is not functionally significant.
+    sensors: dict[str, SensorEntity] = {
+        SENSOR_ENERGY: GridCapWatcherEnergySensor(hass, config, rx_coord),
+        SENSOR_ESTIMATE: GridCapWatcherEstimatedEnergySensor(hass, config, rx_coord),
+        SENSOR_AVAILABLE_POWER: GridCapWatcherAvailableEffectRemainingHour(
+            hass, config, rx_coord
+        ),
+    }
+    if config.get(GRID_LEVELS) is not None:
+        sensors[SENSOR_THRESHOLD] = GridCapWatcherCurrentEffectLevelThreshold(
+            hass, config, rx_coord
+        )
+        sensors[SENSOR_LEVEL_NAME] = GridCapacityWatcherCurrentLevelName(
+            hass, config, rx_coord
+        )
+        sensors[SENSOR_LEVEL_PRICE] = GridCapacityWatcherCurrentLevelPrice(
+            hass, config, rx_coord
+        )
+    # Average sensor last.
+    sensors[SENSOR_AVERAGE] = GridCapWatcherAverageThreePeakHours(
+        hass, config, rx_coord
     )
+    return sensors
 
 
-def _restore_top_three(savedstate: Any, attr: dict) -> None:
-    """Restore top_three from saved HA state, filtering to current month only.
+@callback
+def _async_migrate_unique_ids(hass, effect_sensor_id: str) -> None:
+    """Move level name and price sensors to unique ids that include the meter.
 
-    Replaces any existing top_three content rather than appending to it, so
-    events that fired before async_added_to_hass cannot leave stale entries.
-    """
-    if "top_three" not in savedstate.attributes:
-        return
-    current_month = dt.as_local(dt.now()).month
-    restored = []
-    for item in savedstate.attributes["top_three"]:
-        item_month = int(item.get("month", current_month))
-        if item_month != current_month:
+    The old ids were the same for all instances, so only one instance could
+    register them.  That instance takes them over, keeping its entity ids and
+    recorded history."""
+    registry = er.async_get(hass)
+    for suffix in LEGACY_UNIQUE_IDS:
+        entity_id = registry.async_get_entity_id("sensor", DOMAIN, f"{DOMAIN}_{suffix}")
+        if entity_id is None:
             continue
-        restored.append(
-            {
-                "month": int(item_month),
-                "day": item["day"],
-                "hour": item["hour"],
-                "energy": item["energy"],
-            }
-        )
-    attr["top_three"] = restored
+        unique_id = f"{DOMAIN}_{effect_sensor_id}_{suffix}".replace("sensor.", "")
+        if registry.async_get_entity_id("sensor", DOMAIN, unique_id) is not None:
+            continue
+        _LOGGER.info("Migrating unique id of %s to %s", entity_id, unique_id)
+        registry.async_update_entity(entity_id, new_unique_id=unique_id)
+
+
+def _top_three_signature(top_hours: tuple[TopHour, ...]) -> tuple:
+    """Return the peak hours without their energy, used to detect attribute
+    changes.  The energy of the current hour grows until the hour is over,
+    it is written with the next state change."""
+    return tuple((hour.month, hour.day, hour.hour) for hour in top_hours)
+
+
+def _peak_summary(top_three: list[dict[str, Any]], precision: int) -> dict[str, Any]:
+    """Return the number of peak hours and the energy of the lowest one, the
+    peak hours themselves are kept in PeakStore"""
+    return {
+        "peak_hours": len(top_three),
+        "lowest_peak": round(min(hour["energy"] for hour in top_three), precision)
+        if top_three
+        else None,
+    }
+
+
+def _same_peak_hours(first: tuple[TopHour, ...], second: tuple[TopHour, ...]) -> bool:
+    """Return True if both hold the same hours.  Energy is not compared, as the
+    energy of the current hour grows until the hour is over."""
+    if first is second:
+        return True
+    if len(first) != len(second):
+        return False
+    for hour_1, hour_2 in zip(first, second):
+        if (
+            hour_1.hour != hour_2.hour
+            or hour_1.day != hour_2.day
+            or hour_1.month != hour_2.month
+        ):
+            return False
+    return True
 
 
 class GridCapWatcherEnergySensor(RestoreSensor):
     """grid_cap_watcher Energy sensor class."""
 
+    _attr_should_poll = False
     _attr_state_class = SensorStateClass.TOTAL
     _attr_native_unit_of_measurement = UnitOfEnergy.KILO_WATT_HOUR
 
@@ -155,49 +286,84 @@ class GridCapWatcherEnergySensor(RestoreSensor):
         self._precision = get_rounding_precision(config)
         self._coordinator = rx_coord
         self._attr_icon: str = ICON
-        self._state = None
         self._attr_unique_id = (
             f"{DOMAIN}_{self._effect_sensor_id}_consumption_kWh".replace("sensor.", "")
         )
-
-        self._unsub_state = async_track_state_change_event(
-            hass, self._effect_sensor_id, self._async_on_change
-        )
-        self._unsub_timer = async_track_point_in_time(
-            hass, self.hourly_reset, start_of_next_hour(dt.now())
+        self._publisher = StatePublisher(
+            lambda: self.async_write_ha_state(),
+            get_publish_interval(config, SENSOR_ENERGY),
+            rx_coord.clock.monotonic,
+            rx_coord.call_later,
         )
+        self._meter = HourEnergy(LOCAL_HOURS, self._hour_ended, self._hour_started)
+        # Energy of the last closed hours with meter updates, gaps read back
+        # from the recorder are added to it
+        self._closed_hours: dict[LocalHour, float] = {}
+        # Set after a restart until the first meter update is counted
+        self._restarted = False
+        self._gap_reads: set[asyncio.Task] = set()
+
+        # Meter tracking starts in async_added_to_hass, as state is written
+        # directly from the callbacks and requires the entity to be added.
+        self._unsub_state = None
 
     async def async_added_to_hass(self) -> None:
         """Call when entity about to be added to hass."""
         await super().async_added_to_hass()
-        savedstate = await self.async_get_last_sensor_data()
-        last_state = await self.async_get_last_state()
-        if savedstate and savedstate.native_value is not None:
-            # Only restore hourly energy if the last save was within the current hour.
-            # A stale restored value (from a previous run) would seed incorrect
-            # top_three entries after a restart with a long gap.
-            if last_state is not None:
-                current_hour_start = start_of_current_hour(dt.as_local(dt.now()))
-                if dt.as_local(last_state.last_updated) >= current_hour_start:
-                    self._state = float(savedstate.native_value)
-                # else: start fresh at 0 for the current hour
-            else:
-                self._state = float(savedstate.native_value)
+        self.async_on_remove(self._coordinator.register_publisher(self._publisher))
+        on_change = self._async_on_change
+        if self._coordinator.metrics is not None:
+            on_change = self._coordinator.metrics.timed_meter(on_change)
+        self._unsub_state = async_track_state_change_event(
+            self._hass, self._effect_sensor_id, on_change
+        )
+        self._meter.hour = LOCAL_HOURS.hour_at(self._coordinator.clock.time())
+        self.async_on_remove(self._coordinator.hourclose.subscribe(self._hour_closed))
+        self.async_on_remove(self._coordinator.track_hours())
+        # Only set if saved within the current hour.  A stale value from a
+        # previous run would seed incorrect top_three entries after a restart
+        # with a long gap.
+        restored = self._coordinator.restored
+        self._meter.energy = restored.hour_energy
+        if restored.energy_saved_at is not None:
+            # The saved energy is counted up to the save, the time until the
+            # first meter update is read from the recorder
+            self._meter.counted_until = restored.energy_saved_at
+            self._restarted = True
+            if restored.hour_energy is None:
+                self._add_closed_hour(
+                    LOCAL_HOURS.hour_at(restored.energy_saved_at),
+                    restored.saved_energy,
+                )
 
     async def async_will_remove_from_hass(self) -> None:
-        self._unsub_state()
-        if self._unsub_timer:
-            self._unsub_timer()
+        if self._unsub_state:
+            self._unsub_state()
+        for task in self._gap_reads:
+            task.cancel()
 
     @callback
-    def hourly_reset(self, time):
-        """Callback that HA invokes at the start of each hour to reset this sensor value"""
+    def _hour_closed(self, hour: LocalHour) -> None:
+        """Finish hours that were closed by the clock before a meter update
+        crossed their end"""
+        self._meter.close(hour.end)
+
+    def _hour_ended(self, hour: LocalHour) -> None:
+        """Publish the final energy of the hour, before it is reset"""
+        meter = self._meter
+        if meter.energy is not None and meter.last_power is not None:
+            self.fire_event(meter.last_power, hour.end, hour)
+        if meter.energy is not None:
+            self._coordinator.record_hour(hour, meter.energy)
+        if meter.counted_until is not None and meter.counted_until > hour.start:
+            self._add_closed_hour(hour, meter.energy)
+        # Written now, the energy is reset before pending values are flushed
+        self._publisher.publish(self.native_value, immediate=True)
+        self._coordinator.close_hour(hour)
         _LOGGER.debug("Hourly reset")
-        self._state = 0
-        self.async_schedule_update_ha_state(True)
-        self._unsub_timer = async_track_point_in_time(
-            self._hass, self.hourly_reset, start_of_next_hour(time)
-        )
+
+    def _hour_started(self, _hour: LocalHour) -> None:
+        self._publisher.publish(self.native_value, immediate=True)
 
     @callback
     def _async_on_change(self, event: Event[EventStateChangedData]) -> None:
@@ -210,26 +376,91 @@ class GridCapWatcherEnergySensor(RestoreSensor):
         if new_state.state in (STATE_UNKNOWN, STATE_UNAVAILABLE):
             return
         if old_state.state in (STATE_UNKNOWN, STATE_UNAVAILABLE):
+            # Back from unavailable, the time since the last counted update
+            # is read from the recorder
+            self._read_gap(new_state.last_updated_timestamp)
             return
 
-        if self._state is None:
-            self._state = 0
-
-        diff = seconds_between(new_state.last_updated, old_state.last_updated)
+        start = old_state.last_updated_timestamp
+        end = new_state.last_updated_timestamp
         watt = convert_to_watt(old_state)
         if watt is None:
             return
-        if diff > SECONDS_PER_HOUR:
-            _LOGGER.warning("More than 1 hour since last update, discarding result")
+        if self._restarted:
+            self._read_gap(start)
+        # The meter interval is split at the end of each hour it crosses
+        start = self._meter.update(start, end, watt)
+        if start is None:
+            _LOGGER.warning(
+                "More than 1 hour since last update, reading it from the recorder"
+            )
+            self._read_gap(end, old_state.last_updated_timestamp)
             return
 
-        self._state += (diff * watt) / (SECONDS_PER_HOUR * WATTS_PER_KW)
-        self.fire_event(watt, old_state.last_updated)
-        self.async_schedule_update_ha_state(True)
+        self.fire_event(watt, start, self._meter.hour)
+        self._publisher.publish(self.native_value)
+
+    def _add_closed_hour(self, hour: LocalHour, energy: float) -> None:
+        self._closed_hours[hour] = energy
+        if len(self._closed_hours) > CLOSED_HOURS_KEPT:
+            del self._closed_hours[next(iter(self._closed_hours))]
 
-    def fire_event(self, power: float, timestamp: datetime) -> bool:
+    def _read_gap(self, end: float, start: float | None = None) -> None:
+        """Read the energy used up to end that meter updates did not count
+        from the recorder.
+
+        The gap starts where counting stopped, which may be the end of an hour
+        closed by the clock, or at start if that is later."""
+        self._restarted = False
+        counted_until = self._meter.counted_until
+        if counted_until is None and start is None:
+            return
+        start = max(start or 0.0, counted_until or 0.0)
+        if end <= start:
+            return
+        # Time up to end is counted by the read
+        self._meter.counted_until = end
+        task = self._hass.async_create_background_task(
+            self._async_read_gap(start, end),
+            f"{DOMAIN} gap {self._effect_sensor_id}",
+        )
+        self._gap_reads.add(task)
+        task.add_done_callback(self._gap_reads.discard)
+
+    async def _async_read_gap(self, start: float, end: float) -> None:
+        """Add the energy of a gap to the current hour, or to the peaks for
+        hours that have been closed since"""
+        hours = await self._coordinator.async_read_hours(start, end)
+        meter = self._meter
+        closed: list[tuple[LocalHour, float]] = []
+        for hour, energy in hours:
+            if energy <= 0:
+                continue
+            if hour == meter.hour:
+                meter.energy = (meter.energy or 0.0) + energy
+                self.fire_event(
+                    meter.last_power or 0.0, self._coordinator.clock.time(), hour
+                )
+                self._publisher.publish(self.native_value)
+            elif meter.hour is None or hour.end <= meter.hour.start:
+                energy += self._closed_hours.get(hour, 0.0)
+                self._add_closed_hour(hour, energy)
+                closed.append((hour, energy))
+        self._coordinator.add_hours(closed)
+        _LOGGER.debug(
+            "Added %.3f kWh used from %s to %s",
+            sum(energy for _, energy in hours),
+            start,
+            end,
+        )
+
+    def fire_event(
+        self, power: float, epoch: float, hour: LocalHour | None = None
+    ) -> bool:
         """Fire HA event so that dependent sensors can update their respective values"""
-        self._coordinator.effectstate.on_next(EnergyData(self._state, power, timestamp))
+        self._coordinator.effectstate.publish(
+            EnergyData(self._meter.energy, power, epoch=epoch, hour=hour)
+        )
         return True
 
     @property
@@ -249,9 +480,10 @@ class GridCapWatcherEnergySensor(RestoreSensor):
 
     @property
     def native_value(self):
-        if self._state is not None:
-            return round(self._state, self._precision)
-        return self._state
+        energy = self._meter.energy
+        if energy is not None:
+            return round(energy, self._precision)
+        return energy
 
     @property
     def icon(self):
@@ -260,12 +492,13 @@ class GridCapWatcherEnergySensor(RestoreSensor):
 
     @property
     def device_info(self) -> DeviceInfo:
-        return _make_device_info(self._effect_sensor_id)
+        return make_device_info(self._effect_sensor_id)
 
 
 class GridCapWatcherEstimatedEnergySensor(SensorEntity):
     """Estimated consumption per hour"""
 
+    _attr_should_poll = False
     _attr_state_class = SensorStateClass.TOTAL
     _attr_native_unit_of_measurement = UnitOfEnergy.KILO_WATT_HOUR
 
@@ -280,20 +513,22 @@ class GridCapWatcherEstimatedEnergySensor(SensorEntity):
                 "sensor.", ""
             )
         )
-
-        self._disposables = []
+        self._publisher = StatePublisher(
+            lambda: self.async_write_ha_state(),
+            get_publish_interval(config, SENSOR_ESTIMATE),
+            rx_coord.clock.monotonic,
+            rx_coord.call_later,
+        )
 
     async def async_added_to_hass(self) -> None:
         """Call when entity about to be added to hass."""
         await super().async_added_to_hass()
-        self._disposables = [
+        self.async_on_remove(self._coordinator.register_publisher(self._publisher))
+        self.async_on_remove(
             self._coordinator.effectstate.subscribe(self._state_change)
-        ]
-
-    async def async_will_remove_from_hass(self) -> None:
-        for d in self._disposables:
-            d.dispose()
+        )
 
+    @callback
     def _state_change(self, state: EnergyData):
         if state is None:
             return
@@ -303,18 +538,11 @@ class GridCapWatcherEstimatedEnergySensor(SensorEntity):
 
         energy = state.energy_consumed
         power = state.current_effect
-        update_time = state.timestamp
-
-        remaining_seconds = seconds_between(
-            start_of_next_hour(update_time), update_time
-        )
+        # Never zero, the end of an hour is the start of the next one
+        remaining_seconds = state.hour.end - state.epoch
 
-        if remaining_seconds == 0:
-            # Avoid division by zero
-            remaining_seconds = 1
-
-        self._state = energy + power * remaining_seconds / SECONDS_PER_HOUR / WATTS_PER_KW
-        self.schedule_update_ha_state()
+        self._state = estimate_hour_energy(energy, power, remaining_seconds)
+        self._publisher.publish(self.native_value)
 
     @property
     def name(self):
@@ -345,12 +573,13 @@ class GridCapWatcherEstimatedEnergySensor(SensorEntity):
 
     @property
     def device_info(self) -> DeviceInfo:
-        return _make_device_info(self._effect_sensor_id)
+        return make_device_info(self._effect_sensor_id)
 
 
 class GridCapWatcherCurrentEffectLevelThreshold(RestoreSensor):
     """Sensor that holds the grid effect level we are at"""
 
+    _attr_should_poll = False
     _attr_state_class = SensorStateClass.MEASUREMENT
     _attr_native_unit_of_measurement = UnitOfEnergy.KILO_WATT_HOUR
 
@@ -358,129 +587,147 @@ class GridCapWatcherCurrentEffectLevelThreshold(RestoreSensor):
         self._hass = hass
         self._effect_sensor_id = config.get(CONF_EFFECT_ENTITY)
         self._coordinator = rx_coord
+        self._precision = get_rounding_precision(config)
         self._state = None
         self._attr_unique_id = (
             f"{DOMAIN}_{self._effect_sensor_id}_grid_effect_threshold_kwh".replace(
                 "sensor.", ""
             )
         )
+        self._publisher = StatePublisher(
+            lambda: self.async_write_ha_state(),
+            get_publish_interval(config, SENSOR_THRESHOLD),
+            rx_coord.clock.monotonic,
+            rx_coord.call_later,
+        )
 
+        # Peak hours of the month, the state only holds a summary of them
         self.attr = {"top_three": []}
-        self._levels = config.get(GRID_LEVELS)
-        self._initialized = False
-        if self._levels:
-            for level in self._levels:
-                price_raw = level.get(LEVEL_PRICE)
-                if isinstance(price_raw, template_helper.Template):
-                    price_raw.hass = hass
-
-        # Subscriptions are set up in async_added_to_hass, after state is restored,
-        # to prevent processing events with an empty top_three.
-        self._disposables = []
-        self._unsub_bus = hass.bus.async_listen(RESET_TOP_THREE, self.handle_reset_event)
-        self._unsub_timer = async_track_point_in_time(
-            hass, self._async_reset_meter, start_of_next_month(dt.as_local(dt.now()))
-        )
+        self._signature: tuple = ()
+        self._levels = LevelTable(config.get(GRID_LEVELS))
+        # Resolved price per level, template prices are set when rendered
+        self._prices: list[float | None] = [
+            None if isinstance(level.price, template_helper.Template) else level.price
+            for level in self._levels
+        ]
 
     async def async_added_to_hass(self) -> None:
         """Call when entity about to be added to hass."""
         await super().async_added_to_hass()
-        savedstate = await self.async_get_last_state()
-        if savedstate:
-            if savedstate.state not in (STATE_UNKNOWN, STATE_UNAVAILABLE):
-                self._state = float(savedstate.state)
-            _restore_top_three(savedstate, self.attr)
-
-        # Subscribe only after restoration so the first callback processes
-        # correct (restored) top_three data and does not emit stale thresholddata.
-        self._initialized = True
-        self._disposables = [
-            self._coordinator.effectstate.subscribe(self._state_change)
+        self.async_on_remove(self._coordinator.register_publisher(self._publisher))
+        self._state = self._coordinator.restored.threshold
+
+        # Templates are rendered when an entity they depend on changes, not
+        # on every meter update.  Refresh to get the initial prices.
+        price_templates = [
+            TrackTemplate(level.price, None)
+            for level in self._levels
+            if isinstance(level.price, template_helper.Template)
         ]
+        if price_templates:
+            for track in price_templates:
+                track.template.hass = self._hass
+            price_tracker = async_track_template_result(
+                self._hass, price_templates, self._async_on_price_template_result
+            )
+            self.async_on_remove(price_tracker.async_remove)
+            price_tracker.async_refresh()
 
-    async def async_will_remove_from_hass(self) -> None:
-        for d in self._disposables:
-            d.dispose()
-        self._unsub_bus()
-        if self._unsub_timer:
-            self._unsub_timer()
+        # Peaks are restored by the coordinator before they are published,
+        # so the first callback never sees an empty or stale month.
+        self.async_on_remove(await self._coordinator.async_track_peaks())
+        self.async_on_remove(self._coordinator.peakdata.subscribe(self._peaks_change))
 
     @callback
-    def _async_reset_meter(self, _):
-        """Resets the attributes so that we don't carry over old values to new month"""
-        self.attr["top_three"] = []
-        self.schedule_update_ha_state(True)
-        _LOGGER.debug("Monthly reset")
-        self._unsub_timer = async_track_point_in_time(
-            self._hass,
-            self._async_reset_meter,
-            start_of_next_month(dt.as_local(dt.now())),
-        )
+    def _async_on_price_template_result(
+        self,
+        event: Event | None,
+        updates: list[TrackTemplateResult],
+    ) -> None:
+        """Handle template result changes for level prices."""
+        for update in updates:
+            for index, level in enumerate(self._levels):
+                if level.price is not update.template:
+                    continue
+                self._prices[index] = self._resolve_price(level, update.result)
+
+        # Publish the new price of the current level
+        peaks = self._coordinator.peakdata.value
+        if peaks is not None:
+            self.calculate_level(peaks)
+
+    @staticmethod
+    def _resolve_price(level: Level, result: Any) -> float | None:
+        if isinstance(result, TemplateError):
+            _LOGGER.error(
+                "Failed to resolve LEVEL_PRICE template for level '%s': %s",
+                level.name,
+                result,
+            )
+            return None
+        try:
+            return float(result)
+        except (ValueError, TypeError) as err:
+            _LOGGER.error(
+                "Failed to resolve LEVEL_PRICE template for level '%s': %s",
+                level.name,
+                err,
+            )
+            return None
 
     @callback
-    def handle_reset_event(self, event):
-        """Handle reset event to reset top three attributes"""
-        self._async_reset_meter(event)
-
-    def _state_change(self, state: EnergyData) -> None:
-        if state is None:
-            return
-        if not self._initialized:
+    def _peaks_change(self, peaks: PeakData) -> None:
+        self.attr["month"] = peaks.month
+        self.attr["top_three"] = [hour._asdict() for hour in peaks.top_three]
+        self._signature = _top_three_signature(peaks.top_three)
+        if not peaks.top_three:
+            # Peaks were reset, show it right away
+            self._publish(immediate=True)
             return
+        self.calculate_level(peaks)
 
-        self.attr["month"] = dt.as_local(dt.now()).month
-        self.attr["top_three"] = calculate_top_three(state, self.attr["top_three"])
-        self.calculate_level()
-
-    def calculate_level(self) -> bool:
+    def calculate_level(self, peaks: PeakData) -> bool:
         """Calculate the grid threshold level based on average of the highest hours"""
-        if not self.attr["top_three"]:
+        if not peaks.top_three:
             return False
 
-        average_value = sum(hour["energy"] for hour in self.attr["top_three"])
-        average_value = average_value / len(self.attr["top_three"])
-
-        found_threshold = self.get_level(average_value)
-
-        if found_threshold is not None:
-            self._state = found_threshold["threshold"]
-            self.schedule_update_ha_state(True)
-
-            price_value = found_threshold["price"]
-            if isinstance(price_value, template_helper.Template):
-                try:
-                    resolved_price = float(price_value.render(parse_result=True))
-                except (TemplateError, ValueError) as err:
-                    _LOGGER.error(
-                        "Failed to resolve LEVEL_PRICE template for level '%s': %s",
-                        found_threshold["name"],
-                        err,
-                    )
-                    return False
-            else:
-                resolved_price = float(price_value)
-
-            # Notify other sensors that threshold level has been updated
-            self._coordinator.thresholddata.on_next(
-                GridThresholdData(
-                    found_threshold["name"],
-                    float(found_threshold["threshold"]),
-                    resolved_price,
-                    [dict(e) for e in self.attr["top_three"]],
-                )
+        index = self._levels.find(peaks.average)
+        if index is None:
+            _LOGGER.warning(
+                "Hourly energy is outside capacity level steps.  Check configuration!"
             )
-        return True
+            return True
 
-    def get_level(self, average: float) -> Any:
-        """Gets the current threshold level"""
-        for level in self._levels:
-            if average - level["threshold"] < 0:
-                return level
+        level = self._levels.levels[index]
+        self._state = level.threshold
+        self._publish()
 
-        _LOGGER.warning(
-            "Hourly energy is outside capacity level steps.  Check configuration!"
+        price = self._prices[index]
+        if price is None:
+            # Template price could not be rendered, error has been logged
+            return False
+
+        # Notify other sensors only if threshold level has been updated
+        counters = self._coordinator.threshold_counters
+        last = self._coordinator.thresholddata.value
+        if (
+            last is not None
+            and last.name == level.name
+            and last.level == level.threshold
+            and last.price == price
+            and _same_peak_hours(last.top_three, peaks.top_three)
+        ):
+            counters.suppressed += 1
+            return True
+
+        counters.emitted += 1
+        self._coordinator.thresholddata.publish(
+            GridThresholdData(level.name, level.threshold, price, peaks.top_three)
         )
-        return None
+        return True
+
+    def _publish(self, immediate: bool = False) -> None:
+        self._publisher.publish((self._state, self._signature), immediate)
 
     @property
     def name(self):
@@ -509,16 +756,20 @@ class GridCapWatcherCurrentEffectLevelThreshold(RestoreSensor):
 
     @property
     def extra_state_attributes(self):
-        return self.attr
+        attributes = _peak_summary(self.attr["top_three"], self._precision)
+        if "month" in self.attr:
+            attributes["month"] = self.attr["month"]
+        return attributes
 
     @property
     def device_info(self) -> DeviceInfo:
-        return _make_device_info(self._effect_sensor_id)
+        return make_device_info(self._effect_sensor_id)
 
 
 class GridCapWatcherAverageThreePeakHours(RestoreSensor):
     """Sensor that holds the average value of the three peak hours this month"""
 
+    _attr_should_poll = False
     _attr_state_class = SensorStateClass.MEASUREMENT
     _attr_native_unit_of_measurement = UnitOfEnergy.KILO_WATT_HOUR
 
@@ -533,75 +784,37 @@ class GridCapWatcherAverageThreePeakHours(RestoreSensor):
                 "sensor.", ""
             )
         )
+        self._publisher = StatePublisher(
+            lambda: self.async_write_ha_state(),
+            get_publish_interval(config, SENSOR_AVERAGE),
+            rx_coord.clock.monotonic,
+            rx_coord.call_later,
+        )
 
+        # Peak hours of the month, the state only holds a summary of them
         self.attr = {"top_three": []}
-        self._initialized = False
-
-        # Subscriptions are set up in async_added_to_hass, after state is restored,
-        # to prevent processing events with an empty top_three.
-        self._disposables = []
-        self._unsub_bus = hass.bus.async_listen(RESET_TOP_THREE, self.handle_reset_event)
-        self._unsub_timer = async_track_point_in_time(
-            hass, self._async_reset_meter, start_of_next_month(dt.as_local(dt.now()))
-        )
+        self._signature: tuple = ()
 
     async def async_added_to_hass(self) -> None:
         """Call when entity about to be added to hass."""
         await super().async_added_to_hass()
-        savedstate = await self.async_get_last_state()
-        if savedstate:
-            if savedstate.state not in (STATE_UNKNOWN, STATE_UNAVAILABLE):
-                self._state = float(savedstate.state)
-            _restore_top_three(savedstate, self.attr)
-
-        # Subscribe only after restoration so the first callback processes
-        # correct (restored) top_three data.  avg maintains its own top_three
-        # independently via effectstate and does NOT consume thresholddata —
-        # that subscription was the root cause of the post-reboot drop bug where
-        # threshold's stale restored top_three overwrote avg's correct data.
-        self._initialized = True
-        self._disposables = [
-            self._coordinator.effectstate.subscribe(self._state_change)
-        ]
+        self.async_on_remove(self._coordinator.register_publisher(self._publisher))
+        self._state = self._coordinator.restored.average
 
-    async def async_will_remove_from_hass(self) -> None:
-        for d in self._disposables:
-            d.dispose()
-        self._unsub_bus()
-        if self._unsub_timer:
-            self._unsub_timer()
+        self.async_on_remove(await self._coordinator.async_track_peaks())
+        self.async_on_remove(self._coordinator.peakdata.subscribe(self._peaks_change))
 
     @callback
-    def _async_reset_meter(self, _):
-        """Resets the attributes so that we don't carry over old values to new month"""
-        self.attr["top_three"] = []
-        self.schedule_update_ha_state(True)
-        _LOGGER.debug("Monthly reset")
-        self._unsub_timer = async_track_point_in_time(
-            self._hass,
-            self._async_reset_meter,
-            start_of_next_month(dt.as_local(dt.now())),
-        )
+    def _peaks_change(self, peaks: PeakData) -> None:
+        self.attr["top_three"] = [hour._asdict() for hour in peaks.top_three]
+        self._signature = _top_three_signature(peaks.top_three)
+        if peaks.average is not None:
+            self._state = peaks.average
+        # An empty list means peaks were reset, show it right away
+        self._publish(immediate=not peaks.top_three)
 
-    @callback
-    def handle_reset_event(self, event):
-        """Handle reset event to reset top three attributes"""
-        self._async_reset_meter(event)
-
-    def _state_change(self, state: EnergyData) -> None:
-        if state is None:
-            return
-        if not self._initialized:
-            return
-
-        self.attr["top_three"] = calculate_top_three(state, self.attr["top_three"])
-
-        if not self.attr["top_three"]:
-            return
-
-        total_sum = sum(float(hour["energy"]) for hour in self.attr["top_three"])
-        self._state = total_sum / len(self.attr["top_three"])
-        self.schedule_update_ha_state(True)
+    def _publish(self, immediate: bool = False) -> None:
+        self._publisher.publish((self.native_value, self._signature), immediate)
 
     @property
     def name(self):
@@ -632,11 +845,11 @@ class GridCapWatcherAverageThreePeakHours(RestoreSensor):
 
     @property
     def extra_state_attributes(self):
-        return self.attr
+        return _peak_summary(self.attr["top_three"], self._precision)
 
     @property
     def device_info(self) -> DeviceInfo:
-        return _make_device_info(self._effect_sensor_id)
+        return make_device_info(self._effect_sensor_id)
 
 
 class GridCapWatcherAvailableEffectRemainingHour(RestoreSensor):
@@ -645,6 +858,7 @@ class GridCapWatcherAvailableEffectRemainingHour(RestoreSensor):
     for the remaining part of current hour
     """
 
+    _attr_should_poll = False
     _attr_state_class = SensorStateClass.MEASUREMENT
     _attr_native_unit_of_measurement = UnitOfPower.WATT
 
@@ -676,23 +890,22 @@ class GridCapWatcherAvailableEffectRemainingHour(RestoreSensor):
                 "sensor.", ""
             )
         )
-
-        # Subscribe after entity is attached to hass to avoid callback-triggered
-        # schedule_update_ha_state calls while self.hass is still None.
-        self._disposables = []
+        self._publisher = StatePublisher(
+            lambda: self.async_write_ha_state(),
+            get_publish_interval(config, SENSOR_AVAILABLE_POWER),
+            rx_coord.clock.monotonic,
+            rx_coord.call_later,
+        )
 
     async def async_added_to_hass(self) -> None:
         """Call when entity about to be added to hass."""
         await super().async_added_to_hass()
+        self.async_on_remove(self._coordinator.register_publisher(self._publisher))
 
-        savedstate = await self.async_get_last_state()
-        if savedstate:
-            if savedstate.state not in (STATE_UNKNOWN, STATE_UNAVAILABLE):
-                self._state = float(savedstate.state)
-            if "grid_threshold_level" in savedstate.attributes:
-                self.attr["grid_threshold_level"] = savedstate.attributes[
-                    "grid_threshold_level"
-                ]
+        restored = self._coordinator.restored
+        self._state = restored.available_power
+        if restored.target_energy is not None:
+            self.attr["grid_threshold_level"] = restored.target_energy
 
         # If target_energy is template-based, start tracking and refresh to get
         # the initial rendered value. This runs after saved-state restoration so
@@ -707,17 +920,17 @@ class GridCapWatcherAvailableEffectRemainingHour(RestoreSensor):
             )
             self._unsub_target_template.async_refresh()
 
-        if savedstate:
+        if restored.available_power is not None or restored.target_energy is not None:
             self.__calculate()
 
-        self._disposables = [
-            self._coordinator.thresholddata.subscribe(self._threshold_state_change),
-            self._coordinator.effectstate.subscribe(self._effect_state_change),
-        ]
+        self.async_on_remove(
+            self._coordinator.thresholddata.subscribe(self._threshold_state_change)
+        )
+        self.async_on_remove(
+            self._coordinator.effectstate.subscribe(self._effect_state_change)
+        )
 
     async def async_will_remove_from_hass(self) -> None:
-        for d in self._disposables:
-            d.dispose()
         if self._unsub_target_template is not None:
             self._unsub_target_template.async_remove()
 
@@ -748,22 +961,27 @@ class GridCapWatcherAvailableEffectRemainingHour(RestoreSensor):
             updated = True
         if updated:
             self.__calculate()
-            self.schedule_update_ha_state(True)
+            self._publish()
 
+    @callback
     def _threshold_state_change(self, state: GridThresholdData):
         if state is None:
             return
         self.attr["grid_threshold_level"] = state.level
         self.__calculate()
-        self.schedule_update_ha_state(True)
+        self._publish()
 
+    @callback
     def _effect_state_change(self, state: EnergyData):
         if state is None:
             return
         self._energy = state.energy_consumed
         self._effect = state.current_effect
         self.__calculate()
-        self.schedule_update_ha_state(True)
+        self._publish()
+
+    def _publish(self) -> None:
+        self._publisher.publish((self.native_value, self.attr["grid_threshold_level"]))
 
     def __calculate(self):
         if (
@@ -781,30 +999,13 @@ class GridCapWatcherAvailableEffectRemainingHour(RestoreSensor):
         else:
             threshold_energy = float(self._target_energy)
 
-        remaining_kwh = threshold_energy - self._energy
-
-        seconds_remaining = seconds_between(start_of_next_hour(dt.now()), dt.now())
-        seconds_remaining = max(seconds_remaining, 1)
-
-        watt_seconds = remaining_kwh * SECONDS_PER_HOUR * WATTS_PER_KW
-
-        power = watt_seconds / seconds_remaining - self._effect
-
-        if self._max_effect is not None and float(self._max_effect) < power:
-            # Max effect threshold exceeded,
-            # we should display max_effect - current_effect from meter
-            power = float(self._max_effect) - self._effect
-
-        if (
-            self._max_effect is not None
-            and power < 0
-            and float(self._max_effect) * -1 > power
-        ):
-            # Do not exceed threshold in negative direction either.
-            # Purely cosmetic, but it messes up scale on graph.
-            power = float(self._max_effect) * -1
-
-        self._state = power
+        seconds_remaining = LOCAL_HOURS.seconds_to_next_hour(
+            self._coordinator.clock.time()
+        )
+        max_effect = None if self._max_effect is None else float(self._max_effect)
+        self._state = available_power(
+            threshold_energy, self._energy, self._effect, seconds_remaining, max_effect
+        )
 
         return True
 
@@ -841,41 +1042,46 @@ class GridCapWatcherAvailableEffectRemainingHour(RestoreSensor):
 
     @property
     def device_info(self) -> DeviceInfo:
-        return _make_device_info(self._effect_sensor_id)
+        return make_device_info(self._effect_sensor_id)
 
 
 class GridCapacityWatcherCurrentLevelName(RestoreSensor):
     """Sensor that displays the current grid capacity level name."""
 
+    _attr_should_poll = False
+
     def __init__(self, hass, config, rx_coord: GridCapacityCoordinator):
         self._coordinator = rx_coord
         self._hass = hass
         self._effect_sensor_id = config.get(CONF_EFFECT_ENTITY)
         self._state = None
-        self._attr_unique_id = f"{DOMAIN}_effect_level_name".replace("sensor.", "")
-
-        self._disposables = []
+        self._attr_unique_id = (
+            f"{DOMAIN}_{self._effect_sensor_id}_effect_level_name".replace(
+                "sensor.", ""
+            )
+        )
+        self._publisher = StatePublisher(
+            lambda: self.async_write_ha_state(),
+            get_publish_interval(config, SENSOR_LEVEL_NAME),
+            rx_coord.clock.monotonic,
+            rx_coord.call_later,
+        )
 
+    @callback
     def _threshold_state_change(self, state: GridThresholdData):
         if state is None:
             return
         self._state = state.name
-        self.schedule_update_ha_state(True)
+        self._publisher.publish(self._state)
 
     async def async_added_to_hass(self) -> None:
         """Call when entity about to be added to hass."""
         await super().async_added_to_hass()
-        savedstate = await self.async_get_last_state()
-        if savedstate:
-            if savedstate.state not in (STATE_UNKNOWN, STATE_UNAVAILABLE):
-                self._state = savedstate.state
-        self._disposables = [
+        self.async_on_remove(self._coordinator.register_publisher(self._publisher))
+        self._state = self._coordinator.restored.level_name
+        self.async_on_remove(
             self._coordinator.thresholddata.subscribe(self._threshold_state_change)
-        ]
-
-    async def async_will_remove_from_hass(self) -> None:
-        for d in self._disposables:
-            d.dispose()
+        )
 
     @property
     def name(self):
@@ -904,12 +1110,13 @@ class GridCapacityWatcherCurrentLevelName(RestoreSensor):
 
     @property
     def device_info(self) -> DeviceInfo:
-        return _make_device_info(self._effect_sensor_id)
+        return make_device_info(self._effect_sensor_id)
 
 
 class GridCapacityWatcherCurrentLevelPrice(RestoreSensor):
     """Sensor that displays the current grid capacity level price."""
 
+    _attr_should_poll = False
     _attr_state_class = SensorStateClass.MEASUREMENT
 
     # TODO: How to globalize this??
@@ -920,30 +1127,33 @@ class GridCapacityWatcherCurrentLevelPrice(RestoreSensor):
         self._hass = hass
         self._effect_sensor_id = config.get(CONF_EFFECT_ENTITY)
         self._state = None
-        self._attr_unique_id = f"{DOMAIN}_effect_level_price".replace("sensor.", "")
-
-        self._disposables = []
+        self._attr_unique_id = (
+            f"{DOMAIN}_{self._effect_sensor_id}_effect_level_price".replace(
+                "sensor.", ""
+            )
+        )
+        self._publisher = StatePublisher(
+            lambda: self.async_write_ha_state(),
+            get_publish_interval(config, SENSOR_LEVEL_PRICE),
+            rx_coord.clock.monotonic,
+            rx_coord.call_later,
+        )
 
+    @callback
     def _threshold_state_change(self, state: GridThresholdData):
         if state is None:
             return
         self._state = state.price
-        self.schedule_update_ha_state(True)
+        self._publisher.publish(self._state)
 
     async def async_added_to_hass(self) -> None:
         """Call when entity about to be added to hass."""
         await super().async_added_to_hass()
-        savedstate = await self.async_get_last_state()
-        if savedstate:
-            if savedstate.state not in (STATE_UNKNOWN, STATE_UNAVAILABLE):
-                self._state = savedstate.state
-        self._disposables = [
+        self.async_on_remove(self._coordinator.register_publisher(self._publisher))
+        self._state = self._coordinator.restored.level_price
+        self.async_on_remove(
             self._coordinator.thresholddata.subscribe(self._threshold_state_change)
-        ]
-
-    async def async_will_remove_from_hass(self) -> None:
-        for d in self._disposables:
-            d.dispose()
+        )
 
     @property
     def name(self):
@@ -972,4 +1182,4 @@ class GridCapacityWatcherCurrentLevelPrice(RestoreSensor):
 
     @property
     def device_info(self) -> DeviceInfo:
-        return _make_device_info(self._effect_sensor_id)
+        return make_device_info(self._effect_sensor_id)
@@ -0,0 +1,114 @@
+"""Persistent storage of monthly peak hours for energytariff."""
+
+from __future__ import annotations
+
+import asyncio
+from typing import Any
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.storage import Store
+from homeassistant.util import slugify
+
+from .clock import Clock
+from .const import DOMAIN
+from .engine import LocalHour
+from .utils import LOCAL_HOURS
+
+STORAGE_VERSION = 1
+
+# Peak hours change on nearly every meter event during a peak hour,
+# so saves are batched and written at most this often.
+SAVE_DELAY = 30
+
+# Key of the peaks tracked by the coordinator
+MONTH_PEAKS = "month"
+
+
+class PeakStore:
+    """Holds the monthly top three hours of an energytariff instance.
+
+    Peaks are kept per key, tagged with the year and month they were
+    saved in, so data from a previous month is never restored.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        effect_sensor_id: str | None,
+        clock: Clock | None = None,
+    ):
+        self._store: Store[dict[str, Any]] = Store(
+            hass,
+            STORAGE_VERSION,
+            f"{DOMAIN}.{slugify(effect_sensor_id or DOMAIN)}",
+        )
+        self._clock = clock or Clock()
+        self._data: dict[str, Any] | None = None
+        self._load_lock = asyncio.Lock()
+        self._save_scheduled = False
+
+    async def async_load(self) -> dict[str, Any]:
+        """Load stored data once, later calls return the cached data"""
+        async with self._load_lock:
+            if self._data is None:
+                self._data = await self._store.async_load() or {}
+                self._data.setdefault("peaks", {})
+        return self._data
+
+    async def async_get_top_three(self, key: str) -> list[dict[str, Any]] | None:
+        """Return stored top three hours for current month.
+        Returns None if nothing has been stored for this sensor yet"""
+        data = await self.async_load()
+        stored = data["peaks"].get(key)
+        if stored is None:
+            return None
+
+        now = self._now()
+        if stored.get("year") != now.year or stored.get("month") != now.month:
+            return []
+        return [dict(item) for item in stored.get("top_three", [])]
+
+    @callback
+    def async_set_top_three(
+        self, key: str, top_three: list[dict[str, Any]], year: int, month: int
+    ) -> None:
+        """Set the top three hours of year and month for a key and schedule a
+        delayed save"""
+        if self._data is None:
+            self._data = {"peaks": {}}
+        peaks = self._data["peaks"]
+        stored = peaks.get(key)
+        # Sensors update their list in place, so a new entry is only needed
+        # when the list itself is replaced
+        if stored is None or stored["top_three"] is not top_three:
+            stored = peaks[key] = {"top_three": top_three}
+        # The save is delayed and can run after the month has ended
+        stored["year"] = year
+        stored["month"] = month
+        if self._save_scheduled:
+            return
+        self._save_scheduled = True
+        self._store.async_delay_save(self._data_to_save, SAVE_DELAY)
+
+    async def async_remove(self) -> None:
+        """Remove stored peaks, including a pending save"""
+        self._data = {"peaks": {}}
+        self._save_scheduled = False
+        await self._store.async_remove()
+
+    @callback
+    def _data_to_save(self) -> dict[str, Any]:
+        """Return data to be written, each key with the month of its peaks"""
+        self._save_scheduled = False
+        peaks = {}
+        for key, value in self._data["peaks"].items():
+            peaks[key] = {
+                "year": value["year"],
+                "month": value["month"],
+                "top_three": [dict(item) for item in value["top_three"]],
+            }
+        return {"peaks": peaks}
+
+    def _now(self) -> LocalHour:
+        """Return the current local hour, by the clock of the coordinator"""
+        return LOCAL_HOURS.hour_at(self._clock.time())
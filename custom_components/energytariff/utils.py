@@ -1,64 +1,28 @@
 from __future__ import annotations
 
-from datetime import datetime, timedelta
 from typing import Any
 
-from homeassistant.util import dt
-
 from homeassistant.const import (
     STATE_UNAVAILABLE,
     STATE_UNKNOWN,
 )
+from homeassistant.helpers.device_registry import DeviceInfo
+from homeassistant.util import dt
 
-from custom_components.energytariff.coordinator import EnergyData
-
-from .const import ROUNDING_PRECISION
-
+from .const import DOMAIN, PUBLISH_INTERVAL, ROUNDING_PRECISION
+from .engine import LocalHours
 
-def start_of_current_hour(date_object: datetime) -> datetime:
-    """Returns a datetime object which is set to start of input objects current time"""
-    return datetime(
-        date_object.year,
-        date_object.month,
-        date_object.day,
-        date_object.hour,
-        0,
-        0,
-        tzinfo=date_object.tzinfo,
-    )
+# Shared by all sensors, boundaries only depend on the configured time zone
+LOCAL_HOURS = LocalHours(dt.get_default_time_zone)
 
 
-def start_of_next_hour(date_object: datetime) -> datetime:
-    """returns a datetime object that is the start of next hour"""
-    temp = date_object + timedelta(hours=1)
-    value = datetime(
-        temp.year,
-        temp.month,
-        temp.day,
-        temp.hour,
-        0,
-        0,
-        tzinfo=temp.tzinfo,
+def make_device_info(effect_sensor_id: str) -> DeviceInfo:
+    """Return shared DeviceInfo for all energytariff entities of a meter."""
+    return DeviceInfo(
+        identifiers={(DOMAIN, effect_sensor_id)},
+        name="Energy Tariff",
+        manufacturer="energytariff",
     )
-    return value
-
-
-def start_of_next_month(date_object: datetime) -> datetime:
-    """Returns a datetime object that is set at start of next month + 1 second."""
-    if date_object.month == 12:
-        month = 1
-        year = date_object.year + 1
-    else:
-        month = date_object.month + 1
-        year = date_object.year
-
-    value = datetime(year, month, 1, 0, 0, 1, 0, tzinfo=date_object.tzinfo)
-    return value
-
-
-def seconds_between(date_object_1: datetime, date_object_2: datetime) -> int:
-    """Returns number of seconds between two dates"""
-    return (date_object_1 - date_object_2).total_seconds()
 
 
 def get_rounding_precision(config: dict[str, Any]) -> int:
@@ -71,6 +35,19 @@ def get_rounding_precision(config: dict[str, Any]) -> int:
     return int(precision)
 
 
+def get_publish_interval(config: dict[str, Any], sensor_key: str) -> float:
+    """Gets minimum number of seconds between state writes for a sensor.
+    Config value is either a number for all sensors, or a mapping per sensor.
+    Default to 0, which writes every change of the rounded value"""
+    interval = config.get(PUBLISH_INTERVAL)
+    if isinstance(interval, dict):
+        interval = interval.get(sensor_key)
+    if interval is None:
+        return 0
+
+    return float(interval)
+
+
 def convert_to_watt(data: Any) -> float:
     """Converts input sensor data to watt, if needed"""
     if data.state in (STATE_UNKNOWN, STATE_UNAVAILABLE):
@@ -86,61 +63,3 @@ def convert_to_watt(data: Any) -> float:
         if unit != "W":
             return None
     return value
-
-
-def calculate_top_three(state: EnergyData, top_three: Any) -> Any:
-    """Maintains the list of top three hours for a month"""
-
-    if state is None:
-        return top_three
-
-    localtime = dt.as_local(state.timestamp)
-
-    energy_used = state.energy_consumed
-
-    # Solar or wind production can cause the energy meter to have negative values
-    # Set this to 0, as tariffs are only for consumption and we don't have negative
-    # tariff values in the tariff config section.
-    energy_used = max(energy_used, 0)
-
-    consumption = {
-        "month": localtime.month,
-        "day": localtime.day,
-        "hour": localtime.hour,
-        "energy": energy_used,
-    }
-
-    # Case 1: Empty list. Uncritically add, calculate level and return
-    if not top_three:
-        top_three.append(consumption)
-        return top_three
-
-    # Case 2: Items in list.  If any are same day as consumption-item,
-    # update that one if energy is higher.  Recalculate and return
-    for i, item in enumerate(top_three):
-        # Entries without a month field are treated as same-month (backward compat)
-        entry_month = int(item.get("month", consumption["month"]))
-        if entry_month == int(consumption["month"]) and int(item["day"]) == int(consumption["day"]):
-            if item["energy"] < consumption["energy"]:
-                top_three[i]["energy"] = consumption["energy"]
-                top_three[i]["hour"] = consumption["hour"]
-            return top_three
-
-    # Case 3: We are not on the same day as any items in the list,
-    # but have less than 3 items in list.
-    # Add, re-calculate and return
-    if len(top_three) < 3:
-        top_three.append(consumption)
-        return top_three
-
-    # Case 4: Not same day, list has three elements.
-    # If lowest level has lower consumption, replace element,
-    # recalculate and return
-    top_three.sort(key=lambda x: x["energy"])
-    for i, item in enumerate(top_three):
-        if item["energy"] < consumption["energy"]:
-            top_three[i] = consumption
-            return top_three
-
-    # If we got this far, list has no changes, so return it as-is.
-    return top_three
@@ -0,0 +1,219 @@
+"""Live tariff data of energytariff instances over the websocket API.
+
+The frontend subscribes to an instance by the entity id of its meter and
+gets a frame for every meter update, without anything being written to the
+state machine or the recorder:
+
+    {"type": "energytariff/subscribe", "entity_id": "sensor.power", "interval": 5}
+
+A frame holds its time in epoch seconds, power in W, energy used and
+estimated this hour in kWh, the threshold of the current level in kWh and
+the power available for the rest of the hour in W.  The time is where the
+meter interval counted by the update starts, as for the sensors.  With
+interval set, frames are sent at most once per interval seconds of meter
+time, and always for the last and first update of an hour and when the
+threshold changes.
+
+The peak hours of the month, which the sensors only summarize in their
+state, are sent once on request:
+
+    {"type": "energytariff/peaks", "entity_id": "sensor.power"}
+"""
+
+from __future__ import annotations
+
+from collections.abc import Callable
+from typing import Any
+
+import homeassistant.helpers.config_validation as cv
+import voluptuous as vol
+from homeassistant.components import websocket_api
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+
+from .const import DOMAIN, DOMAIN_DATA, MAX_EFFECT_ALLOWED
+from .coordinator import (
+    EnergyData,
+    GridCapacityCoordinator,
+    GridThresholdData,
+    async_get_coordinator,
+)
+from .engine import LocalHour, available_power, estimate_hour_energy
+from .utils import get_rounding_precision
+
+# Key in hass.data[DOMAIN_DATA]
+WEBSOCKET_REGISTERED = "websocket_registered"
+
+
+@callback
+def async_register_websocket(hass: HomeAssistant) -> None:
+    """Register the websocket command, once"""
+    domain_data = hass.data.setdefault(DOMAIN_DATA, {})
+    if not domain_data.get(WEBSOCKET_REGISTERED):
+        websocket_api.async_register_command(hass, websocket_subscribe)
+        websocket_api.async_register_command(hass, websocket_peaks)
+        domain_data[WEBSOCKET_REGISTERED] = True
+
+
+class LiveFrames:
+    """Builds frames from the meter updates and thresholds of a coordinator.
+
+    Frames are passed to send, decimated to one per interval seconds of
+    meter time.
+    """
+
+    def __init__(
+        self,
+        coordinator: GridCapacityCoordinator,
+        send: Callable[[dict[str, Any]], None],
+        interval: float = 0,
+    ) -> None:
+        self._coordinator = coordinator
+        self._send = send
+        self._interval = interval
+        self._precision = get_rounding_precision(coordinator.config)
+        max_power = coordinator.config.get(MAX_EFFECT_ALLOWED)
+        self._max_power = None if max_power is None else float(max_power)
+        self._threshold: float | None = None
+        self._last: EnergyData | None = None
+        # Last update that was held back by the interval
+        self._pending: EnergyData | None = None
+        self._sent_at = 0.0
+        self._sent_hour: LocalHour | None = None
+
+    @callback
+    def start(self) -> CALLBACK_TYPE:
+        """Subscribe to the coordinator, the last values are sent at once.
+        Returns a function that ends the subscription"""
+        unsubscribers = (
+            self._coordinator.thresholddata.subscribe(self._threshold_changed),
+            self._coordinator.effectstate.subscribe(self._meter_update),
+        )
+
+        @callback
+        def _stop() -> None:
+            for unsubscribe in unsubscribers:
+                unsubscribe()
+
+        return _stop
+
+    @callback
+    def _threshold_changed(self, data: GridThresholdData) -> None:
+        if data.level == self._threshold:
+            return
+        self._threshold = data.level
+        if self._last is not None:
+            self._send_frame(self._last)
+
+    @callback
+    def _meter_update(self, data: EnergyData) -> None:
+        if data.energy_consumed is None or data.current_effect is None:
+            return
+        self._last = data
+        if data.hour != self._sent_hour:
+            # The final values of an hour are not dropped
+            if self._pending is not None:
+                self._send_frame(self._pending)
+            self._send_frame(data)
+        elif data.epoch - self._sent_at >= self._interval:
+            self._send_frame(data)
+        else:
+            self._pending = data
+
+    def _send_frame(self, data: EnergyData) -> None:
+        self._pending = None
+        self._sent_at = data.epoch
+        self._sent_hour = data.hour
+        precision = self._precision
+        energy = data.energy_consumed
+        power = data.current_effect
+        seconds_left = data.hour.end - data.epoch
+        available = None
+        if self._threshold is not None:
+            available = round(
+                available_power(
+                    self._threshold, energy, power, seconds_left, self._max_power
+                ),
+                precision,
+            )
+        self._send(
+            {
+                "time": data.epoch,
+                "power": round(power, precision),
+                "energy": round(energy, precision),
+                "estimate": round(
+                    estimate_hour_energy(energy, power, seconds_left), precision
+                ),
+                "threshold": self._threshold,
+                "available": available,
+            }
+        )
+
+
+def _get_coordinator(
+    hass: HomeAssistant, connection: websocket_api.ActiveConnection, msg: dict[str, Any]
+) -> GridCapacityCoordinator | None:
+    """Returns the instance of the meter of a message, or sends an error"""
+    coordinator = async_get_coordinator(hass, msg["entity_id"])
+    if coordinator is None:
+        connection.send_error(
+            msg["id"],
+            websocket_api.ERR_NOT_FOUND,
+            f"No {DOMAIN} instance for {msg['entity_id']}",
+        )
+    return coordinator
+
+
+@websocket_api.websocket_command(
+    {
+        vol.Required("type"): f"{DOMAIN}/subscribe",
+        vol.Required("entity_id"): cv.entity_id,
+        vol.Optional("interval", default=0): vol.All(
+            vol.Coerce(float), vol.Range(min=0)
+        ),
+    }
+)
+@callback
+def websocket_subscribe(
+    hass: HomeAssistant,
+    connection: websocket_api.ActiveConnection,
+    msg: dict[str, Any],
+) -> None:
+    """Subscribe to the live data of the instance of a meter"""
+    coordinator = _get_coordinator(hass, connection, msg)
+    if coordinator is None:
+        return
+
+    @callback
+    def _send(frame: dict[str, Any]) -> None:
+        connection.send_event(msg["id"], frame)
+
+    frames = LiveFrames(coordinator, _send, msg["interval"])
+    connection.send_result(msg["id"])
+    connection.subscriptions[msg["id"]] = frames.start()
+
+
+@websocket_api.websocket_command(
+    {
+        vol.Required("type"): f"{DOMAIN}/peaks",
+        vol.Required("entity_id"): cv.entity_id,
+    }
+)
+@callback
+def websocket_peaks(
+    hass: HomeAssistant,
+    connection: websocket_api.ActiveConnection,
+    msg: dict[str, Any],
+) -> None:
+    """Send the peak hours of the month of the instance of a meter"""
+    coordinator = _get_coordinator(hass, connection, msg)
+    if coordinator is None:
+        return
+    peaks = coordinator.peaks
+    connection.send_result(
+        msg["id"],
+        {
+            "year": peaks.year,
+            "month": peaks.month,
+            "top_three": [dict(hour) for hour in peaks.top_three],
+        },
+    )
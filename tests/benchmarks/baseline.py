@@ -0,0 +1,95 @@
+"""Stored benchmark results, used to flag regressions.
+
+Results are kept in baseline.json next to this module.  The environment
+variable ENERGYTARIFF_BENCHMARK selects what a benchmark run does with them:
+
+- unset: print each metric next to its baseline value
+- ``compare``: fail the benchmark if a metric is worse than its baseline
+- ``save``: store the new results as baseline
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import platform
+from pathlib import Path
+
+import pytest
+
+BASELINE_FILE = Path(__file__).with_name("baseline.json")
+MODE_ENV = "ENERGYTARIFF_BENCHMARK"
+# Allowed relative regression, timings vary between runs on the same machine
+TOLERANCE_ENV = "ENERGYTARIFF_BENCHMARK_TOLERANCE"
+DEFAULT_TOLERANCE = 0.25
+
+HIGHER_IS_BETTER = {"events_per_second"}
+# Absolute slack per metric, for values that are close to zero
+SLACK = {
+    "writes_per_event": 0.01,
+    "peak_alloc_bytes": 512,
+    "retained_bytes_per_event": 16,
+    "setup_seconds": 0.02,
+    "restore_seconds": 0.02,
+}
+# Counts that do not depend on the speed of the machine
+EXACT = {"writes_per_event", "timers"}
+
+
+def load_baseline() -> dict:
+    """Return stored results, an empty baseline if none are stored."""
+    if not BASELINE_FILE.exists():
+        return {}
+    return json.loads(BASELINE_FILE.read_text(encoding="utf-8"))
+
+
+def _save(group: str, name: str, metrics: dict[str, float]) -> None:
+    baseline = load_baseline()
+    baseline["machine"] = {
+        "python": platform.python_version(),
+        "platform": platform.platform(terse=True),
+    }
+    baseline.setdefault(group, {})[name] = metrics
+    BASELINE_FILE.write_text(
+        json.dumps(baseline, indent=2, sort_keys=True) + "\n", encoding="utf-8"
+    )
+
+
+def regressions(
+    metrics: dict[str, float], stored: dict[str, float], tolerance: float
+) -> list[str]:
+    """Return a description of each metric that is worse than stored."""
+    found = []
+    for key, value in metrics.items():
+        if key not in stored:
+            continue
+        old = stored[key]
+        allowed = 0.0 if key in EXACT else tolerance
+        slack = SLACK.get(key, 0)
+        if key in HIGHER_IS_BETTER:
+            worse = value < old * (1 - allowed) - slack
+        else:
+            worse = value > old * (1 + allowed) + slack
+        if worse:
+            found.append(f"{key}: {value} (baseline {old})")
+    return found
+
+
+def check(group: str, name: str, metrics: dict[str, float]) -> None:
+    """Report metrics against the baseline and act on ENERGYTARIFF_BENCHMARK."""
+    mode = os.environ.get(MODE_ENV, "")
+    stored = load_baseline().get(group, {}).get(name, {})
+    for key, value in metrics.items():
+        old = stored.get(key)
+        change = ""
+        if old:
+            change = f" ({(value - old) / old:+.0%} vs baseline {old})"
+        print(f"  {name} {key}: {value}{change}")
+
+    if mode == "save":
+        _save(group, name, metrics)
+    elif mode == "compare":
+        tolerance = float(os.environ.get(TOLERANCE_ENV, DEFAULT_TOLERANCE))
+        worse = regressions(metrics, stored, tolerance)
+        if worse:
+            pytest.fail(f"{name} regressed: " + ", ".join(worse))
@@ -0,0 +1,129 @@
+"""Shared harness for energytariff benchmarks."""
+
+from __future__ import annotations
+
+import csv
+import gc
+import itertools
+import os
+import time
+import tracemalloc
+from collections.abc import Iterator
+
+from homeassistant.const import EVENT_STATE_CHANGED, EVENT_STATE_REPORTED
+from homeassistant.core import Event, HomeAssistant, callback
+
+from ..common import METER_ENTITY, EventLoopStats, synthetic_power
+
+# Replayed stream lengths and meter cadences, in seconds
+SPANS = {"day": 86400, "week": 7 * 86400, "month": 30 * 86400}
+CADENCES = {"1s": 1.0, "2s": 2.0, "10Hz": 0.1}
+
+# CSV file with a recorded meter stream, power in W in the last column
+STREAM_ENV = "ENERGYTARIFF_BENCHMARK_STREAM"
+
+
+def meter_power() -> Iterator[float]:
+    """Return meter readings in watts, endlessly.
+
+    Readings come from the CSV file named by ENERGYTARIFF_BENCHMARK_STREAM
+    when it is set, repeated as needed, otherwise from synthetic_power."""
+    path = os.environ.get(STREAM_ENV)
+    if not path:
+        return (synthetic_power(index) for index in itertools.count())
+
+    readings = []
+    with open(path, newline="", encoding="utf-8") as stream:
+        for row in csv.reader(stream):
+            try:
+                readings.append(float(row[-1]))
+            except (IndexError, ValueError):
+                # Header or empty line
+                continue
+    if not readings:
+        raise ValueError(f"No meter readings in {path}")
+    return itertools.cycle(readings)
+
+
+async def async_replay_stream(
+    hass: HomeAssistant,
+    events: int,
+    interval: float,
+    start: float | None = None,
+    warmup: int = 1000,
+    alloc_window: int = 5000,
+    batch: int = 1000,
+    meter_entity: str = METER_ENTITY,
+) -> EventLoopStats:
+    """Feed a long meter stream through the state machine.
+
+    The first events warm up caches.  The next alloc_window events are traced
+    one by one for allocations, the rest are timed in batches, so the time
+    per event includes the sensor state writes but not the tracing."""
+    stats = EventLoopStats()
+    if start is None:
+        start = time.time()
+    attributes = {"unit_of_measurement": "W"}
+    power = meter_power()
+
+    @callback
+    def count_write(event: Event) -> None:
+        entity_id = event.data["entity_id"]
+        stats.state_writes += 1
+        stats.writes_per_entity[entity_id] = (
+            stats.writes_per_entity.get(entity_id, 0) + 1
+        )
+
+    @callback
+    def not_meter(event_data) -> bool:
+        return event_data["entity_id"] != meter_entity
+
+    def set_meter(index: int) -> None:
+        hass.states.async_set(
+            meter_entity,
+            f"{next(power):.0f}",
+            attributes,
+            force_update=True,
+            timestamp=start + index * interval,
+        )
+
+    warm = min(warmup, events)
+    for index in range(warm):
+        set_meter(index)
+    await hass.async_block_till_done()
+
+    window = min(alloc_window, events - warm)
+    if window:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            baseline, _ = tracemalloc.get_traced_memory()
+            for index in range(warm, warm + window):
+                current, _ = tracemalloc.get_traced_memory()
+                tracemalloc.reset_peak()
+                set_meter(index)
+                _, peak = tracemalloc.get_traced_memory()
+                stats.alloc_peak_bytes = max(stats.alloc_peak_bytes, peak - current)
+            await hass.async_block_till_done()
+            gc.collect()
+            stats.alloc_retained_bytes = tracemalloc.get_traced_memory()[0] - baseline
+            stats.alloc_events = window
+        finally:
+            tracemalloc.stop()
+
+    unsubs = [
+        hass.bus.async_listen(EVENT_STATE_CHANGED, count_write, not_meter),
+        hass.bus.async_listen(EVENT_STATE_REPORTED, count_write, not_meter),
+    ]
+    timed = warm + window
+    begin = time.perf_counter()
+    for first in range(timed, events, batch):
+        for index in range(first, min(first + batch, events)):
+            set_meter(index)
+        await hass.async_block_till_done()
+    stats.loop_seconds = time.perf_counter() - begin
+    stats.events = events - timed
+
+    for unsub in unsubs:
+        unsub()
+    return stats
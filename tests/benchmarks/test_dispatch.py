@@ -0,0 +1,60 @@
+"""Benchmark of coordinator import time and per-event dispatch cost.
+
+Run with: pytest -m benchmark -s tests/benchmarks
+"""
+
+import subprocess
+import sys
+import timeit
+
+import pytest
+
+from custom_components.energytariff.coordinator import EnergyData, ReplaySignal
+
+LISTENERS = 4
+DISPATCHES = 200_000
+
+
+def _import_profile(module: str) -> dict[str, int]:
+    """Return cumulative import time in microseconds per module, in a fresh interpreter."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    profile = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        profile[name.strip()] = int(cumulative)
+    return profile
+
+
+@pytest.mark.benchmark
+def test_coordinator_import_time():
+    """Measure the import cost of the coordinator module."""
+    profile = _import_profile("custom_components.energytariff.coordinator")
+
+    print(
+        "coordinator import: "
+        f"{profile['custom_components.energytariff.coordinator'] / 1000:.1f} ms"
+    )
+    assert "reactivex" not in profile
+
+
+@pytest.mark.benchmark
+def test_replay_signal_dispatch_cost():
+    """Measure the cost of publishing one meter update to typical listeners."""
+    signal = ReplaySignal()
+    for _ in range(LISTENERS):
+        signal.subscribe(lambda value: None)
+    data = EnergyData(1.0, 1000.0, None)
+
+    seconds = timeit.timeit(lambda: signal.publish(data), number=DISPATCHES)
+
+    print(
+        f"ReplaySignal publish to {LISTENERS} listeners: "
+        f"{seconds / DISPATCHES * 1e6:.2f} us"
+    )
@@ -0,0 +1,103 @@
+"""Replay throughput of the sensor platform, compared with a stored baseline.
+
+Meter streams of a day, a week and a month are replayed at 1 s, 2 s and
+10 Hz cadence through the entities set up by async_setup_platform.  The
+hot path functions are also timed on their own.
+
+Run with: pytest -m benchmark -s tests/benchmarks/test_replay.py
+Quick run: add -k "day" to only replay a day.
+See baseline.py for comparing with and saving the baseline.
+"""
+
+import time
+import timeit
+from datetime import timedelta
+
+import pytest
+from homeassistant.core import Event, State
+from homeassistant.helpers.entity_platform import async_get_platforms
+from homeassistant.util import dt
+
+from custom_components.energytariff.const import DOMAIN
+from custom_components.energytariff.coordinator import EnergyData, PeakTracker
+
+from ..common import METER_ENTITY, async_setup_energytariff, synthetic_power
+from .baseline import check
+from .common import CADENCES, SPANS, async_replay_stream
+
+HOT_PATH_CALLS = 20_000
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("span", list(SPANS))
+@pytest.mark.parametrize("cadence", list(CADENCES))
+async def test_replay_throughput(hass, span, cadence):
+    """Replay a meter stream and report throughput, writes and allocations."""
+    await async_setup_energytariff(hass)
+    interval = CADENCES[cadence]
+
+    stats = await async_replay_stream(hass, int(SPANS[span] / interval), interval)
+
+    name = f"{span}-{cadence}"
+    print(f"\n{stats.report(f'replay {name}')}")
+    check("replay", name, stats.metrics())
+    assert stats.tasks_per_event == 0
+
+
+def _per_call(function, number: int = HOT_PATH_CALLS) -> float:
+    """Return the best time of a call in microseconds."""
+    return round(
+        min(timeit.repeat(function, number=number, repeat=5)) / number * 1e6, 3
+    )
+
+
+@pytest.mark.benchmark
+async def test_hot_path(hass):
+    """Time the functions that run for every meter event."""
+    await async_setup_energytariff(hass)
+    entities = async_get_platforms(hass, DOMAIN)[0].entities
+    energy = entities["sensor.energy_used_this_hour"]
+    available = entities["sensor.available_power_this_hour"]
+    threshold = entities["sensor.energy_level_upper_threshold"]
+
+    start = dt.utcnow()
+    attributes = {"unit_of_measurement": "W"}
+    states = [
+        State(
+            METER_ENTITY,
+            f"{synthetic_power(index):.0f}",
+            attributes,
+            last_updated=start + timedelta(seconds=2 * index),
+        )
+        for index in range(HOT_PATH_CALLS * 5 + 1)
+    ]
+    meter_events = iter(
+        [
+            Event("state_changed", {"old_state": old, "new_state": new})
+            for old, new in zip(states, states[1:])
+        ]
+    )
+
+    tracker = PeakTracker()
+    base = time.time()
+    updates = iter(
+        [
+            EnergyData(index % 1800 * 0.001, 3600.0, epoch=base + index * 2)
+            for index in range(HOT_PATH_CALLS * 5)
+        ]
+    )
+    peaks = energy._coordinator.peakdata.value
+
+    results = {
+        "energy_on_change": _per_call(
+            lambda: energy._async_on_change(next(meter_events))
+        ),
+        "peak_tracker_update": _per_call(lambda: tracker.update(next(updates))),
+        "calculate_level": _per_call(lambda: threshold.calculate_level(peaks)),
+        "available_power_calculate": _per_call(
+            available._GridCapWatcherAvailableEffectRemainingHour__calculate
+        ),
+    }
+
+    print("\nhot path, us per call")
+    check("hot_path", "usec_per_call", results)
@@ -0,0 +1,127 @@
+"""Cost of many energytariff instances in one Home Assistant.
+
+One platform is set up per sub-meter, 1 to 200 of them, through
+async_setup_platform.  Setup time with and without restored states, event
+loop utilisation while all meters report every 2 s and the number of
+pending timers are compared with the stored baseline.
+
+Run with: pytest -m benchmark -s tests/benchmarks/test_scaling.py
+"""
+
+import time
+
+import pytest
+from homeassistant.core import State
+from homeassistant.helpers import entity_registry as er
+from pytest_homeassistant_custom_component.common import mock_restore_cache
+
+from custom_components.energytariff.const import DOMAIN
+
+from ..common import async_register_instances, async_setup_instances, synthetic_power
+from .baseline import check
+
+INSTANCES = (1, 10, 50, 200)
+ENTITIES_PER_INSTANCE = 7
+# Meter cadence, and simulated time and least number of meter events of the
+# steady state measurement
+INTERVAL = 2.0
+STEADY_SECONDS = 120
+STEADY_EVENTS = 2000
+
+# Entity ids of the first instance and a restored state for each
+RESTORED = {
+    "sensor.energy_used_this_hour": ("1.25", {}),
+    "sensor.energy_estimate_this_hour": ("2.5", {}),
+    "sensor.available_power_this_hour": ("3000", {}),
+    "sensor.energy_level_upper_threshold": ("5.0", {"grid_threshold_level": "Medium"}),
+    "sensor.energy_level_name": ("Medium", {}),
+    "sensor.energy_level_price": ("100", {}),
+    "sensor.average_peak_hour_energy": ("3.0", {}),
+}
+
+
+def _restored_states(instances: int) -> list[State]:
+    """Return a restored state for every sensor of every instance.
+
+    Instances share entity names, so later ones get numbered entity ids."""
+    states = []
+    for index in range(instances):
+        suffix = f"_{index + 1}" if index else ""
+        for entity_id, (value, attributes) in RESTORED.items():
+            states.append(State(f"{entity_id}{suffix}", value, attributes))
+    return states
+
+
+def _pending_timers(hass) -> int:
+    return sum(1 for handle in hass.loop._scheduled if not handle.cancelled())
+
+
+async def _async_setup(hass, instances: int) -> tuple[list[str], float]:
+    """Set up instances and check that all their entities were added."""
+    begin = time.perf_counter()
+    meters = await async_setup_instances(hass, instances)
+    seconds = time.perf_counter() - begin
+
+    # Entities with colliding unique ids are not added
+    entries = [
+        entry
+        for entry in er.async_get(hass).entities.values()
+        if entry.platform == DOMAIN
+    ]
+    assert len(entries) == instances * ENTITIES_PER_INSTANCE
+    return meters, seconds
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("instances", INSTANCES)
+async def test_instances_steady_state(hass, instances):
+    """Set up instances and replay all their meters at once."""
+    meters, setup_seconds = await _async_setup(hass, instances)
+    timers = _pending_timers(hass)
+
+    attributes = {"unit_of_measurement": "W"}
+    start = time.time()
+    ticks = max(int(STEADY_SECONDS / INTERVAL), STEADY_EVENTS // instances)
+    begin = time.perf_counter()
+    for tick in range(ticks):
+        for offset, meter in enumerate(meters):
+            hass.states.async_set(
+                meter,
+                f"{synthetic_power(tick + offset):.0f}",
+                attributes,
+                force_update=True,
+                timestamp=start + tick * INTERVAL,
+            )
+        await hass.async_block_till_done()
+    loop_seconds = time.perf_counter() - begin
+
+    metrics = {
+        "setup_seconds": round(setup_seconds, 3),
+        "loop_utilisation": round(loop_seconds / (ticks * INTERVAL), 4),
+        "usec_per_event": round(loop_seconds * 1e6 / (ticks * instances), 2),
+        "timers": timers,
+    }
+    print(f"\nsteady state of {instances} instances")
+    check("scaling", f"steady-{instances}", metrics)
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("instances", INSTANCES)
+async def test_instances_restore(hass, instances):
+    """Set up instances that restore the state of all their sensors."""
+    await async_register_instances(hass, instances)
+    mock_restore_cache(hass, _restored_states(instances))
+
+    _, restore_seconds = await _async_setup(hass, instances)
+
+    restored = [
+        state
+        for state in hass.states.async_all("sensor")
+        if state.entity_id.startswith("sensor.energy_level_name")
+    ]
+    assert len(restored) == instances
+    assert all(state.state == "Medium" for state in restored)
+
+    print(f"\nrestore of {instances} instances")
+    metrics = {"restore_seconds": round(restore_seconds, 3)}
+    check("scaling", f"restore-{instances}", metrics)
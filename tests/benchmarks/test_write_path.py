@@ -0,0 +1,21 @@
+"""Benchmark of the per-event cost of sensor state writes.
+
+Run with: pytest -m benchmark -s tests/benchmarks
+"""
+
+import pytest
+
+from ..common import async_replay_meter, async_setup_energytariff
+
+
+@pytest.mark.benchmark
+async def test_ams_event_write_path(hass):
+    """Measure tasks created and loop time per AMS meter event."""
+    await async_setup_energytariff(hass)
+
+    # Warm up caches and restore paths before measuring.
+    await async_replay_meter(hass, 100)
+    stats = await async_replay_meter(hass, 2000)
+
+    print(stats.report("AMS event write path"))
+    assert stats.tasks_per_event == 0
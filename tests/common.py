@@ -0,0 +1,218 @@
+"""Shared helpers for energytariff tests."""
+
+from __future__ import annotations
+
+import math
+import time
+from dataclasses import dataclass, field
+from unittest.mock import patch
+
+from homeassistant.const import EVENT_STATE_CHANGED, EVENT_STATE_REPORTED
+from homeassistant.core import Event, HomeAssistant, callback
+from homeassistant.helpers import entity_registry as er
+from homeassistant.setup import async_setup_component
+from pytest_homeassistant_custom_component.common import (
+    MockModule,
+    mock_integration,
+    mock_platform,
+)
+
+from custom_components.energytariff import binary_sensor, sensor
+from custom_components.energytariff.const import DOMAIN
+
+METER_ENTITY = "sensor.power_meter"
+
+BENCHMARK_CONFIG = {
+    "platform": "energytariff",
+    "entity_id": METER_ENTITY,
+    "target_energy": 5.0,
+    "max_power": 15000,
+    "precision": 2,
+    "levels": [
+        {"name": "Low", "threshold": 2.0, "price": 50},
+        {"name": "Medium", "threshold": 5.0, "price": 100},
+        {"name": "High", "threshold": 10.0, "price": 200},
+        {"name": "Max", "threshold": 100.0, "price": 400},
+    ],
+}
+
+
+def set_meter(hass: HomeAssistant, watt: float | str, timestamp: float) -> None:
+    """Set the meter state, as an update at timestamp."""
+    hass.states.async_set(
+        METER_ENTITY,
+        str(watt),
+        {"unit_of_measurement": "W"},
+        force_update=True,
+        timestamp=timestamp,
+    )
+
+
+@dataclass
+class EventLoopStats:
+    """Counters collected while replaying meter events."""
+
+    events: int = 0
+    tasks: int = 0
+    state_writes: int = 0
+    loop_seconds: float = 0.0
+    writes_per_entity: dict[str, int] = field(default_factory=dict)
+    alloc_events: int = 0
+    alloc_peak_bytes: int = 0
+    alloc_retained_bytes: int = 0
+
+    @property
+    def tasks_per_event(self) -> float:
+        """Tasks created per meter event."""
+        return self.tasks / self.events if self.events else 0.0
+
+    @property
+    def writes_per_event(self) -> float:
+        """Sensor state writes per meter event."""
+        return self.state_writes / self.events if self.events else 0.0
+
+    @property
+    def usec_per_event(self) -> float:
+        """Event loop time per meter event, in microseconds."""
+        return self.loop_seconds * 1e6 / self.events if self.events else 0.0
+
+    @property
+    def events_per_second(self) -> float:
+        """Meter events replayed per second of event loop time."""
+        return self.events / self.loop_seconds if self.loop_seconds else 0.0
+
+    @property
+    def retained_bytes_per_event(self) -> float:
+        """Memory kept after the allocation window, per meter event."""
+        if not self.alloc_events:
+            return 0.0
+        return self.alloc_retained_bytes / self.alloc_events
+
+    def metrics(self) -> dict[str, float]:
+        """Return the metrics that are compared with the stored baseline."""
+        return {
+            "events_per_second": round(self.events_per_second),
+            "usec_per_event": round(self.usec_per_event, 2),
+            "writes_per_event": round(self.writes_per_event, 4),
+            "peak_alloc_bytes": self.alloc_peak_bytes,
+            "retained_bytes_per_event": round(self.retained_bytes_per_event, 2),
+        }
+
+    def report(self, title: str) -> str:
+        """Return a one-line human readable summary."""
+        return (
+            f"{title}: {self.events} events, "
+            f"{self.usec_per_event:.1f} us/event, "
+            f"{self.tasks_per_event:.2f} tasks/event, "
+            f"{self.writes_per_event:.2f} writes/event"
+        )
+
+
+async def async_setup_platforms(hass: HomeAssistant, configs: list[dict]) -> None:
+    """Set up energytariff sensor platforms through the sensor component."""
+    # The test plugin provides its own custom_components package, so register
+    # the real platform module with the loader directly.
+    mock_integration(hass, MockModule(DOMAIN))
+    mock_platform(hass, f"{DOMAIN}.sensor", sensor)
+    mock_platform(hass, f"{DOMAIN}.binary_sensor", binary_sensor)
+    for config in configs:
+        hass.states.async_set(config["entity_id"], "0", {"unit_of_measurement": "W"})
+    assert await async_setup_component(hass, "sensor", {"sensor": configs})
+    await hass.async_block_till_done()
+
+
+async def async_setup_energytariff(
+    hass: HomeAssistant, config: dict | None = None
+) -> None:
+    """Set up the energytariff sensor platform through the sensor component."""
+    await async_setup_platforms(hass, [config or BENCHMARK_CONFIG])
+    assert hass.states.get("sensor.energy_used_this_hour") is not None
+
+
+def instance_meter(index: int) -> str:
+    """Return the meter entity of one of many energytariff instances."""
+    return f"{METER_ENTITY}_{index}"
+
+
+async def async_setup_instances(hass: HomeAssistant, count: int) -> list[str]:
+    """Set up count energytariff platforms, each with its own meter.
+    Returns the meter entity ids."""
+    meters = [instance_meter(index) for index in range(count)]
+    await async_setup_platforms(
+        hass, [{**BENCHMARK_CONFIG, "entity_id": meter} for meter in meters]
+    )
+    return meters
+
+
+async def async_register_instances(hass: HomeAssistant, count: int) -> None:
+    """Add the sensors of count instances to the entity registry.
+
+    As after an earlier run, so their saved states can be restored."""
+    registry = er.async_get(hass)
+    for index in range(count):
+        config = {**BENCHMARK_CONFIG, "entity_id": instance_meter(index)}
+        entities: list = []
+        await sensor.async_setup_platform(hass, config, entities.extend)
+        for entity in entities:
+            registry.async_get_or_create(
+                "sensor", DOMAIN, entity.unique_id, suggested_object_id=entity.name
+            )
+
+
+def synthetic_power(index: int) -> float:
+    """Return a deterministic, varying household load in watts."""
+    return 2500 + 1500 * math.sin(index / 150) + 300 * math.sin(index / 7)
+
+
+async def async_replay_meter(
+    hass: HomeAssistant,
+    events: int,
+    interval: float = 2.0,
+    start: float | None = None,
+    meter_entity: str = METER_ENTITY,
+) -> EventLoopStats:
+    """Feed a synthetic meter stream and count tasks and state writes."""
+    stats = EventLoopStats()
+    if start is None:
+        start = time.time()
+
+    create_task = hass.async_create_task_internal
+
+    def counting_create_task(*args, **kwargs):
+        stats.tasks += 1
+        return create_task(*args, **kwargs)
+
+    @callback
+    def count_write(event: Event) -> None:
+        entity_id = event.data["entity_id"]
+        stats.state_writes += 1
+        stats.writes_per_entity[entity_id] = (
+            stats.writes_per_entity.get(entity_id, 0) + 1
+        )
+
+    @callback
+    def not_meter(event_data) -> bool:
+        return event_data["entity_id"] != meter_entity
+
+    unsubs = [
+        hass.bus.async_listen(EVENT_STATE_CHANGED, count_write, not_meter),
+        hass.bus.async_listen(EVENT_STATE_REPORTED, count_write, not_meter),
+    ]
+    with patch.object(hass, "async_create_task_internal", counting_create_task):
+        for index in range(events):
+            value = f"{synthetic_power(index):.0f}"
+            begin = time.perf_counter()
+            hass.states.async_set(
+                meter_entity,
+                value,
+                {"unit_of_measurement": "W"},
+                force_update=True,
+                timestamp=start + index * interval,
+            )
+            await hass.async_block_till_done()
+            stats.loop_seconds += time.perf_counter() - begin
+            stats.events += 1
+
+    for unsub in unsubs:
+        unsub()
+    return stats
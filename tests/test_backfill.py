@@ -0,0 +1,245 @@
+"""Test seeding the monthly peaks from the recorder."""
+
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from homeassistant.components.recorder.statistics import async_import_statistics
+from homeassistant.const import STATE_UNAVAILABLE
+from homeassistant.core import State
+from homeassistant.helpers import entity_registry as er
+from homeassistant.util import dt
+from pytest_homeassistant_custom_component.common import (
+    async_fire_time_changed,
+    mock_restore_cache_with_extra_data,
+)
+from pytest_homeassistant_custom_component.components.recorder.common import (
+    async_wait_recording_done,
+)
+
+from custom_components.energytariff.backfill import async_read_month_hours
+from custom_components.energytariff.const import BACKFILL, DOMAIN
+
+from .common import (
+    BENCHMARK_CONFIG,
+    METER_ENTITY,
+    async_setup_energytariff,
+    set_meter,
+)
+
+AVERAGE_SENSOR = "sensor.average_peak_hour_energy"
+
+
+@pytest.fixture(autouse=True)
+async def mock_recorder_before_hass(async_setup_recorder_instance) -> None:
+    """Set up the recorder before Home Assistant."""
+
+
+async def _oslo_now(hass, freezer) -> datetime:
+    await hass.config.async_set_time_zone("Europe/Oslo")
+    now = datetime(2025, 2, 10, 12, 30, tzinfo=dt.get_default_time_zone())
+    freezer.move_to(now)
+    return now
+
+
+def _import_hourly_means(hass, start: datetime, hours: int, peaks: dict[int, float]):
+    """Hourly mean power of the meter, 1 kW except in the peak hours"""
+    metadata = {
+        "has_mean": True,
+        "has_sum": False,
+        "name": None,
+        "source": "recorder",
+        "statistic_id": METER_ENTITY,
+        "unit_of_measurement": "kW",
+    }
+    statistics = []
+    for index in range(hours):
+        mean = peaks.get(index, 1.0)
+        start_of_hour = start + timedelta(hours=index)
+        statistics.append(
+            {"start": start_of_hour, "mean": mean, "min": mean, "max": mean}
+        )
+    async_import_statistics(hass, metadata, statistics)
+
+
+async def test_backfill_seeds_peaks_from_statistics(hass, recorder_mock, freezer):
+    """Peaks of the month come back from statistics when nothing was saved."""
+    now = await _oslo_now(hass, freezer)
+    month_start = datetime(2025, 2, 1, tzinfo=now.tzinfo)
+    # In local hours of the month: 2 Feb 18:00, 5 Feb 08:00 and 9 Feb 20:00,
+    # the hour on 2 Feb is beaten by the one on 5 Feb
+    peaks = {24 + 18: 4.0, 4 * 24 + 8: 6.0, 8 * 24 + 20: 5.0, 24 + 19: 3.0}
+    # The statistics of last month do not count
+    _import_hourly_means(hass, month_start - timedelta(hours=48), 48, {47: 9.0})
+    _import_hourly_means(hass, month_start, 9 * 24 + 12, peaks)
+    await async_wait_recording_done(hass)
+
+    begin = time.perf_counter()
+    hours = await async_read_month_hours(hass, METER_ENTITY, now.timestamp())
+    assert time.perf_counter() - begin < 1
+    assert len(hours) == 9 * 24 + 12
+    assert hours[0][0].start == month_start.timestamp()
+    assert hours[24 + 18][1] == pytest.approx(4.0)
+
+    await async_setup_energytariff(hass, {**BENCHMARK_CONFIG, BACKFILL: True})
+    await hass.async_block_till_done(wait_background_tasks=True)
+
+    state = hass.states.get(AVERAGE_SENSOR)
+    assert float(state.state) == pytest.approx(5.0)
+    # A level applies below its threshold
+    assert hass.states.get("sensor.energy_level_name").state == "High"
+
+
+@pytest.mark.parametrize("numpy_installed", [True, False])
+async def test_backfill_integrates_states_without_statistics(
+    hass, recorder_mock, freezer, monkeypatch, numpy_installed
+):
+    """A meter without statistics is integrated from its recorded states, with
+    or without NumPy."""
+    if not numpy_installed:
+        monkeypatch.setitem(sys.modules, "numpy", None)
+    now = await _oslo_now(hass, freezer)
+    peak = datetime(2025, 2, 3, 17, tzinfo=now.tzinfo).timestamp()
+    for timestamp, watt in (
+        (peak - 600, 1000),
+        (peak, 4000),
+        (peak + 1800, 6000),
+        (peak + 3600, 500),
+    ):
+        hass.states.async_set(
+            METER_ENTITY, str(watt), {"unit_of_measurement": "W"}, timestamp=timestamp
+        )
+    await async_wait_recording_done(hass)
+
+    hours = {
+        hour.start: energy
+        for hour, energy in await async_read_month_hours(
+            hass, METER_ENTITY, now.timestamp()
+        )
+    }
+    assert hours[peak] == pytest.approx(5.0)
+    # The last state is kept to the end of its hour
+    assert hours[peak + 3600] == pytest.approx(0.5)
+
+
+async def test_backfill_is_off_by_default(hass, recorder_mock, freezer):
+    """Without backfill the recorder is not read."""
+    now = await _oslo_now(hass, freezer)
+    _import_hourly_means(hass, datetime(2025, 2, 1, tzinfo=now.tzinfo), 48, {5: 8.0})
+    await async_wait_recording_done(hass)
+
+    await async_setup_energytariff(hass)
+    await hass.async_block_till_done(wait_background_tasks=True)
+
+    assert hass.states.get(AVERAGE_SENSOR).state == "unavailable"
+
+
+def _set_meter_at(hass, freezer, moment: datetime, watt: float) -> None:
+    freezer.move_to(moment)
+    set_meter(hass, watt, moment.timestamp())
+
+
+async def test_long_meter_interval_is_read_from_the_recorder(
+    hass, recorder_mock, freezer
+):
+    """A meter that stays unchanged for hours is counted from statistics and
+    states instead of being discarded."""
+    await hass.config.async_set_time_zone("Europe/Oslo")
+    tz = dt.get_default_time_zone()
+    freezer.move_to(datetime(2025, 2, 10, 10, 0, tzinfo=tz))
+    await async_setup_energytariff(hass)
+    _set_meter_at(hass, freezer, datetime(2025, 2, 10, 10, 0, tzinfo=tz), 2000)
+    _set_meter_at(hass, freezer, datetime(2025, 2, 10, 10, 10, tzinfo=tz), 3000)
+    await hass.async_block_till_done()
+    # The hour clock ends the hours while the meter is silent
+    for hour in (11, 12):
+        freezer.move_to(datetime(2025, 2, 10, hour, 0, tzinfo=tz))
+        async_fire_time_changed(hass)
+        await hass.async_block_till_done()
+    _import_hourly_means(hass, datetime(2025, 2, 10, 11, tzinfo=tz), 1, {0: 3.0})
+    await async_wait_recording_done(hass)
+
+    _set_meter_at(hass, freezer, datetime(2025, 2, 10, 12, 40, tzinfo=tz), 1000)
+    await hass.async_block_till_done(wait_background_tasks=True)
+
+    # 12:00 to 12:40 at 3 kW from the recorded state
+    assert float(hass.states.get("sensor.energy_used_this_hour").state) == 2.0
+    # 11:00 to 12:00 from statistics beats the 2 kWh counted live before it
+    assert float(hass.states.get(AVERAGE_SENSOR).state) == pytest.approx(3.0)
+
+
+async def test_time_before_the_meter_was_unavailable_is_read_back(
+    hass, recorder_mock, freezer
+):
+    """Updates are not counted around an unavailable meter, the recorder
+    knows the power until it became unavailable."""
+    await hass.config.async_set_time_zone("Europe/Oslo")
+    tz = dt.get_default_time_zone()
+    freezer.move_to(datetime(2025, 2, 10, 10, 0, tzinfo=tz))
+    await async_setup_energytariff(hass)
+    for minute, watt in ((0, 2000), (10, 3000), (30, STATE_UNAVAILABLE)):
+        _set_meter_at(hass, freezer, datetime(2025, 2, 10, 10, minute, tzinfo=tz), watt)
+    await async_wait_recording_done(hass)
+
+    _set_meter_at(hass, freezer, datetime(2025, 2, 10, 10, 50, tzinfo=tz), 1000)
+    _set_meter_at(hass, freezer, datetime(2025, 2, 10, 10, 55, tzinfo=tz), 1200)
+    await hass.async_block_till_done(wait_background_tasks=True)
+
+    # 10:10 to 10:30 at 3 kW, nothing while unavailable
+    energy = float(hass.states.get("sensor.energy_used_this_hour").state)
+    assert energy == pytest.approx(1 / 3 + 1.0 + 1 / 12, abs=0.005)
+
+
+@pytest.mark.parametrize(
+    ("written", "saved", "saved_energy"),
+    [
+        # Last written when the state was saved
+        (30, 30, 1.0),
+        # Written at 9:30 and held back, the value saved at 9:45 includes
+        # 9:30 to 9:45 at 2 and 3 kW
+        (30, 45, 1.0 + 1 / 3 + 0.25),
+    ],
+)
+async def test_restart_gap_is_read_from_the_recorder(
+    hass, recorder_mock, freezer, written: int, saved: int, saved_energy: float
+):
+    """The time from the last save to the first meter update after a restart
+    is added to the hours it belongs to."""
+    await hass.config.async_set_time_zone("Europe/Oslo")
+    tz = dt.get_default_time_zone()
+    for minute, watt in ((0, 2000), (40, 3000), (65, 2000)):
+        moment = datetime(2025, 2, 10, 9, tzinfo=tz) + timedelta(minutes=minute)
+        _set_meter_at(hass, freezer, moment, watt)
+    await async_wait_recording_done(hass)
+    # Registered by the run before the restart
+    er.async_get(hass).async_get_or_create(
+        "sensor",
+        DOMAIN,
+        "energytariff_power_meter_consumption_kWh",
+        suggested_object_id="energy_used_this_hour",
+    )
+    written_at = datetime(2025, 2, 10, 9, written, tzinfo=tz)
+    freezer.move_to(datetime(2025, 2, 10, 9, saved, tzinfo=tz))
+    mock_restore_cache_with_extra_data(
+        hass,
+        [
+            (
+                State("sensor.energy_used_this_hour", "1.0", last_updated=written_at),
+                {"native_value": saved_energy, "native_unit_of_measurement": "kWh"},
+            )
+        ],
+    )
+    freezer.move_to(datetime(2025, 2, 10, 10, 20, tzinfo=tz))
+    await async_setup_energytariff(hass)
+
+    _set_meter_at(hass, freezer, datetime(2025, 2, 10, 10, 20, tzinfo=tz), 1000)
+    _set_meter_at(hass, freezer, datetime(2025, 2, 10, 10, 26, tzinfo=tz), 1500)
+    await hass.async_block_till_done(wait_background_tasks=True)
+
+    # 10:00 to 10:20 from the recorder, then counted live
+    energy = float(hass.states.get("sensor.energy_used_this_hour").state)
+    assert energy == pytest.approx(0.25 + 0.5 + 0.1, abs=0.005)
+    # The saved energy, and the rest of the hour after the save from the recorder
+    average = float(hass.states.get(AVERAGE_SENSOR).state)
+    assert average == pytest.approx(1.0 + 1 / 3 + 1.0, abs=0.005)
@@ -0,0 +1,81 @@
+"""Test the threshold alarms."""
+
+import time
+
+from custom_components.energytariff.utils import LOCAL_HOURS
+
+from .common import BENCHMARK_CONFIG, async_setup_energytariff, set_meter
+
+PROJECTED = "binary_sensor.projected_over_target_this_hour"
+OVER_LEVEL = "binary_sensor.over_level_threshold_this_hour"
+
+
+async def test_projected_over_target(hass):
+    """The alarm follows the projection over the lead time, with hysteresis,
+    and is only written when it turns on or off."""
+    await async_setup_energytariff(
+        hass,
+        {
+            **BENCHMARK_CONFIG,
+            "target_energy": 1.0,
+            "alarms": {"hysteresis": 0.1, "lead_time": 600},
+        },
+    )
+    start = LOCAL_HOURS.hour_at(time.time()).end
+    set_meter(hass, 3600, start)
+    await hass.async_block_till_done()
+    # 0.6 kWh projected over the next 10 minutes
+    assert hass.states.get(PROJECTED).state == "off"
+
+    # Projected 0.66, 1.38, 1.17, 0.93 and 0.88 kWh, updates count the power
+    # of the last meter state
+    states = []
+    for second, watt in ((60, 7200), (120, 5400), (180, 3600), (240, 3000), (300, 0)):
+        set_meter(hass, watt, start + second)
+        await hass.async_block_till_done()
+        state = hass.states.get(PROJECTED)
+        states.append((state.state, state.last_reported))
+    assert [state for state, _ in states] == ["off", "on", "on", "on", "off"]
+    # Written when it turns on or off only
+    assert states[1][1] == states[2][1] == states[3][1]
+
+
+async def test_over_level_threshold(hass):
+    """The alarm is on once the energy of the hour is above the threshold."""
+    await async_setup_energytariff(
+        hass,
+        {
+            **BENCHMARK_CONFIG,
+            "levels": [{"name": "Low", "threshold": 2.0, "price": 50}],
+            "alarms": {},
+        },
+    )
+    start = LOCAL_HOURS.hour_at(time.time()).end
+    set_meter(hass, 36000, start)
+    await hass.async_block_till_done()
+    assert hass.states.get(OVER_LEVEL).state == "off"
+
+    # 1.8 and 2.4 kWh used
+    set_meter(hass, 36000, start + 180)
+    await hass.async_block_till_done()
+    assert hass.states.get(OVER_LEVEL).state == "off"
+    set_meter(hass, 36000, start + 240)
+    await hass.async_block_till_done()
+    assert hass.states.get(OVER_LEVEL).state == "on"
+
+
+async def test_no_alarms_without_config(hass):
+    """Alarms are only set up when configured."""
+    await async_setup_energytariff(hass)
+    assert hass.states.async_entity_ids("binary_sensor") == []
+
+
+async def test_no_alarms_without_target_or_levels(hass):
+    """Without levels or a number as target there is nothing to alarm on."""
+    config = {
+        key: value
+        for key, value in BENCHMARK_CONFIG.items()
+        if key not in ("levels", "target_energy")
+    }
+    await async_setup_energytariff(hass, {**config, "alarms": {}})
+    assert hass.states.async_entity_ids("binary_sensor") == []
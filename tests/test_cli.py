@@ -0,0 +1,286 @@
+"""Test the tariff engine command-line tool, which runs without Home Assistant."""
+
+import io
+import json
+import random
+import subprocess
+import sys
+from datetime import datetime
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import pytest
+
+from custom_components.energytariff import cli
+from custom_components.energytariff.engine import LocalHours
+from custom_components.energytariff.levels import LevelTable
+
+ROOT = Path(__file__).parents[1]
+OSLO = ZoneInfo("Europe/Oslo")
+LEVELS = [
+    {"name": "Low", "threshold": 2, "price": 100},
+    {"name": "Medium", "threshold": 5, "price": 200},
+    {"name": "High", "threshold": 10, "price": 400},
+]
+
+
+def _readings(start: datetime, hours: int, seed: int = 1):
+    """Irregular readings of a varying load, with a few long gaps"""
+    rng = random.Random(seed)
+    timestamp = start.timestamp()
+    end = timestamp + hours * 3600
+    times, watts = [], []
+    while timestamp < end:
+        times.append(timestamp)
+        watts.append(rng.uniform(500, 4000))
+        if len(times) % 700 == 0:
+            timestamp += 7200
+        else:
+            timestamp += rng.choice((1, 2, 10, 60, 600))
+    return times, watts
+
+
+def _chunks(times, watts, size):
+    for start in range(0, len(times), size):
+        yield times[start : start + size], watts[start : start + size]
+
+
+def test_vectorized_integration_matches_one_reading_at_a_time():
+    """Both ways give the same hours across a DST change, gaps and chunks."""
+    times, watts = _readings(datetime(2025, 10, 24, 22, tzinfo=OSLO), 72)
+
+    exact = list(
+        cli.hour_energies(_chunks(times, watts, 10**9), LocalHours(lambda: OSLO))
+    )
+    fast = list(
+        cli.hour_energies_numpy(_chunks(times, watts, 997), LocalHours(lambda: OSLO))
+    )
+
+    assert [hour for hour, _ in fast] == [hour for hour, _ in exact]
+    assert [energy for _, energy in fast] == pytest.approx(
+        [energy for _, energy in exact], abs=1e-9
+    )
+    # 26 October has 25 hours in Oslo
+    assert sum(hour.day == 26 for hour, _ in exact) == 25
+
+
+def test_constant_load_gives_whole_hours():
+    """3 kW for two days is 3 kWh an hour, with a 6 kW peak hour."""
+    start = datetime(2025, 1, 31, tzinfo=OSLO).timestamp()
+    times = [start + second for second in range(0, 48 * 3600 + 1, 10)]
+    peak = start + 30 * 3600
+    watts = [6000.0 if peak <= t < peak + 3600 else 3000.0 for t in times]
+    levels = LevelTable(LEVELS)
+
+    out = io.StringIO()
+    result = cli.run(_chunks(times, watts, 1000), OSLO, levels, out, vectorized=True)
+
+    rows = out.getvalue().splitlines()
+    assert rows[0] == "start,energy_kwh"
+    assert rows[1] == "2025-01-31T00:00:00+01:00,3.000000"
+    assert len(rows) == 49
+    january, february = result.months
+    assert january.energy == pytest.approx(72)
+    assert (january.level_name, january.price) == ("Medium", 200)
+    # One peak hour per day
+    assert [hour.hour for hour in february.top_three] == [6]
+    assert february.average == pytest.approx(6)
+    assert (february.level_name, february.level_threshold) == ("High", 10)
+    assert result.hours == 48
+
+
+def test_cli_reads_csv_and_numpy_files(tmp_path):
+    """CSV with ISO timestamps in kW and .npy in W give the same summary."""
+    times, watts = _readings(datetime(2025, 3, 30, tzinfo=OSLO), 30, seed=2)
+    csv_file = tmp_path / "meter.csv"
+    csv_file.write_text(
+        "time,power\n"
+        + "".join(
+            f"{datetime.fromtimestamp(t, OSLO).isoformat()},{w / 1000}\n"
+            for t, w in zip(times, watts)
+        )
+    )
+    npy_file = tmp_path / "meter.npy"
+    np.save(npy_file, np.column_stack((times, watts)))
+    config = tmp_path / "tariff.json"
+    config.write_text(json.dumps({"levels": LEVELS}))
+
+    outputs = []
+    for readings, unit in ((csv_file, "kW"), (npy_file, "W")):
+        hours = tmp_path / f"{readings.suffix[1:]}_hours.csv"
+        # Run as a module, so importing Home Assistant would show
+        result = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "import sys\n"
+                "from custom_components.energytariff.cli import main\n"
+                "code = main(sys.argv[1:])\n"
+                "assert 'homeassistant' not in sys.modules\n"
+                "sys.exit(code)",
+                str(readings),
+                "--time-zone=Europe/Oslo",
+                f"--config={config}",
+                f"--hours={hours}",
+                f"--unit={unit}",
+                "--chunk-size=1000",
+            ],
+            capture_output=True,
+            check=True,
+            cwd=ROOT,
+            text=True,
+        )
+        outputs.append((result.stdout, hours.read_text()))
+
+    (summary, hours_csv), (npy_summary, npy_hours_csv) = outputs
+    assert summary == npy_summary
+    assert hours_csv == npy_hours_csv
+    # 30 March has 23 hours in Oslo
+    assert summary.splitlines()[-1] == "30 hours"
+    assert summary.splitlines()[1].startswith("2025-03")
+
+
+def test_template_prices_are_given_on_the_command_line(tmp_path, capsys):
+    """Template prices of the sensor config cannot be rendered offline."""
+    readings = tmp_path / "meter.csv"
+    _hourly_export(readings, datetime(2025, 2, 1, tzinfo=OSLO), 24, 2)
+    config = tmp_path / "tariff.yaml"
+    config.write_text(
+        "levels:\n"
+        "  - name: Low\n"
+        "    threshold: 2\n"
+        "    price: 100\n"
+        "  - name: Medium\n"
+        "    threshold: 5\n"
+        "    price: \"{{ states('input_number.medium_price') }}\"\n"
+    )
+    argv = [str(readings), "--time-zone=Europe/Oslo", f"--config={config}"]
+
+    with pytest.raises(SystemExit) as exit_info:
+        cli.main([*argv, "--unit=kWh"])
+    assert exit_info.value.code == 2
+    assert "--price 'Medium=<price>'" in capsys.readouterr().err
+
+    assert cli.main([*argv, "--unit=kWh", "--price=Medium=250"]) == 0
+    month = capsys.readouterr().out.splitlines()[1]
+    assert "Medium" in month
+    assert month.split()[-1] == "250"
+
+
+def test_readings_out_of_order_are_rejected():
+    """Integration needs readings in time order."""
+    chunks = [([10.0, 20.0, 15.0], [1.0, 1.0, 1.0])]
+    with pytest.raises(ValueError, match="time order"):
+        cli.run(chunks, OSLO, vectorized=True)
+    with pytest.raises(ValueError, match="time order"):
+        cli.run(chunks, OSLO, vectorized=False)
+
+
+def _hourly_export(path, start: datetime, hours: int, kwh: float):
+    """Grid operator export, energy per hour with a peak on the first day"""
+    first = start.timestamp()
+    rows = [
+        f"{datetime.fromtimestamp(first + hour * 3600, OSLO).isoformat()},"
+        f"{kwh * 2 if hour == 5 else kwh}"
+        for hour in range(hours)
+    ]
+    path.write_text("Fra,Volum\n" + "\n".join(rows) + "\n")
+
+
+def test_fleet_summary_matches_single_meter_runs(tmp_path):
+    """Each meter gets one row per month, as calculated for the file alone."""
+    exports = tmp_path / "exports"
+    exports.mkdir()
+    _hourly_export(exports / "meter_a.csv", datetime(2025, 1, 30, tzinfo=OSLO), 72, 1.5)
+    _hourly_export(exports / "meter_b.csv", datetime(2025, 2, 1, tzinfo=OSLO), 48, 3)
+    # Quarter hour values are summed to hours
+    (exports / "meter_c.csv").write_text(
+        "".join(
+            f"{datetime(2025, 2, 1, tzinfo=OSLO).timestamp() + quarter * 900},0.5\n"
+            for quarter in range(8)
+        )
+    )
+    (exports / "notes.txt").write_text("not a meter")
+    options = cli.FleetOptions(OSLO, LevelTable(LEVELS), unit="kWh", chunk_size=10)
+
+    out = io.StringIO()
+    count = cli.analyze_fleet(cli.fleet_files(exports), options, out, workers=2)
+
+    rows = [line.split(",") for line in out.getvalue().splitlines()]
+    assert count == 3
+    assert tuple(rows[0]) == cli.FLEET_COLUMNS
+    assert [row[:2] for row in rows[1:]] == [
+        ["meter_a", "2025-01"],
+        ["meter_a", "2025-02"],
+        ["meter_b", "2025-02"],
+        ["meter_c", "2025-02"],
+    ]
+    # 48 hours of 1.5 kWh, one of them doubled
+    assert rows[1][2:] == [
+        "73.500",
+        "3.000",
+        "1.500",
+        "",
+        "2.250",
+        "Medium",
+        "5.000",
+        "200.000",
+    ]
+    assert rows[3][2:] == [
+        "147.000",
+        "6.000",
+        "3.000",
+        "",
+        "4.500",
+        "Medium",
+        "5.000",
+        "200.000",
+    ]
+    # A level applies below its threshold
+    assert rows[4][2:] == [
+        "4.000",
+        "2.000",
+        "",
+        "",
+        "2.000",
+        "Medium",
+        "5.000",
+        "200.000",
+    ]
+
+    alone = cli.analyze_file(exports / "meter_b.csv", options)
+    assert [month.energy for month in alone.months] == [pytest.approx(147.0)]
+
+
+def test_fleet_keeps_going_past_unreadable_files(tmp_path, capsys):
+    """A bad file is reported, and the other meters are still written."""
+    exports = tmp_path / "exports"
+    exports.mkdir()
+    _hourly_export(exports / "meter_a.csv", datetime(2025, 2, 1, tzinfo=OSLO), 24, 2)
+    (exports / "meter_b.csv").write_text("Fra,Volum\n2025-02-01T00:00:00+01:00,lots\n")
+    (exports / "meter_c.npy").write_bytes(b"not numpy")
+    options = cli.FleetOptions(OSLO, LevelTable(LEVELS), unit="kWh", chunk_size=10)
+
+    out, errors = io.StringIO(), io.StringIO()
+    count = cli.analyze_fleet(cli.fleet_files(exports), options, out, 2, errors)
+
+    assert count == 1
+    assert {line.split(",")[0] for line in out.getvalue().splitlines()[1:]} == {
+        "meter_a"
+    }
+    reported = errors.getvalue().splitlines()
+    assert [line.split(":")[0] for line in reported] == ["meter_b", "meter_c"]
+    assert "Line 2" in reported[0]
+
+    summary = tmp_path / "fleet.csv"
+    status = cli.main(
+        [str(exports), "--unit", "kWh", "--time-zone", "Europe/Oslo"]
+        + ["--summary", str(summary), "--workers", "1"]
+    )
+    assert status == 1
+    assert [line.split(",")[0] for line in summary.read_text().splitlines()] == [
+        "meter",
+        "meter_a",
+    ]
+    assert capsys.readouterr().err.splitlines() == reported
@@ -0,0 +1,81 @@
+"""Test closed hours written as external statistics."""
+
+from datetime import datetime, timedelta
+
+import pytest
+from homeassistant.components.recorder.statistics import (
+    async_add_external_statistics,
+    statistics_during_period,
+)
+from homeassistant.helpers.recorder import get_instance
+from homeassistant.util import dt
+from pytest_homeassistant_custom_component.components.recorder.common import (
+    async_wait_recording_done,
+)
+
+from custom_components.energytariff.const import DOMAIN, HOUR_STATISTICS
+from custom_components.energytariff.hour_statistics import statistic_id
+
+from .common import BENCHMARK_CONFIG, METER_ENTITY, async_setup_energytariff
+
+ENERGY_ID = statistic_id(METER_ENTITY, "hour_energy")
+PEAK_ID = statistic_id(METER_ENTITY, "peak_candidate")
+LEVEL_ID = statistic_id(METER_ENTITY, "level_threshold")
+
+
+@pytest.fixture(autouse=True)
+async def mock_recorder_before_hass(async_setup_recorder_instance) -> None:
+    """Set up the recorder before Home Assistant."""
+
+
+async def test_closed_hours_are_written_once(hass, recorder_mock, freezer):
+    """Each closed hour gets one row, the sum continues from stored rows."""
+    await hass.config.async_set_time_zone("Europe/Oslo")
+    start = datetime(2025, 2, 10, 10, tzinfo=dt.get_default_time_zone())
+    async_add_external_statistics(
+        hass,
+        {
+            "has_mean": False,
+            "has_sum": True,
+            "name": None,
+            "source": DOMAIN,
+            "statistic_id": ENERGY_ID,
+            "unit_of_measurement": "kWh",
+        },
+        [{"start": start - timedelta(hours=1), "state": 1.5, "sum": 10.0}],
+    )
+    await async_wait_recording_done(hass)
+    freezer.move_to(start)
+    await async_setup_energytariff(hass, {**BENCHMARK_CONFIG, HOUR_STATISTICS: True})
+
+    # 2.4 kW from 10:00, 6 kW from 11:00, read every 10 minutes
+    for minute in range(0, 140, 10):
+        freezer.move_to(start + timedelta(minutes=minute))
+        watt = 2400 if minute < 60 else 6000
+        hass.states.async_set(
+            METER_ENTITY, str(watt), {"unit_of_measurement": "W"}, force_update=True
+        )
+        await hass.async_block_till_done()
+    await hass.async_block_till_done(wait_background_tasks=True)
+    await async_wait_recording_done(hass)
+
+    stats = await get_instance(hass).async_add_executor_job(
+        statistics_during_period,
+        hass,
+        start,
+        None,
+        {ENERGY_ID, PEAK_ID, LEVEL_ID},
+        "hour",
+        None,
+        {"state", "sum", "mean"},
+    )
+    energy = stats[ENERGY_ID]
+    assert [row["start"] for row in energy] == [
+        start.timestamp(),
+        start.timestamp() + 3600,
+    ]
+    assert [row["state"] for row in energy] == pytest.approx([2.4, 6.0])
+    assert [row["sum"] for row in energy] == pytest.approx([12.4, 18.4])
+    # Each was the highest hour of the day when it closed
+    assert [row["mean"] for row in stats[PEAK_ID]] == [1.0, 1.0]
+    assert [row["mean"] for row in stats[LEVEL_ID]] == [5.0, 10.0]
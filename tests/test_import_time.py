@@ -0,0 +1,61 @@
+"""Import cost of the sensor platform on Home Assistant startup.
+
+Home Assistant imports the sensor component before any sensor platform, so
+only what the platform adds on top of it is on our part of the startup path.
+"""
+
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+PACKAGE = "custom_components.energytariff"
+ROOT = Path(__file__).parents[1]
+
+# Measured at about 6 ms, the budget leaves room for slow machines
+IMPORT_BUDGET_MS = 100
+
+_PROFILE = f"""
+import json, sys, time
+import homeassistant.components.sensor
+
+before = set(sys.modules)
+begin = time.perf_counter()
+import {PACKAGE}.sensor
+elapsed = time.perf_counter() - begin
+print(json.dumps({{
+    "ms": elapsed * 1000,
+    "modules": sorted(set(sys.modules) - before),
+}}))
+"""
+
+
+def test_platform_import_budget(tmp_path):
+    """Importing the platform loads only its own modules and stays in budget."""
+    env = {**os.environ, "PYTHONPYCACHEPREFIX": str(tmp_path)}
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    # Bytecode is cached on a real installation
+    subprocess.run(
+        [sys.executable, "-m", "compileall", "-q", str(ROOT / "custom_components")],
+        check=True,
+        cwd=ROOT,
+        env=env,
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", _PROFILE],
+        capture_output=True,
+        check=True,
+        cwd=ROOT,
+        env=env,
+        text=True,
+    )
+    profile = json.loads(result.stdout.splitlines()[-1])
+
+    outside = [
+        name
+        for name in profile["modules"]
+        if name != "custom_components" and not name.startswith(PACKAGE)
+    ]
+    assert outside == []
+    assert profile["ms"] < IMPORT_BUDGET_MS
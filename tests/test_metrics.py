@@ -0,0 +1,55 @@
+"""Test the diagnostic metrics of an instance."""
+
+import time
+from datetime import timedelta
+
+from homeassistant.util import dt
+from pytest_homeassistant_custom_component.common import async_fire_time_changed
+
+from custom_components.energytariff.coordinator import (
+    ReplaySignal,
+    async_get_coordinator,
+)
+
+from .common import BENCHMARK_CONFIG, METER_ENTITY, async_setup_energytariff, set_meter
+
+DIAGNOSTICS = "sensor.energy_tariff_diagnostics"
+
+
+async def test_diagnostics_report(hass):
+    """Meter events, sample interval and jitter, timings and writes are
+    reported once a minute."""
+    await async_setup_energytariff(hass, {**BENCHMARK_CONFIG, "diagnostics": True})
+    assert hass.states.get(DIAGNOSTICS).state == "unknown"
+
+    start = time.time() + 60
+    # Every 2 seconds, with one reading 2 seconds late
+    for second in (0, 2, 4, 8, 10):
+        set_meter(hass, 1000 + second, start + second)
+        await hass.async_block_till_done()
+    async_fire_time_changed(hass, dt.utcnow() + timedelta(minutes=1))
+    await hass.async_block_till_done()
+
+    state = hass.states.get(DIAGNOSTICS)
+    assert float(state.state) > 0
+    assert state.attributes["sample_interval"] == 2.5
+    assert state.attributes["sample_jitter"] == 0.866
+    assert set(state.attributes["on_change_ms"]) == {"p50", "p99"}
+    listeners = state.attributes["listeners_ms"]
+    assert set(listeners["GridCapWatcherEstimatedEnergySensor._state_change"]) == {
+        "p50",
+        "p99",
+    }
+    assert state.attributes["writes_per_minute"]["energy"] > 0
+    assert set(state.attributes["deduped"]) == set(state.attributes["held_back"])
+    assert state.attributes["threshold_emitted"] >= 1
+
+
+async def test_diagnostics_off_by_default(hass):
+    """Without diagnostics the signals are not timed and there is no sensor."""
+    await async_setup_energytariff(hass)
+
+    coordinator = async_get_coordinator(hass, METER_ENTITY)
+    assert coordinator.metrics is None
+    assert type(coordinator.effectstate) is ReplaySignal
+    assert hass.states.get(DIAGNOSTICS) is None
@@ -0,0 +1,124 @@
+"""Test replay of recorded meter updates."""
+
+from datetime import datetime
+
+import pytest
+from homeassistant.util import dt
+from pytest_homeassistant_custom_component.common import async_capture_events
+
+from custom_components.energytariff.const import EVENT_HOUR_CLOSED, EVENT_MONTH_CLOSED
+from custom_components.energytariff.replay import REPLAY_METER, async_replay
+
+from .common import BENCHMARK_CONFIG
+
+
+def _constant_power(start: float, hours: int, watt: float, interval: int = 60):
+    count = hours * 3600 // interval
+    return [(start + index * interval, watt) for index in range(count)]
+
+
+async def test_replay_closes_hours_and_months_by_replayed_time(hass, freezer):
+    """Hours and months follow the replayed updates, not the system clock."""
+    await hass.config.async_set_time_zone("Europe/Oslo")
+    freezer.move_to("2030-06-15 12:00:00+00:00")
+    start = datetime(2025, 1, 30, tzinfo=dt.get_default_time_zone()).timestamp()
+    # Three days at 3 kW, the peak hour of the last day is at 6 kW
+    samples = _constant_power(start, 72, 3000.0)
+    peak = start + (2 * 24 + 18) * 3600
+    samples = [
+        (timestamp, 6000.0 if peak <= timestamp < peak + 3600 else watt)
+        for timestamp, watt in samples
+    ]
+
+    result = await async_replay(hass, BENCHMARK_CONFIG, samples)
+
+    # The last hour has not ended when the last update arrives
+    assert len(result.hours) == 71
+    assert [hour.day for hour, _ in result.hours[:25:24]] == [30, 31]
+    energies = {
+        (hour.month, hour.day, hour.hour): energy for hour, energy in result.hours
+    }
+    assert energies[(1, 30, 0)] == pytest.approx(3.0)
+    assert energies[(2, 1, 18)] == pytest.approx(6.0, abs=0.06)
+
+    january, february = result.months
+    assert (january.year, january.month) == (2025, 1)
+    assert [hour.day for hour in january.top_three] == [30, 31]
+    assert january.average == pytest.approx(3.0)
+    assert (january.level_name, january.level_price) == ("Medium", 100)
+    assert (february.year, february.month) == (2025, 2)
+    assert february.top_three[0].hour == 18
+    assert february.average == pytest.approx(6.0, abs=0.06)
+    assert (february.level_name, february.level_price) == ("High", 200)
+
+    # The replayed instance is removed
+    assert hass.states.get(REPLAY_METER) is None
+
+
+async def test_hour_and_month_closed_events(hass, freezer):
+    """One event per closed hour and month, with the peaks at the time."""
+    await hass.config.async_set_time_zone("Europe/Oslo")
+    freezer.move_to("2030-06-15 12:00:00+00:00")
+    start = datetime(2025, 1, 31, 21, tzinfo=dt.get_default_time_zone()).timestamp()
+    # 3 kW, and 6 kW from 22:00 to 23:00
+    samples = [
+        (timestamp, 6000.0 if 3600 <= timestamp - start < 7200 else watt)
+        for timestamp, watt in _constant_power(start, 5, 3000.0)
+    ]
+    hours = async_capture_events(hass, EVENT_HOUR_CLOSED)
+    months = async_capture_events(hass, EVENT_MONTH_CLOSED)
+
+    await async_replay(hass, BENCHMARK_CONFIG, samples)
+
+    assert [event.data["start"] for event in hours] == [
+        "2025-01-31T21:00:00+01:00",
+        "2025-01-31T22:00:00+01:00",
+        "2025-01-31T23:00:00+01:00",
+        "2025-02-01T00:00:00+01:00",
+    ]
+    assert hours[1].data == {
+        "entity_id": REPLAY_METER,
+        "start": "2025-01-31T22:00:00+01:00",
+        "energy": 6.0,
+        "peak": True,
+        "average": 6.0,
+        "level": "High",
+        "threshold": 10.0,
+    }
+    # Lower than the peak hour of the same day
+    assert hours[2].data["peak"] is False
+    # The first hour of February starts new peaks
+    assert hours[3].data["peak"] is True
+    assert (hours[3].data["average"], hours[3].data["level"]) == (3.0, "Medium")
+
+    assert len(months) == 1
+    assert months[0].data == {
+        "entity_id": REPLAY_METER,
+        "year": 2025,
+        "month": 1,
+        "peaks": [{"day": 31, "hour": 22, "energy": 6.0}],
+        "average": 6.0,
+        "level": "High",
+        "threshold": 10.0,
+    }
+
+
+async def test_replay_is_repeatable(hass):
+    """Replays start from empty peaks and give the same result."""
+    start = datetime(2025, 5, 1, tzinfo=dt.get_default_time_zone()).timestamp()
+    samples = _constant_power(start, 5, 2500.0, interval=10)
+
+    first = await async_replay(hass, BENCHMARK_CONFIG, samples)
+    second = await async_replay(hass, BENCHMARK_CONFIG, samples)
+
+    assert first == second
+    assert [energy for _, energy in first.hours] == pytest.approx([2.5] * 4)
+
+
+async def test_replay_without_samples(hass):
+    """Nothing is set up for an empty replay."""
+    result = await async_replay(hass, BENCHMARK_CONFIG, [])
+
+    assert result.hours == []
+    assert result.months == []
+    assert hass.states.async_entity_ids("sensor") == []
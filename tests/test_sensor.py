@@ -1,7 +1,12 @@
 """Test energytariff sensor platform."""
+
+import gc
+import time
+import tracemalloc
 import pytest
 from datetime import datetime, timedelta, timezone
-from unittest.mock import Mock, patch, AsyncMock, MagicMock
+from zoneinfo import ZoneInfo
+from unittest.mock import Mock, patch, MagicMock
 from homeassistant.util import dt
 from homeassistant.const import (
     STATE_UNAVAILABLE,
@@ -9,11 +14,17 @@ from homeassistant.const import (
     UnitOfEnergy,
     UnitOfPower,
 )
-from homeassistant.core import Event, EventStateChangedData
+from homeassistant.core import Event, EventStateChangedData, State
 from homeassistant.exceptions import TemplateError
+from homeassistant.helpers import entity_registry as er
 from homeassistant.helpers import template as template_helper
+from homeassistant.helpers.entity_platform import async_get_platforms
 from homeassistant.helpers.event import TrackTemplateResult
+from homeassistant.helpers.restore_state import RestoreEntity
 import voluptuous as vol
+from pytest_homeassistant_custom_component.common import (
+    mock_restore_cache_with_extra_data,
+)
 from custom_components.energytariff.sensor import (
     async_setup_platform,
     GridCapWatcherEnergySensor,
@@ -23,7 +34,6 @@ from custom_components.energytariff.sensor import (
     GridCapWatcherCurrentEffectLevelThreshold,
     GridCapacityWatcherCurrentLevelName,
     GridCapacityWatcherCurrentLevelPrice,
-    _restore_top_three,
     LEVEL_SCHEMA,
     PLATFORM_SCHEMA,
 )
@@ -31,26 +41,44 @@ from custom_components.energytariff.coordinator import (
     GridCapacityCoordinator,
     EnergyData,
     GridThresholdData,
+    PeakData,
+    PeakTracker,
+    ReplaySignal,
+    RestoredState,
+    TopHour,
+    _restore_top_three,
 )
+from custom_components.energytariff.clock import ReplayClock, hour_clock
 from custom_components.energytariff.const import (
     CONF_EFFECT_ENTITY,
+    DOMAIN,
+    RESET_TOP_THREE,
     GRID_LEVELS,
+    SENSOR_AVERAGE,
+    SENSOR_ENERGY,
+    SENSOR_THRESHOLD,
     LEVEL_PRICE,
     MAX_EFFECT_ALLOWED,
+    PUBLISH_INTERVAL,
     TARGET_ENERGY,
     ROUNDING_PRECISION,
 )
+from custom_components.energytariff.levels import Level, LevelTable
+from custom_components.energytariff.publisher import StatePublisher
+from custom_components.energytariff.engine import HourTable
+from custom_components.energytariff.utils import LOCAL_HOURS, get_publish_interval
+
+from .common import (
+    async_register_instances,
+    async_replay_meter,
+    async_setup_energytariff,
+    async_setup_instances,
+)
 
 # Import Home Assistant test fixtures
 pytest_plugins = "pytest_homeassistant_custom_component"
 
 
-@pytest.fixture
-def expected_lingering_timers():
-    """Allow lingering timers for sensor tests with time tracking."""
-    return True
-
-
 @pytest.fixture
 def basic_config():
     """Create a basic sensor configuration."""
@@ -91,6 +119,13 @@ async def mock_coordinator(hass):
     return GridCapacityCoordinator(hass)
 
 
+def _peak_data(top_three: list, year: int = 2025, month: int = 5) -> PeakData:
+    """Return peaks as published by the coordinator for the given top hours."""
+    tracker = PeakTracker()
+    tracker.restore(top_three, year, month)
+    return tracker.data
+
+
 @pytest.mark.asyncio
 async def test_async_setup_platform_basic(hass, basic_config):
     """Test sensor platform setup with basic configuration."""
@@ -145,7 +180,7 @@ async def test_energy_sensor_initialization(hass, basic_config, mock_coordinator
     assert sensor.name == "Energy used this hour"
     assert sensor._effect_sensor_id == "sensor.power_meter"
     assert sensor._precision == 2
-    assert sensor._state is None
+    assert sensor._meter.energy is None
     assert sensor.available is True
     assert sensor.native_value is None
     assert sensor.icon == "mdi:lightning-bolt"
@@ -155,7 +190,7 @@ async def test_energy_sensor_initialization(hass, basic_config, mock_coordinator
 async def test_energy_sensor_properties(hass, basic_config, mock_coordinator):
     """Test GridCapWatcherEnergySensor properties."""
     sensor = GridCapWatcherEnergySensor(hass, basic_config, mock_coordinator)
-    sensor._state = 3.456789
+    sensor._meter.energy = 3.456789
     
     assert sensor.native_value == 3.46
     assert sensor.unique_id == "energytariff_power_meter_consumption_kWh"
@@ -165,31 +200,37 @@ async def test_energy_sensor_properties(hass, basic_config, mock_coordinator):
 async def test_energy_sensor_hourly_reset(hass, basic_config, mock_coordinator):
     """Test hourly reset functionality."""
     sensor = GridCapWatcherEnergySensor(hass, basic_config, mock_coordinator)
-    sensor._state = 5.5
-    sensor.async_schedule_update_ha_state = Mock()
+    sensor._meter.energy = 5.5
+    sensor._meter.hour = LOCAL_HOURS.hour_at(time.time())
+    sensor.async_write_ha_state = Mock()
+    mock_coordinator.hourclose.subscribe(sensor._hour_closed)
     
-    sensor.hourly_reset(dt.now())
+    mock_coordinator.close_hour(sensor._meter.hour)
     
-    assert sensor._state == 0
-    assert sensor.async_schedule_update_ha_state.called
+    assert sensor._meter.energy == 0
+    assert sensor.async_write_ha_state.called
+    assert sensor._meter.hour.start == mock_coordinator.hourclose.value.end
 
 
 @pytest.mark.asyncio
 async def test_energy_sensor_state_change(hass, basic_config, mock_coordinator):
     """Test energy sensor state change callback."""
     sensor = GridCapWatcherEnergySensor(hass, basic_config, mock_coordinator)
-    sensor.async_schedule_update_ha_state = Mock()
-    
-    # Create mock states
-    old_state = Mock()
-    old_state.state = "1000"  # 1000W
-    old_state.attributes = {"unit_of_measurement": "W"}
-    old_state.last_updated = dt.now() - timedelta(seconds=1800)  # 30 minutes ago
+    sensor.async_write_ha_state = Mock()
     
-    new_state = Mock()
-    new_state.state = "1000"
-    new_state.attributes = {"unit_of_measurement": "W"}
-    new_state.last_updated = dt.now()
+    # Create meter states, 1000W
+    old_state = State(
+        "sensor.power_meter",
+        "1000",
+        {"unit_of_measurement": "W"},
+        last_updated=dt.utcnow() - timedelta(seconds=1800),  # 30 minutes ago
+    )
+    new_state = State(
+        "sensor.power_meter",
+        "1000",
+        {"unit_of_measurement": "W"},
+        last_updated=dt.utcnow(),
+    )
     
     # Create event
     event_data = {"old_state": old_state, "new_state": new_state}
@@ -199,16 +240,16 @@ async def test_energy_sensor_state_change(hass, basic_config, mock_coordinator):
     sensor._async_on_change(event)
     
     # 1000W for 30 minutes = 0.5 kWh
-    assert sensor._state is not None
-    assert sensor._state > 0
-    assert sensor.async_schedule_update_ha_state.called
+    assert sensor._meter.energy is not None
+    assert sensor._meter.energy > 0
+    assert sensor.async_write_ha_state.called
 
 
 @pytest.mark.asyncio
 async def test_energy_sensor_ignores_unavailable_state(hass, basic_config, mock_coordinator):
     """Test that sensor ignores unavailable states."""
     sensor = GridCapWatcherEnergySensor(hass, basic_config, mock_coordinator)
-    sensor._state = 1.0
+    sensor._meter.energy = 1.0
     
     old_state = Mock()
     old_state.state = STATE_UNAVAILABLE
@@ -223,7 +264,7 @@ async def test_energy_sensor_ignores_unavailable_state(hass, basic_config, mock_
     sensor._async_on_change(event)
     
     # State should remain unchanged
-    assert sensor._state == 1.0
+    assert sensor._meter.energy == 1.0
 
 
 @pytest.mark.asyncio
@@ -241,7 +282,7 @@ async def test_estimated_energy_sensor_initialization(hass, basic_config, mock_c
 async def test_estimated_energy_sensor_state_change(hass, basic_config, mock_coordinator):
     """Test estimated energy sensor state change."""
     sensor = GridCapWatcherEstimatedEnergySensor(hass, basic_config, mock_coordinator)
-    sensor.schedule_update_ha_state = Mock()
+    sensor.async_write_ha_state = Mock()
     
     # Create energy data: 2 kWh consumed, 1000W current power, 30 minutes remaining
     timestamp = dt.now() - timedelta(minutes=30)
@@ -251,7 +292,7 @@ async def test_estimated_energy_sensor_state_change(hass, basic_config, mock_coo
     
     # Should estimate: 2 kWh + (1000W * 1800s / 3600 / 1000) = 2 + 0.5 = 2.5 kWh
     assert sensor._state is not None
-    assert sensor.schedule_update_ha_state.called
+    assert sensor.async_write_ha_state.called
 
 
 @pytest.mark.asyncio
@@ -260,18 +301,18 @@ async def test_estimated_energy_subscribes_only_after_added_to_hass(
 ):
     """Regression #47: estimated sensor must ignore pre-add coordinator emissions."""
     sensor = GridCapWatcherEstimatedEnergySensor(hass, basic_config, mock_coordinator)
-    sensor.schedule_update_ha_state = Mock()
+    sensor.async_write_ha_state = Mock()
 
-    mock_coordinator.effectstate.on_next(EnergyData(2.0, 1000.0, dt.now()))
+    mock_coordinator.effectstate.publish(EnergyData(2.0, 1000.0, dt.now()))
     assert sensor._state is None
-    assert not sensor.schedule_update_ha_state.called
+    assert not sensor.async_write_ha_state.called
 
     await sensor.async_added_to_hass()
 
-    sensor.schedule_update_ha_state.reset_mock()
-    mock_coordinator.effectstate.on_next(EnergyData(2.0, 1000.0, dt.now()))
+    sensor.async_write_ha_state.reset_mock()
+    mock_coordinator.effectstate.publish(EnergyData(3.0, 1000.0, dt.now()))
     assert sensor._state is not None
-    assert sensor.schedule_update_ha_state.called
+    assert sensor.async_write_ha_state.called
 
 
 @pytest.mark.asyncio
@@ -288,24 +329,22 @@ async def test_average_peak_hours_initialization(hass, basic_config, mock_coordi
 async def test_average_peak_hours_state_change(hass, basic_config, mock_coordinator):
     """Test average peak hours state change."""
     sensor = GridCapWatcherAverageThreePeakHours(hass, basic_config, mock_coordinator)
-    sensor.schedule_update_ha_state = Mock()
-    
-    # Manually set up top three hours
-    sensor.attr["top_three"] = [
-        {"day": 1, "hour": 10, "energy": 5.0},
-        {"day": 2, "hour": 11, "energy": 6.0},
-        {"day": 3, "hour": 12, "energy": 7.0},
-    ]
+    sensor.async_write_ha_state = Mock()
     
-    timestamp = dt.now()
-    energy_data = EnergyData(4.0, 1000.0, timestamp)
-    
-    sensor._initialized = True
-    sensor._state_change(energy_data)
+    sensor._peaks_change(
+        _peak_data(
+            [
+                {"day": 1, "hour": 10, "energy": 5.0},
+                {"day": 2, "hour": 11, "energy": 6.0},
+                {"day": 3, "hour": 12, "energy": 7.0},
+            ]
+        )
+    )
     
     # Average of current top_three values
-    assert sensor._state is not None
-    assert sensor.schedule_update_ha_state.called
+    assert sensor._state == pytest.approx(6.0)
+    assert [e["day"] for e in sensor.attr["top_three"]] == [1, 2, 3]
+    assert sensor.async_write_ha_state.called
 
 
 @pytest.mark.asyncio
@@ -327,7 +366,7 @@ async def test_available_effect_calculation(hass, config_with_limits, mock_coord
     sensor = GridCapWatcherAvailableEffectRemainingHour(
         hass, config_with_limits, mock_coordinator
     )
-    sensor.schedule_update_ha_state = Mock()
+    sensor.async_write_ha_state = Mock()
     
     # Set energy consumed to 2 kWh, current effect 1000W
     energy_data = EnergyData(2.0, 1000.0, dt.now())
@@ -335,7 +374,7 @@ async def test_available_effect_calculation(hass, config_with_limits, mock_coord
     
     # Should have calculated available power
     assert sensor._state is not None
-    assert sensor.schedule_update_ha_state.called
+    assert sensor.async_write_ha_state.called
 
 
 @pytest.mark.asyncio
@@ -350,25 +389,26 @@ async def test_threshold_sensor_initialization(hass, config_with_levels, mock_co
     assert len(sensor._levels) == 3
 
 
-@pytest.mark.asyncio
-async def test_threshold_sensor_get_level(hass, config_with_levels, mock_coordinator):
-    """Test threshold level calculation."""
-    sensor = GridCapWatcherCurrentEffectLevelThreshold(
-        hass, config_with_levels, mock_coordinator
-    )
+def test_level_table_find(config_with_levels):
+    """Test threshold level lookup."""
+    table = LevelTable(config_with_levels[GRID_LEVELS])
     
     # Test getting correct level for different averages
-    level = sensor.get_level(1.5)
-    assert level["name"] == "Low"
-    assert level["threshold"] == 2.0
+    level = table.levels[table.find(1.5)]
+    assert level.name == "Low"
+    assert level.threshold == 2.0
     
-    level = sensor.get_level(3.0)
-    assert level["name"] == "Medium"
-    assert level["threshold"] == 5.0
+    level = table.levels[table.find(3.0)]
+    assert level.name == "Medium"
+    assert level.threshold == 5.0
     
-    level = sensor.get_level(6.0)
-    assert level["name"] == "High"
-    assert level["threshold"] == 8.0
+    level = table.levels[table.find(6.0)]
+    assert level.name == "High"
+    assert level.threshold == 8.0
+
+    # Average equal to a threshold belongs to the next level
+    assert table.levels[table.find(5.0)].name == "High"
+    assert table.find(8.0) is None
 
 
 @pytest.mark.asyncio
@@ -377,20 +417,22 @@ async def test_threshold_sensor_calculate_level(hass, config_with_levels, mock_c
     sensor = GridCapWatcherCurrentEffectLevelThreshold(
         hass, config_with_levels, mock_coordinator
     )
-    sensor.schedule_update_ha_state = Mock()
+    sensor.async_write_ha_state = Mock()
     
     # Set top three hours averaging to 3 kWh
-    sensor.attr["top_three"] = [
-        {"day": 1, "hour": 10, "energy": 2.0},
-        {"day": 2, "hour": 11, "energy": 3.0},
-        {"day": 3, "hour": 12, "energy": 4.0},
-    ]
-    
-    sensor.calculate_level()
+    sensor.calculate_level(
+        _peak_data(
+            [
+                {"day": 1, "hour": 10, "energy": 2.0},
+                {"day": 2, "hour": 11, "energy": 3.0},
+                {"day": 3, "hour": 12, "energy": 4.0},
+            ]
+        )
+    )
     
     # Average is 3.0, so should be "Medium" level with threshold 5.0
     assert sensor._state == 5.0
-    assert sensor.schedule_update_ha_state.called
+    assert sensor.async_write_ha_state.called
 
 @pytest.mark.asyncio
 async def test_threshold_sensor_calculate_level_repro(hass, config_with_levels, mock_coordinator):
@@ -398,20 +440,22 @@ async def test_threshold_sensor_calculate_level_repro(hass, config_with_levels,
     sensor = GridCapWatcherCurrentEffectLevelThreshold(
         hass, config_with_levels, mock_coordinator
     )
-    sensor.schedule_update_ha_state = Mock()
+    sensor.async_write_ha_state = Mock()
     
-    # Set top three hours averaging to 3 kWh
-    sensor.attr["top_three"] = [
-        {"day": 1, "hour": 10, "energy": 6.902},
-        {"day": 2, "hour": 11, "energy": 5.1978},
-        {"day": 3, "hour": 12, "energy": 5.487},
-    ]
-    
-    sensor.calculate_level()
+    # Set top three hours averaging to 5.86 kWh
+    sensor.calculate_level(
+        _peak_data(
+            [
+                {"day": 1, "hour": 10, "energy": 6.902},
+                {"day": 2, "hour": 11, "energy": 5.1978},
+                {"day": 3, "hour": 12, "energy": 5.487},
+            ]
+        )
+    )
     
     # Average is 5.86, so should be level with threshold 8.0
     assert sensor._state == 8.0
-    assert sensor.schedule_update_ha_state.called
+    assert sensor.async_write_ha_state.called
 
 
 @pytest.mark.asyncio
@@ -432,13 +476,13 @@ async def test_level_name_sensor_threshold_change(hass, config_with_levels, mock
     sensor = GridCapacityWatcherCurrentLevelName(
         hass, config_with_levels, mock_coordinator
     )
-    sensor.schedule_update_ha_state = Mock()
+    sensor.async_write_ha_state = Mock()
     
     threshold_data = GridThresholdData("Medium", 5.0, 100, [])
     sensor._threshold_state_change(threshold_data)
     
     assert sensor._state == "Medium"
-    assert sensor.schedule_update_ha_state.called
+    assert sensor.async_write_ha_state.called
 
 
 @pytest.mark.asyncio
@@ -449,19 +493,18 @@ async def test_level_name_subscribes_only_after_added_to_hass(
     sensor = GridCapacityWatcherCurrentLevelName(
         hass, config_with_levels, mock_coordinator
     )
-    sensor.schedule_update_ha_state = Mock()
+    sensor.async_write_ha_state = Mock()
 
-    mock_coordinator.thresholddata.on_next(GridThresholdData("Low", 2.0, 50, []))
+    mock_coordinator.thresholddata.publish(GridThresholdData("Low", 2.0, 50, []))
     assert sensor._state is None
-    assert not sensor.schedule_update_ha_state.called
+    assert not sensor.async_write_ha_state.called
 
-    sensor.async_get_last_state = AsyncMock(return_value=None)
     await sensor.async_added_to_hass()
 
-    sensor.schedule_update_ha_state.reset_mock()
-    mock_coordinator.thresholddata.on_next(GridThresholdData("High", 8.0, 200, []))
+    sensor.async_write_ha_state.reset_mock()
+    mock_coordinator.thresholddata.publish(GridThresholdData("High", 8.0, 200, []))
     assert sensor._state == "High"
-    assert sensor.schedule_update_ha_state.called
+    assert sensor.async_write_ha_state.called
 
 
 @pytest.mark.asyncio
@@ -482,13 +525,13 @@ async def test_level_price_sensor_threshold_change(hass, config_with_levels, moc
     sensor = GridCapacityWatcherCurrentLevelPrice(
         hass, config_with_levels, mock_coordinator
     )
-    sensor.schedule_update_ha_state = Mock()
+    sensor.async_write_ha_state = Mock()
     
     threshold_data = GridThresholdData("High", 8.0, 200, [])
     sensor._threshold_state_change(threshold_data)
     
     assert sensor._state == 200
-    assert sensor.schedule_update_ha_state.called
+    assert sensor.async_write_ha_state.called
 
 
 @pytest.mark.asyncio
@@ -499,19 +542,18 @@ async def test_level_price_subscribes_only_after_added_to_hass(
     sensor = GridCapacityWatcherCurrentLevelPrice(
         hass, config_with_levels, mock_coordinator
     )
-    sensor.schedule_update_ha_state = Mock()
+    sensor.async_write_ha_state = Mock()
 
-    mock_coordinator.thresholddata.on_next(GridThresholdData("Low", 2.0, 50, []))
+    mock_coordinator.thresholddata.publish(GridThresholdData("Low", 2.0, 50, []))
     assert sensor._state is None
-    assert not sensor.schedule_update_ha_state.called
+    assert not sensor.async_write_ha_state.called
 
-    sensor.async_get_last_state = AsyncMock(return_value=None)
     await sensor.async_added_to_hass()
 
-    sensor.schedule_update_ha_state.reset_mock()
-    mock_coordinator.thresholddata.on_next(GridThresholdData("Medium", 5.0, 100, []))
+    sensor.async_write_ha_state.reset_mock()
+    mock_coordinator.thresholddata.publish(GridThresholdData("Medium", 5.0, 100, []))
     assert sensor._state == 100
-    assert sensor.schedule_update_ha_state.called
+    assert sensor.async_write_ha_state.called
 
 
 @pytest.mark.asyncio
@@ -539,6 +581,99 @@ async def test_sensor_unique_ids(hass, basic_config, mock_coordinator):
     assert len(unique_ids) == len(set(unique_ids))
 
 
+@pytest.mark.asyncio
+async def test_level_sensor_unique_ids_include_meter(
+    hass, config_with_levels, mock_coordinator
+):
+    """Level name and price sensors of different meters do not collide."""
+    other_config = {**config_with_levels, CONF_EFFECT_ENTITY: "sensor.other_meter"}
+    for sensor_class in (
+        GridCapacityWatcherCurrentLevelName,
+        GridCapacityWatcherCurrentLevelPrice,
+    ):
+        first = sensor_class(hass, config_with_levels, mock_coordinator)
+        second = sensor_class(hass, other_config, mock_coordinator)
+        assert first.unique_id != second.unique_id
+
+
+async def test_multiple_instances_add_all_entities(hass):
+    """Every instance registers all its sensors."""
+    await async_setup_instances(hass, 3)
+
+    registry = er.async_get(hass)
+    entries = [
+        entry for entry in registry.entities.values() if entry.platform == DOMAIN
+    ]
+    assert len(entries) == 3 * 7
+    assert len({entry.unique_id for entry in entries}) == 3 * 7
+    assert len(hass.states.async_entity_ids("sensor")) == 3 * 7 + 3
+
+
+async def test_legacy_level_unique_ids_are_migrated(hass):
+    """Level sensors registered with the old unique ids keep their entity ids."""
+    registry = er.async_get(hass)
+    legacy = {
+        suffix: registry.async_get_or_create(
+            "sensor", DOMAIN, f"{DOMAIN}_{suffix}", suggested_object_id=suffix
+        ).entity_id
+        for suffix in ("effect_level_name", "effect_level_price")
+    }
+
+    await async_setup_energytariff(hass)
+
+    for suffix, entity_id in legacy.items():
+        entry = registry.async_get(entity_id)
+        assert entry.unique_id == f"{DOMAIN}_power_meter_{suffix}"
+        assert hass.states.get(entity_id) is not None
+    assert hass.states.get("sensor.energy_level_name") is None
+
+
+async def test_setup_restores_all_sensors_from_one_snapshot(hass):
+    """Saved states of all sensors are read once, before the sensors are added."""
+    await async_register_instances(hass, 1)
+    now = dt.as_local(dt.now())
+    top_three = [
+        {"month": now.month, "day": 1, "hour": 8, "energy": 6.0},
+        {"month": now.month, "day": 2, "hour": 9, "energy": 4.0},
+    ]
+    mock_restore_cache_with_extra_data(
+        hass,
+        [
+            (
+                State("sensor.energy_used_this_hour", "1.25"),
+                {"native_value": 1.2512, "native_unit_of_measurement": "kWh"},
+            ),
+            (
+                State(
+                    "sensor.energy_level_upper_threshold",
+                    "5.0",
+                    {"top_three": top_three},
+                ),
+                None,
+            ),
+            (State("sensor.energy_level_name", "Medium"), None),
+            (State("sensor.energy_level_price", STATE_UNAVAILABLE), None),
+        ],
+    )
+
+    # Sensors do not look up their own last state
+    with patch.object(RestoreEntity, "async_get_last_state") as last_state:
+        await async_setup_instances(hass, 1)
+    last_state.assert_not_called()
+
+    energy = next(
+        entity
+        for entity in async_get_platforms(hass, DOMAIN)[0].entities.values()
+        if isinstance(entity, GridCapWatcherEnergySensor)
+    )
+    restored = energy._coordinator.restored
+    assert restored.level_name == "Medium"
+    assert restored.level_price is None
+    assert energy._meter.energy == pytest.approx(1.2512)
+    # Peaks kept in the threshold attributes by earlier versions are merged
+    assert hass.states.get("sensor.average_peak_hour_energy").state == "5.0"
+
+
 @pytest.mark.asyncio
 async def test_sensor_units_of_measurement(hass, basic_config, config_with_limits, mock_coordinator):
     """Test that sensors have correct units of measurement."""
@@ -563,8 +698,8 @@ async def test_sensor_units_of_measurement(hass, basic_config, config_with_limit
 async def test_regression_a_exceeds_all_levels(hass, mock_coordinator):
     """Regression A (P0 — 0.3.0 silent data loss):
     When GRID_LEVELS is configured and consumption exceeds ALL configured
-    thresholds, GridCapWatcherCurrentEffectLevelThreshold.get_level() returns
-    None and never calls thresholddata.on_next().
+    thresholds, LevelTable.find() returns
+    None and never calls thresholddata.publish().
     GridCapWatcherAverageThreePeakHours._state_change() short-circuits when
     levels are configured (returns None immediately), so it never independently
     calculates top_three either.  The result: the avg sensor goes permanently
@@ -588,24 +723,19 @@ async def test_regression_a_exceeds_all_levels(hass, mock_coordinator):
     )
     avg_sensor = GridCapWatcherAverageThreePeakHours(hass, config, mock_coordinator)
 
-    threshold_sensor.schedule_update_ha_state = Mock()
-    avg_sensor.schedule_update_ha_state = Mock()
+    threshold_sensor.async_write_ha_state = Mock()
+    avg_sensor.async_write_ha_state = Mock()
 
-    # Initialize sensors as async_added_to_hass would, without touching HA storage.
-    threshold_sensor._initialized = True
-    threshold_sensor._disposables = [
-        mock_coordinator.effectstate.subscribe(threshold_sensor._state_change)
-    ]
-    avg_sensor._initialized = True
-    avg_sensor._disposables = [
-        mock_coordinator.effectstate.subscribe(avg_sensor._state_change)
-    ]
+    # Initialize as async_added_to_hass would, without restored state.
+    await mock_coordinator.async_track_peaks()
+    mock_coordinator.peakdata.subscribe(threshold_sensor._peaks_change)
+    mock_coordinator.peakdata.subscribe(avg_sensor._peaks_change)
 
     # Feed 3 hours across 3 different days — all 7.0 kWh, exceeding the 5.0 max level.
-    base_ts = datetime(2025, 1, 1, 10, 0, 0, tzinfo=timezone.utc)
+    base_ts = dt.as_local(dt.now()).replace(hour=10, minute=0)
     for day in [1, 2, 3]:
         energy_data = EnergyData(7.0, 7000.0, base_ts.replace(day=day))
-        mock_coordinator.effectstate.on_next(energy_data)
+        mock_coordinator.effectstate.publish(energy_data)
 
     # The avg sensor must have recorded the three peak hours.
     assert len(avg_sensor.attr["top_three"]) == 3, (
@@ -621,95 +751,90 @@ async def test_regression_a_exceeds_all_levels(hass, mock_coordinator):
 
 
 @pytest.mark.asyncio
-async def test_regression_b_calculate_level_emits_deep_copy(hass, config_with_levels, mock_coordinator):
-    """Regression B (Fix 2): calculate_level must broadcast a deep copy of top_three.
+async def test_regression_b_calculate_level_emits_snapshot(
+    hass, config_with_levels, mock_coordinator
+):
+    """Regression B (Fix 2): calculate_level must broadcast a snapshot of top_three.
 
     If calculate_level passes a direct reference to self.attr['top_three'], any
-    subsequent mutation of the dict entries (e.g. calculate_top_three updating
+    subsequent mutation of the dict entries (e.g. PeakTracker.update updating
     'energy'/'hour' in-place on the same dict objects) would corrupt the already-
     broadcast GridThresholdData — causing the alternating 2.59/7.59 pattern
     observed in ha_query.csv.
 
-    Fix: [dict(e) for e in self.attr['top_three']] in calculate_level.
+    Fix: calculate_level emits an immutable tuple of TopHour records.
     """
     threshold_sensor = GridCapWatcherCurrentEffectLevelThreshold(
         hass, config_with_levels, mock_coordinator
     )
-    threshold_sensor.schedule_update_ha_state = Mock()
-
-    original_entries = [
-        {"month": 5, "day": 1, "hour": 10, "energy": 2.0},
-        {"month": 5, "day": 2, "hour": 11, "energy": 3.0},
-        {"month": 5, "day": 3, "hour": 12, "energy": 4.0},
-    ]
-    threshold_sensor.attr["top_three"] = original_entries
+    threshold_sensor.async_write_ha_state = Mock()
+
+    tracker = PeakTracker()
+    tracker.restore(
+        [
+            {"month": 5, "day": 1, "hour": 10, "energy": 2.0},
+            {"month": 5, "day": 2, "hour": 11, "energy": 3.0},
+            {"month": 5, "day": 3, "hour": 12, "energy": 4.0},
+        ],
+        2025,
+        5,
+    )
 
     received: list[GridThresholdData] = []
     mock_coordinator.thresholddata.subscribe(received.append)
     received.clear()
 
-    threshold_sensor.calculate_level()
+    threshold_sensor.calculate_level(tracker.data)
 
     assert len(received) == 1
     emitted_top_three = received[0].top_three
 
-    # Mutate the threshold sensor's internal entry in-place (as calculate_top_three does).
-    original_entries[0]["energy"] = 999.0
+    # Mutate the tracked entry in-place (as PeakTracker.update does).
+    tracker.top_three[0]["energy"] = 999.0
 
-    # The emitted GridThresholdData must NOT be affected — it must be a deep copy.
-    assert emitted_top_three[0]["energy"] != 999.0, (
+    # The emitted GridThresholdData must NOT be affected — it must be a snapshot.
+    assert isinstance(emitted_top_three, tuple)
+    assert emitted_top_three[0].energy != 999.0, (
         "calculate_level emitted a reference to the internal top_three dict. "
-        "Mutating the dict after broadcast corrupted the emitted GridThresholdData. "
-        "Fix: use [dict(e) for e in self.attr['top_three']] in calculate_level."
+        "Mutating the dict after broadcast corrupted the emitted GridThresholdData."
     )
 
 
-def test_bug_a_month_collision_in_calculate_top_three():
+def test_bug_a_month_collision_in_peak_tracker():
     """Bug A (P1 — pre-existing):
-    calculate_top_three stores only 'day' (1–31), not 'month'.  If the
+    calculate_top_three stored only 'day' (1–31), not 'month'.  If the
     monthly reset is missed (HA was down at the calendar boundary), old-month
     entries persist.  When the same day number reappears in the new month,
-    calculate_top_three treats it as the *same* entry and either ignores the
-    new reading (if lower) or overwrites the old one (if higher).  The months
-    are never kept independent.
+    calculate_top_three treated it as the *same* entry and either ignored the
+    new reading (if lower) or overwrote the old one (if higher).
 
     Correct behaviour: a February day-5 reading must be treated as independent
-    from a January day-5 entry.  After the fix, each entry carries a 'month'
-    field and the collision check uses (month, day), so both months' data
-    coexist in top_three rather than shadowing each other.
+    from a January day-5 entry.  PeakTracker starts a new month on the first
+    update from it, so the January entry can never shadow February.
     """
-    from custom_components.energytariff.utils import calculate_top_three
+    tracker = PeakTracker()
 
     # January day 5, high consumption.
     jan_ts = datetime(2025, 1, 5, 8, 0, 0, tzinfo=timezone.utc)
-    jan_energy = EnergyData(5.0, 5000.0, jan_ts)
+    assert tracker.update(EnergyData(5.0, 5000.0, jan_ts))
 
-    top_three = []
-    top_three = calculate_top_three(jan_energy, top_three)
+    assert len(tracker.top_three) == 1
+    assert tracker.top_three[0]["day"] == 5
 
-    assert len(top_three) == 1
-    assert top_three[0]["day"] == 5
-
-    # Monthly reset was missed — top_three still contains the January entry.
+    # Monthly reset was missed — the tracker still holds the January entry.
     # February day 5 arrives with a lower energy value (2.0 kWh).
     feb_ts = datetime(2025, 2, 5, 9, 0, 0, tzinfo=timezone.utc)
-    feb_energy = EnergyData(2.0, 2000.0, feb_ts)
-
-    top_three = calculate_top_three(feb_energy, top_three)
+    assert tracker.update(EnergyData(2.0, 2000.0, feb_ts))
 
-    # The February entry must be represented independently (carries month=2).
-    # Currently FAILS because calculate_top_three only checks 'day', so Feb day-5
-    # collides with Jan day-5.  Since 2.0 < 5.0 the Feb reading is silently ignored
-    # and 'month' is never stored.
     assert any(
-        e.get("month") == 2 and int(e["day"]) == 5 for e in top_three
-    ), (
-        f"No February (month=2) day-5 entry found in top_three: {top_three}. "
-        "Bug: calculate_top_three uses only 'day' for collision detection, so "
-        "February day-5 shadows/matches January day-5 instead of being tracked "
-        "independently."
-    )
+        e.get("month") == 2 and int(e["day"]) == 5 for e in tracker.top_three
+    ), f"No February (month=2) day-5 entry found in top_three: {tracker.top_three}."
+    assert all(e["month"] == 2 for e in tracker.top_three)
+    assert tracker.data.month == 2
 
+    # A late update from January must not reopen the closed month
+    assert not tracker.update(EnergyData(9.0, 9000.0, jan_ts))
+    assert tracker.month == 2
 
 
 # --- Upgrade migration: _restore_top_three ---
@@ -735,8 +860,7 @@ def test_restore_top_three_legacy_no_month_field():
             {"day": 8, "hour": 18, "energy": 9.5},
         ]
     }
-    attr = {"top_three": []}
-    _restore_top_three(savedstate, attr)
+    attr = {"top_three": _restore_top_three(savedstate, current_month)}
 
     assert len(attr["top_three"]) == 3, (
         f"Expected 3 legacy entries to be restored, got {len(attr['top_three'])}. "
@@ -760,8 +884,7 @@ def test_restore_top_three_prior_month_entries_discarded():
             {"month": prior_month, "day": 12, "hour": 14, "energy": 7.5},
         ]
     }
-    attr = {"top_three": []}
-    _restore_top_three(savedstate, attr)
+    attr = {"top_three": _restore_top_three(savedstate, current_month)}
 
     assert len(attr["top_three"]) == 0, (
         f"Expected prior-month (month={prior_month}) entries to be discarded, "
@@ -783,8 +906,7 @@ def test_restore_top_three_mixed_format():
             {"month": prior_month, "day": 8, "hour": 18, "energy": 9.5},    # prior month
         ]
     }
-    attr = {"top_three": []}
-    _restore_top_three(savedstate, attr)
+    attr = {"top_three": _restore_top_three(savedstate, current_month)}
 
     assert len(attr["top_three"]) == 2, (
         f"Expected 2 current-month entries (1 legacy + 1 modern), "
@@ -801,12 +923,12 @@ async def test_restore_top_three_bug_b_still_fixed(hass, config_with_levels, moc
     After Fix 1, avg does NOT subscribe to thresholddata. Any thresholddata
     emission — including those with mutated or cleared source lists — must have
     zero effect on avg's top_three. The only way avg's top_three changes is via
-    effectstate (_state_change).
+    the peaks published by the coordinator (_peaks_change).
     """
     avg_sensor = GridCapWatcherAverageThreePeakHours(
         hass, config_with_levels, mock_coordinator
     )
-    avg_sensor.schedule_update_ha_state = Mock()
+    avg_sensor.async_write_ha_state = Mock()
 
     savedstate = Mock()
     savedstate.attributes = {
@@ -816,7 +938,9 @@ async def test_restore_top_three_bug_b_still_fixed(hass, config_with_levels, moc
             {"day": 8, "hour": 18, "energy": 9.5},
         ]
     }
-    _restore_top_three(savedstate, avg_sensor.attr)
+    avg_sensor.attr["top_three"] = _restore_top_three(
+        savedstate, dt.as_local(dt.now()).month
+    )
     assert len(avg_sensor.attr["top_three"]) == 3, "Precondition: legacy restore must succeed"
 
     # Emit thresholddata — avg is NOT subscribed, so this must be a no-op.
@@ -825,7 +949,7 @@ async def test_restore_top_three_bug_b_still_fixed(hass, config_with_levels, moc
         {"month": 1, "day": 14, "hour": 18, "energy": 9.7},
         {"month": 1, "day": 8, "hour": 18, "energy": 9.5},
     ]
-    mock_coordinator.thresholddata.on_next(
+    mock_coordinator.thresholddata.publish(
         GridThresholdData("High", 8.0, 200, source_list)
     )
     assert len(avg_sensor.attr["top_three"]) == 3, (
@@ -848,28 +972,29 @@ async def test_restore_top_three_bug_b_still_fixed(hass, config_with_levels, moc
 async def test_level_price_static_number_unchanged(hass, config_with_levels, mock_coordinator):
     """Regression guard: a numeric price (int or float) must work exactly as before.
 
-    Verifies that after calculate_level() fires, thresholddata.on_next() receives a
+    Verifies that after calculate_level() fires, thresholddata.publish() receives a
     GridThresholdData whose price is the correct float — no regression from adding
     template support.
     """
     sensor = GridCapWatcherCurrentEffectLevelThreshold(
         hass, config_with_levels, mock_coordinator
     )
-    sensor.schedule_update_ha_state = Mock()
+    sensor.async_write_ha_state = Mock()
 
     # Average of 3.0 kWh -> "Medium" level, price=100
-    sensor.attr["top_three"] = [
-        {"day": 1, "hour": 10, "energy": 2.0},
-        {"day": 2, "hour": 11, "energy": 3.0},
-        {"day": 3, "hour": 12, "energy": 4.0},
-    ]
+    peaks = _peak_data(
+        [
+            {"day": 1, "hour": 10, "energy": 2.0},
+            {"day": 2, "hour": 11, "energy": 3.0},
+            {"day": 3, "hour": 12, "energy": 4.0},
+        ]
+    )
 
     received: list[GridThresholdData] = []
     mock_coordinator.thresholddata.subscribe(received.append)
-    # Drain the initial None emitted by BehaviorSubject
     received.clear()
 
-    result = sensor.calculate_level()
+    result = sensor.calculate_level(peaks)
 
     assert result is True
     assert len(received) == 1
@@ -877,127 +1002,122 @@ async def test_level_price_static_number_unchanged(hass, config_with_levels, moc
     assert isinstance(received[0].price, float)
 
 
-@pytest.mark.asyncio
-async def test_level_price_template_renders_correctly(hass, mock_coordinator):
-    """Happy path: a Template object stored as the price renders to a float correctly.
-
-    Simulates what Geordi's __init__ pre-processing will do: convert the raw template
-    string to a Template object. We inject the mock directly so the test is independent
-    of the __init__ implementation detail — what matters is that calculate_level()
-    resolves it and broadcasts the rendered float.
-    """
-    from homeassistant.helpers import template as template_helper
-
-    config = {
+def _price_template_config(hass, price_template: str) -> dict:
+    return {
         CONF_EFFECT_ENTITY: "sensor.power_meter",
         ROUNDING_PRECISION: 2,
         GRID_LEVELS: [
-            {"name": "Low", "threshold": 2.0, "price": 50},
+            {
+                "name": "Low",
+                "threshold": 2.0,
+                "price": template_helper.Template(price_template, hass),
+            },
             {"name": "Medium", "threshold": 5.0, "price": 100},
         ],
     }
 
-    sensor = GridCapWatcherCurrentEffectLevelThreshold(hass, config, mock_coordinator)
-    sensor.schedule_update_ha_state = Mock()
 
-    # Replace the numeric price with a mock Template object that renders to 175.0
-    mock_template = Mock(spec=template_helper.Template)
-    mock_template.render.return_value = 175.0
-    sensor._levels[0][LEVEL_PRICE] = mock_template  # "Low" level
+async def _added_threshold_sensor(hass, config, coordinator):
+    sensor = GridCapWatcherCurrentEffectLevelThreshold(hass, config, coordinator)
+    sensor.async_write_ha_state = Mock()
+    await sensor.async_added_to_hass()
+    return sensor
 
-    # Average of 1.0 kWh -> "Low" level (threshold 2.0, price now a template)
-    sensor.attr["top_three"] = [
-        {"day": 1, "hour": 10, "energy": 1.0},
-    ]
+
+@pytest.mark.asyncio
+async def test_level_price_template_renders_correctly(hass, mock_coordinator):
+    """Happy path: a template price is rendered to a float and broadcast."""
+    hass.states.async_set("sensor.grid_price", "175")
+    config = _price_template_config(hass, "{{ states('sensor.grid_price') | float }}")
+    sensor = await _added_threshold_sensor(hass, config, mock_coordinator)
 
     received: list[GridThresholdData] = []
     mock_coordinator.thresholddata.subscribe(received.append)
     received.clear()
 
-    result = sensor.calculate_level()
+    # Average of 1.0 kWh -> "Low" level (threshold 2.0, price is a template)
+    result = sensor.calculate_level(_peak_data([{"day": 1, "hour": 10, "energy": 1.0}]))
 
     assert result is True
     assert len(received) == 1
     assert received[0].price == 175.0
-    mock_template.render.assert_called_once_with(parse_result=True)
+    sensor._call_on_remove_callbacks()
 
 
 @pytest.mark.asyncio
-async def test_level_price_template_entity_unavailable(hass, mock_coordinator):
-    """Graceful degradation: template raises TemplateError (entity unavailable).
+async def test_level_price_template_tracks_entity_changes(hass, mock_coordinator):
+    """Template prices are rendered when a referenced entity changes, and the
+    new price is broadcast without waiting for a meter update."""
+    hass.states.async_set("sensor.grid_price", "175")
+    config = _price_template_config(hass, "{{ states('sensor.grid_price') | float }}")
+    sensor = await _added_threshold_sensor(hass, config, mock_coordinator)
+    received: list[GridThresholdData] = []
+    mock_coordinator.thresholddata.subscribe(received.append)
 
-    calculate_level() must return False, must NOT call thresholddata.on_next(),
-    and must not raise an unhandled exception.
-    """
-    from homeassistant.helpers import template as template_helper
+    mock_coordinator.peaks.restore([{"day": 1, "hour": 10, "energy": 1.0}], 2025, 5)
+    mock_coordinator.peakdata.publish(mock_coordinator.peaks.data)
+    assert received[-1].price == 175.0
 
-    config = {
-        CONF_EFFECT_ENTITY: "sensor.power_meter",
-        ROUNDING_PRECISION: 2,
-        GRID_LEVELS: [
-            {"name": "Low", "threshold": 2.0, "price": 50},
-        ],
-    }
+    with patch.object(
+        template_helper.Template, "async_render", autospec=True
+    ) as render:
+        for _ in range(10):
+            sensor.calculate_level(mock_coordinator.peaks.data)
+    render.assert_not_called()
 
-    sensor = GridCapWatcherCurrentEffectLevelThreshold(hass, config, mock_coordinator)
-    sensor.schedule_update_ha_state = Mock()
+    hass.states.async_set("sensor.grid_price", "190")
+    await hass.async_block_till_done()
 
-    # Template that raises TemplateError — simulates a missing/unavailable entity
-    mock_template = Mock(spec=template_helper.Template)
-    mock_template.render.side_effect = TemplateError(Exception("unavailable"))
-    sensor._levels[0][LEVEL_PRICE] = mock_template
+    assert received[-1].price == 190.0
+    assert sensor._prices[0] == 190.0
+    sensor._call_on_remove_callbacks()
 
-    sensor.attr["top_three"] = [
-        {"day": 1, "hour": 10, "energy": 1.0},
-    ]
+
+@pytest.mark.asyncio
+async def test_level_price_template_entity_unavailable(hass, mock_coordinator):
+    """Graceful degradation: template raises TemplateError (entity unavailable).
+
+    calculate_level() must return False, must NOT call thresholddata.publish(),
+    and must not raise an unhandled exception.
+    """
+    hass.states.async_set("sensor.grid_price", STATE_UNAVAILABLE)
+    config = _price_template_config(hass, "{{ states('sensor.grid_price') | float }}")
+    sensor = await _added_threshold_sensor(hass, config, mock_coordinator)
 
     received: list[GridThresholdData] = []
     mock_coordinator.thresholddata.subscribe(received.append)
     received.clear()
 
-    result = sensor.calculate_level()
+    result = sensor.calculate_level(_peak_data([{"day": 1, "hour": 10, "energy": 1.0}]))
 
     assert result is False
-    assert len(received) == 0, "thresholddata.on_next() must NOT be called when template fails"
+    assert (
+        len(received) == 0
+    ), "thresholddata.publish() must NOT be called when template fails"
+    sensor._call_on_remove_callbacks()
 
 
 @pytest.mark.asyncio
 async def test_level_price_template_non_numeric_result(hass, mock_coordinator):
     """ValueError path: template renders to a non-numeric string.
 
-    calculate_level() must catch the ValueError, log it, return False, and must NOT
-    call thresholddata.on_next(). No unhandled exception must propagate.
+    calculate_level() must return False and must NOT call thresholddata.publish().
+    No unhandled exception must propagate.
     """
-    from homeassistant.helpers import template as template_helper
-
-    config = {
-        CONF_EFFECT_ENTITY: "sensor.power_meter",
-        ROUNDING_PRECISION: 2,
-        GRID_LEVELS: [
-            {"name": "Low", "threshold": 2.0, "price": 50},
-        ],
-    }
-
-    sensor = GridCapWatcherCurrentEffectLevelThreshold(hass, config, mock_coordinator)
-    sensor.schedule_update_ha_state = Mock()
-
-    # Template renders to a non-numeric string — float() will raise ValueError
-    mock_template = Mock(spec=template_helper.Template)
-    mock_template.render.return_value = "not-a-number"
-    sensor._levels[0][LEVEL_PRICE] = mock_template
-
-    sensor.attr["top_three"] = [
-        {"day": 1, "hour": 10, "energy": 1.0},
-    ]
+    config = _price_template_config(hass, "{{ 'not-a-number' }}")
+    sensor = await _added_threshold_sensor(hass, config, mock_coordinator)
 
     received: list[GridThresholdData] = []
     mock_coordinator.thresholddata.subscribe(received.append)
     received.clear()
 
-    result = sensor.calculate_level()
+    result = sensor.calculate_level(_peak_data([{"day": 1, "hour": 10, "energy": 1.0}]))
 
     assert result is False
-    assert len(received) == 0, "thresholddata.on_next() must NOT be called when price is non-numeric"
+    assert (
+        len(received) == 0
+    ), "thresholddata.publish() must NOT be called when price is non-numeric"
+    sensor._call_on_remove_callbacks()
 
 
 def test_schema_accepts_template_string():
@@ -1041,49 +1161,41 @@ def test_schema_rejects_invalid_template():
 async def test_regression_c_race_condition_threshold_uninitialized(
     hass, config_with_levels, mock_coordinator
 ):
-    """Regression C (root-cause fix): startup race condition must not corrupt avg sensor.
+    """Regression C (root-cause fix): startup race condition must not corrupt peaks.
 
-    Scenario: avg sensor is fully initialized (top_three restored from HA state).
-    Threshold sensor has NOT yet completed async_added_to_hass (top_three empty,
-    _initialized=False).  An effectstate event fires in this window (e.g. power
-    meter comes back online after a long outage).
+    Scenario: peaks are restored, but an effectstate event from before the
+    restart (stale 5.01 kWh from a previous month) is the last meter value and
+    is replayed when peak tracking starts.
 
     Old behaviour: threshold._state_change ran with empty top_three, emitted
     thresholddata([{energy:5.01}]), avg._threshold_state_change overwrote the
     correctly-restored top_three.
 
-    Correct behaviour: threshold sensor must ignore the event while _initialized
-    is False, so avg sensor's restored top_three is never corrupted.
+    Correct behaviour: the coordinator restores peaks before it subscribes to
+    meter updates, and ignores updates from a month that is already closed.
     """
     restored_top_three = [
-        {"month": 4, "day": 1, "hour": 10, "energy": 6.30},
-        {"month": 4, "day": 2, "hour": 14, "energy": 7.85},
-        {"month": 4, "day": 3, "hour": 9, "energy": 7.28},
+        {"day": 1, "hour": 10, "energy": 6.30},
+        {"day": 2, "hour": 14, "energy": 7.85},
+        {"day": 3, "hour": 9, "energy": 7.28},
     ]
 
-    # avg sensor: fully initialized with restored top_three.
+    # effectstate fires before any sensor has been added.
+    stale_energy = EnergyData(5.01, 5010.0, dt.now() - timedelta(days=40))
+    mock_coordinator.effectstate.publish(stale_energy)
+
     avg_sensor = GridCapWatcherAverageThreePeakHours(
         hass, config_with_levels, mock_coordinator
     )
-    avg_sensor.schedule_update_ha_state = Mock()
-    avg_sensor.attr["top_three"] = list(restored_top_three)
-    avg_sensor._initialized = True
-    avg_sensor._disposables = [
-        mock_coordinator.effectstate.subscribe(avg_sensor._state_change),
-        # avg does NOT subscribe to thresholddata (Fix 1).
-    ]
-
-    # threshold sensor: created but async_added_to_hass has NOT run (_initialized=False).
-    threshold_sensor = GridCapWatcherCurrentEffectLevelThreshold(
-        hass, config_with_levels, mock_coordinator
+    avg_sensor.async_write_ha_state = Mock()
+    mock_coordinator.restored = RestoredState(
+        {
+            SENSOR_AVERAGE: Mock(
+                state="7.14", attributes={"top_three": restored_top_three}
+            )
+        }
     )
-    threshold_sensor.schedule_update_ha_state = Mock()
-    # _initialized remains False — threshold is not subscribed yet.
-
-    # effectstate fires while threshold is uninitialized (stale 5.01 kWh from last save).
-    stale_ts = datetime(2026, 4, 27, 5, 44, 0, tzinfo=timezone.utc)
-    stale_energy = EnergyData(5.01, 5010.0, stale_ts)
-    mock_coordinator.effectstate.on_next(stale_energy)
+    await avg_sensor.async_added_to_hass()
 
     # avg sensor must still have its 3 restored entries — NOT the stale 5.01 single entry.
     assert len(avg_sensor.attr["top_three"]) == 3, (
@@ -1094,63 +1206,57 @@ async def test_regression_c_race_condition_threshold_uninitialized(
     assert 5.01 not in energies, (
         "avg top_three was overwritten with the stale single-entry thresholddata."
     )
-    # State must still reflect original restored average, not the stale 5.01.
     expected_avg = sum(e["energy"] for e in restored_top_three) / 3
-    # (avg._state_change ran for effectstate, but 5.01 < all restored entries so no change)
-    assert avg_sensor._state is None or avg_sensor._state != pytest.approx(5.01, abs=0.01), (
-        "avg sensor _state was corrupted to 5.01 by the startup race condition."
-    )
+    assert avg_sensor._state == pytest.approx(expected_avg)
 
 
 @pytest.mark.asyncio
-async def test_regression_e_avg_maintains_independent_top_three(
+async def test_regression_e_sensors_share_one_top_three(
     hass, config_with_levels, mock_coordinator
 ):
-    """Regression E: avg sensor maintains its own top_three independently of threshold.
+    """Regression E: threshold and avg sensors show the same peak hours.
 
-    After Fix 1 (remove thresholddata subscription from avg), avg and threshold
-    each compute top_three from effectstate events they each observe.
-
-    After Fix 3/4 (_initialized=True before subscribe), BehaviorSubject replays the
-    last effectstate value immediately when avg subscribes.  avg therefore DOES receive
-    the gap event via replay — this is correct and expected.
+    Each sensor used to keep its own top_three, computed from the effectstate
+    events it happened to observe, and the copies diverged around restarts.
+    Both now read the peaks tracked by the coordinator.
 
     Scenario:
       1. Threshold initialises first with restored top_three [day1, day2, day3].
-      2. Gap AMS event fires (day4=2.7 kWh) — threshold processes it via BehaviorSubject.
-         Threshold top_three now includes day4 (replaces lowest day3=2.5).
-      3. Avg initialises with SAME restored data [day1, day2, day3].
-         Avg subscribes to effectstate only (NOT thresholddata).
-         BehaviorSubject replays gap event to avg immediately on subscribe.
-         Avg also processes day4 (replaces day3=2.5).
+      2. Gap AMS event fires (day4=2.7 kWh) before avg is added.
+         It replaces the lowest restored day (day3=2.5).
+      3. Avg initialises with the SAME restored data.
       4. Next AMS event fires (0.5 kWh — won't displace any peak).
 
-    Correct behaviour after Fix 3/4:
-      - avg top_three includes day4 (received via BehaviorSubject effectstate replay).
-      - avg did NOT receive day4 via thresholddata — it computed independently.
-      - avg's calculation matches expected: day4=2.7 displaced day3=2.5.
+    Correct behaviour: avg shows day4 even though it was not subscribed when
+    the gap event fired, and both sensors show identical top_three.
     """
+    now = dt.as_local(dt.now())
     restored_top_three = [
-        {"month": 5, "day": 1, "hour": 17, "energy": 3.0},
-        {"month": 5, "day": 2, "hour": 18, "energy": 2.8},
-        {"month": 5, "day": 3, "hour": 16, "energy": 2.5},
+        {"day": 1, "hour": 17, "energy": 3.0},
+        {"day": 2, "hour": 18, "energy": 2.8},
+        {"day": 3, "hour": 16, "energy": 2.5},
     ]
 
+    def saved_state():
+        return Mock(
+            state=STATE_UNKNOWN,
+            attributes={"top_three": [dict(e) for e in restored_top_three]},
+        )
+
+    mock_coordinator.restored = RestoredState(
+        {SENSOR_THRESHOLD: saved_state(), SENSOR_AVERAGE: saved_state()}
+    )
+
     # --- Threshold sensor initialises first ---
     threshold_sensor = GridCapWatcherCurrentEffectLevelThreshold(
         hass, config_with_levels, mock_coordinator
     )
-    threshold_sensor.schedule_update_ha_state = Mock()
-    threshold_sensor.attr["top_three"] = [dict(e) for e in restored_top_three]
-    threshold_sensor._initialized = True
-    threshold_sensor._disposables = [
-        mock_coordinator.effectstate.subscribe(threshold_sensor._state_change)
-    ]
+    threshold_sensor.async_write_ha_state = Mock()
+    await threshold_sensor.async_added_to_hass()
 
-    # --- Gap event: threshold processes, avg not yet subscribed ---
-    gap_ts = datetime(2026, 5, 4, 10, 0, 0, tzinfo=timezone.utc)
-    gap_event = EnergyData(2.7, 2700.0, gap_ts)
-    mock_coordinator.effectstate.on_next(gap_event)
+    # --- Gap event: avg not yet added ---
+    gap_ts = now.replace(day=4, hour=10, minute=0)
+    mock_coordinator.effectstate.publish(EnergyData(2.7, 2700.0, gap_ts))
 
     threshold_days = [e["day"] for e in threshold_sensor.attr["top_three"]]
     assert 4 in threshold_days, (
@@ -1161,37 +1267,20 @@ async def test_regression_e_avg_maintains_independent_top_three(
     avg_sensor = GridCapWatcherAverageThreePeakHours(
         hass, config_with_levels, mock_coordinator
     )
-    avg_sensor.schedule_update_ha_state = Mock()
-    avg_sensor.attr["top_three"] = [dict(e) for e in restored_top_three]
-    avg_sensor._initialized = True
-    avg_sensor._disposables = [
-        mock_coordinator.effectstate.subscribe(avg_sensor._state_change),
-        # avg does NOT subscribe to thresholddata (Fix 1).
-    ]
+    avg_sensor.async_write_ha_state = Mock()
+    await avg_sensor.async_added_to_hass()
 
     # --- Next AMS event fires: 0.5 kWh, won't displace any restored peak ---
-    next_ts = datetime(2026, 5, 4, 11, 0, 0, tzinfo=timezone.utc)
-    next_event = EnergyData(0.5, 500.0, next_ts)
-    mock_coordinator.effectstate.on_next(next_event)
+    next_ts = now.replace(day=4, hour=11, minute=0)
+    mock_coordinator.effectstate.publish(EnergyData(0.5, 500.0, next_ts))
 
     avg_days = [e["day"] for e in avg_sensor.attr["top_three"]]
-
-    # avg receives the gap event via BehaviorSubject effectstate replay on subscribe
-    # (Fix 3/4: _initialized=True before subscribe, so replay is not dropped).
-    # day4=2.7 kWh displaces day3=2.5 kWh.
-    assert 4 in avg_days, (
-        f"avg should have day4 from effectstate BehaviorSubject replay: {avg_sensor.attr['top_three']}"
-    )
-    assert 3 not in avg_days, (
-        f"day3 (2.5 kWh) should be displaced by day4 (2.7 kWh): {avg_sensor.attr['top_three']}"
-    )
-
-    # avg must still have its 3 restored entries.
-    assert len(avg_sensor.attr["top_three"]) == 3, (
-        f"avg top_three should have 3 entries. Got: {avg_sensor.attr['top_three']}"
-    )
-    # avg state must reflect its own data, not threshold's.
-    assert avg_sensor._state is not None
+    assert 4 in avg_days, f"avg should have day4: {avg_sensor.attr['top_three']}"
+    assert (
+        3 not in avg_days
+    ), f"day3 (2.5 kWh) should be displaced by day4 (2.7 kWh): {avg_sensor.attr['top_three']}"
+    assert avg_sensor.attr["top_three"] == threshold_sensor.attr["top_three"]
+    assert avg_sensor._state == pytest.approx((3.0 + 2.8 + 2.7) / 3)
 
 
 @pytest.mark.asyncio
@@ -1204,79 +1293,60 @@ async def test_regression_f_threshold_stale_restore_does_not_overwrite_avg(
       - Threshold restores STALE top_three: day3=hr0, energy=2.590618
         (saved from a previous session that ended early, before day3's peak hour)
       - Avg restores CORRECT top_three: day3=hr4, energy=5.762
-      - First AMS event fires for day4 (new day), energy=0.8 kWh < 2.590618
-        → threshold does not replace day3 with day4; emits thresholddata with stale top_three
-      - BUG (pre-fix): avg._threshold_state_change fires → overwrites avg's correct day3=5.762
-        with stale day3=2.590618 → avg drops from 6.06 to 5.0
-      - FIX (Fix 1): avg does NOT subscribe to thresholddata; ignores the stale emission
+      - BUG (pre-fix): avg was overwritten with the stale day3=2.590618
+        → avg drops from 6.06 to 5.0
 
-    After fix: avg top_three must still contain day3=hr4, energy=5.762.
+    When peaks are restored from recorded attributes (upgrade from versions
+    without PeakStore), the copies of both sensors are merged and the highest
+    hour of each day wins, so the stale copy cannot hide the correct one.
     """
-    current_month = 5
 
-    # --- Threshold: stale restored state ---
+    def saved_state(day3_hour, day3_energy):
+        return Mock(
+            state=STATE_UNKNOWN,
+            attributes={
+                "top_three": [
+                    {"day": 1, "hour": 8, "energy": 6.902},
+                    {"day": 2, "hour": 9, "energy": 5.198},
+                    {"day": 3, "hour": day3_hour, "energy": day3_energy},
+                ]
+            },
+        )
+
+    # Threshold has the stale copy, avg the correct one
+    mock_coordinator.restored = RestoredState(
+        {
+            SENSOR_THRESHOLD: saved_state(0, 2.590618),
+            SENSOR_AVERAGE: saved_state(4, 5.762),
+        }
+    )
+
+    # --- Threshold: added first ---
     threshold_sensor = GridCapWatcherCurrentEffectLevelThreshold(
         hass, config_with_levels, mock_coordinator
     )
-    threshold_sensor.schedule_update_ha_state = Mock()
-    threshold_sensor.attr["top_three"] = [
-        {"month": current_month, "day": 1, "hour": 8, "energy": 6.902},
-        {"month": current_month, "day": 2, "hour": 9, "energy": 5.198},
-        {"month": current_month, "day": 3, "hour": 0, "energy": 2.590618},  # stale!
-    ]
-    threshold_sensor._initialized = True
-    threshold_sensor._disposables = [
-        mock_coordinator.effectstate.subscribe(threshold_sensor._state_change)
-    ]
+    threshold_sensor.async_write_ha_state = Mock()
+    await threshold_sensor.async_added_to_hass()
 
-    # --- Avg: correct restored state ---
+    # --- Avg: added second ---
     avg_sensor = GridCapWatcherAverageThreePeakHours(
         hass, config_with_levels, mock_coordinator
     )
-    avg_sensor.schedule_update_ha_state = Mock()
-    avg_sensor.attr["top_three"] = [
-        {"month": current_month, "day": 1, "hour": 8, "energy": 6.902},
-        {"month": current_month, "day": 2, "hour": 9, "energy": 5.198},
-        {"month": current_month, "day": 3, "hour": 4, "energy": 5.762},  # correct!
-    ]
-    avg_sensor._initialized = True
-    avg_sensor._disposables = [
-        mock_coordinator.effectstate.subscribe(avg_sensor._state_change),
-        # avg does NOT subscribe to thresholddata (Fix 1).
-    ]
+    avg_sensor.async_write_ha_state = Mock()
+    await avg_sensor.async_added_to_hass()
 
-    # Compute expected avg from correct data.
     correct_avg = (6.902 + 5.198 + 5.762) / 3  # ≈ 5.954
-
-    # Verify precondition: avg state matches correct data.
-    # (Simulate what async_added_to_hass would compute after restore)
-    avg_sensor._state = correct_avg
-
-    # --- First AMS event: day4, low energy (0.8 kWh) < all threshold peaks ---
-    # Threshold keeps stale top_three (day3=2.590618 not displaced by 0.8).
-    # Threshold emits thresholddata with stale top_three.
-    # avg must IGNORE this emission.
-    day4_ts = datetime(2026, 5, 4, 6, 0, 0, tzinfo=timezone.utc)
-    day4_event = EnergyData(0.8, 800.0, day4_ts)
-    mock_coordinator.effectstate.on_next(day4_event)
-
-    # avg top_three must still contain day3=hr4, energy=5.762.
-    avg_day3_entries = [
-        e for e in avg_sensor.attr["top_three"]
-        if e["day"] == 3
-    ]
-    assert len(avg_day3_entries) == 1, (
-        f"avg top_three should have exactly one day=3 entry. Got: {avg_sensor.attr['top_three']}"
-    )
-    assert avg_day3_entries[0]["hour"] == 4, (
-        f"avg day3 entry should be hr4 (correct), not hr0 (stale). "
-        f"Got hour={avg_day3_entries[0]['hour']}. "
-        "Bug: avg was overwritten by threshold's stale thresholddata emission."
-    )
-    assert abs(avg_day3_entries[0]["energy"] - 5.762) < 0.01, (
-        f"avg day3 energy should be 5.762 (correct), not 2.590618 (stale). "
-        f"Got energy={avg_day3_entries[0]['energy']}."
-    )
+    for sensor in (threshold_sensor, avg_sensor):
+        day3_entries = [e for e in sensor.attr["top_three"] if e["day"] == 3]
+        assert (
+            len(day3_entries) == 1
+        ), f"top_three should have exactly one day=3 entry. Got: {sensor.attr['top_three']}"
+        assert day3_entries[0]["hour"] == 4, (
+            f"day3 entry should be hr4 (correct), not hr0 (stale). "
+            f"Got hour={day3_entries[0]['hour']}."
+        )
+        assert abs(day3_entries[0]["energy"] - 5.762) < 0.01
+    assert avg_sensor._state == pytest.approx(correct_avg)
 
 
 @pytest.mark.asyncio
@@ -1293,22 +1363,21 @@ async def test_regression_d_stale_energy_not_restored(hass, basic_config, mock_c
     """
     sensor = GridCapWatcherEnergySensor(hass, basic_config, mock_coordinator)
 
-    # Simulate saved sensor data with a value from a previous hour.
-    saved_sensor_data = Mock()
-    saved_sensor_data.native_value = 5.01
-
     # last_updated is 3 hours ago — clearly in a previous hour.
     stale_last_updated = dt.utcnow() - timedelta(hours=3)
-    last_state = Mock()
-    last_state.last_updated = stale_last_updated
+    last_state = State(
+        "sensor.energy_used_this_hour", "5.01", last_updated=stale_last_updated
+    )
 
-    sensor.async_get_last_sensor_data = AsyncMock(return_value=saved_sensor_data)
-    sensor.async_get_last_state = AsyncMock(return_value=last_state)
+    # Saved sensor data holds the value from the previous hour
+    mock_coordinator.restored = RestoredState(
+        {SENSOR_ENERGY: last_state}, {SENSOR_ENERGY: 5.01}
+    )
 
     await sensor.async_added_to_hass()
 
-    assert sensor._state == 0 or sensor._state is None, (
-        f"Energy sensor restored stale value {sensor._state} from a previous hour. "
+    assert sensor._meter.energy == 0 or sensor._meter.energy is None, (
+        f"Energy sensor restored stale value {sensor._meter.energy} from a previous hour. "
         "Expected 0 or None after a multi-hour gap (stale hourly accumulator must be discarded)."
     )
 
@@ -1317,32 +1386,30 @@ async def test_regression_d_stale_energy_not_restored(hass, basic_config, mock_c
 async def test_energy_sensor_restores_same_hour_energy(hass, basic_config, mock_coordinator):
     """Same-hour restore: energy value saved within the current hour must be kept.
 
-    Branch under test (sensor.py async_added_to_hass):
-        if dt.as_local(last_state.last_updated) >= current_hour_start:
-            self._state = float(savedstate.native_value)  # ← this branch
+    Branch under test (RestoredState in coordinator.py): the saved value is
+    kept when the last state was updated within the current hour.
 
     A bug that always resets _state to 0 / None would fail here.
     """
     sensor = GridCapWatcherEnergySensor(hass, basic_config, mock_coordinator)
 
-    saved_sensor_data = Mock()
-    saved_sensor_data.native_value = 0.5  # 0.5 kWh accumulated this hour
-
     # Anchor last_updated to current_hour_start + 1 min so the test is never
     # sensitive to when (in the hour) it runs.
-    from custom_components.energytariff.utils import start_of_current_hour
-    current_hour_start = start_of_current_hour(dt.as_local(dt.now()))
+    current_hour_start = dt.utc_from_timestamp(LOCAL_HOURS.hour_at(time.time()).start)
     recent_last_updated = current_hour_start + timedelta(minutes=1)
-    last_state = Mock()
-    last_state.last_updated = recent_last_updated
+    last_state = State(
+        "sensor.energy_used_this_hour", "0.5", last_updated=recent_last_updated
+    )
 
-    sensor.async_get_last_sensor_data = AsyncMock(return_value=saved_sensor_data)
-    sensor.async_get_last_state = AsyncMock(return_value=last_state)
+    # 0.5 kWh accumulated this hour
+    mock_coordinator.restored = RestoredState(
+        {SENSOR_ENERGY: last_state}, {SENSOR_ENERGY: 0.5}
+    )
 
     await sensor.async_added_to_hass()
 
-    assert sensor._state == pytest.approx(0.5), (
-        f"Energy sensor lost same-hour state: got {sensor._state!r}, expected 0.5. "
+    assert sensor._meter.energy == pytest.approx(0.5), (
+        f"Energy sensor lost same-hour state: got {sensor._meter.energy!r}, expected 0.5. "
         "Bug: restore logic always resets to 0 instead of keeping the saved value."
     )
 
@@ -1366,6 +1433,39 @@ def test_platform_schema_accepts_float_target_energy():
     assert config[TARGET_ENERGY] == 5.0
 
 
+def test_level_table_sorts_levels_by_threshold():
+    """Levels may be configured in any order, lookup uses threshold order."""
+    table = LevelTable(
+        [
+            {"name": "High", "threshold": 10, "price": 300},
+            {"name": "Low", "threshold": 2, "price": "100"},
+            {"name": "Medium", "threshold": 5.0, "price": 200},
+        ]
+    )
+
+    assert [level.name for level in table] == ["Low", "Medium", "High"]
+    assert table.levels[0] == Level("Low", 2.0, 100.0)
+    assert table.find(0) == 0
+    assert table.find(2.0) == 1
+    assert table.find(9.99) == 2
+    assert table.find(10.0) is None
+
+
+def test_platform_schema_rejects_duplicate_level_thresholds():
+    """Two levels with the same threshold are a configuration error."""
+    with pytest.raises(vol.Invalid, match="same threshold"):
+        PLATFORM_SCHEMA(
+            {
+                "platform": "energytariff",
+                CONF_EFFECT_ENTITY: "sensor.power_meter",
+                GRID_LEVELS: [
+                    {"name": "Low", "threshold": 2.0, "price": 50},
+                    {"name": "Also low", "threshold": 2, "price": 60},
+                ],
+            }
+        )
+
+
 def test_platform_schema_accepts_template_target_energy():
     """New feature: a Jinja2 template string must now be accepted for target_energy."""
     config = PLATFORM_SCHEMA(
@@ -1418,19 +1518,18 @@ async def test_available_effect_subscribes_only_after_added_to_hass(hass, mock_c
         ROUNDING_PRECISION: 2,
     }
     sensor = GridCapWatcherAvailableEffectRemainingHour(hass, config, mock_coordinator)
-    sensor.schedule_update_ha_state = Mock()
+    sensor.async_write_ha_state = Mock()
 
-    mock_coordinator.effectstate.on_next(EnergyData(2.0, 1000.0, dt.now()))
+    mock_coordinator.effectstate.publish(EnergyData(2.0, 1000.0, dt.now()))
     assert sensor._state is None
-    assert not sensor.schedule_update_ha_state.called
+    assert not sensor.async_write_ha_state.called
 
-    sensor.async_get_last_state = AsyncMock(return_value=None)
     await sensor.async_added_to_hass()
 
-    sensor.schedule_update_ha_state.reset_mock()
-    mock_coordinator.effectstate.on_next(EnergyData(2.0, 1000.0, dt.now()))
+    sensor.async_write_ha_state.reset_mock()
+    mock_coordinator.effectstate.publish(EnergyData(3.0, 1000.0, dt.now()))
     assert sensor._state is not None
-    assert sensor.schedule_update_ha_state.called
+    assert sensor.async_write_ha_state.called
 
 
 @pytest.mark.asyncio
@@ -1443,7 +1542,7 @@ async def test_available_effect_template_target_result_change(hass, mock_coordin
         ROUNDING_PRECISION: 2,
     }
     sensor = GridCapWatcherAvailableEffectRemainingHour(hass, config, mock_coordinator)
-    sensor.schedule_update_ha_state = Mock()
+    sensor.async_write_ha_state = Mock()
 
     # Seed energy and power so __calculate can produce a result.
     sensor._energy = 2.0
@@ -1455,7 +1554,7 @@ async def test_available_effect_template_target_result_change(hass, mock_coordin
 
     assert sensor._target_energy == 8.0
     assert sensor._state is not None
-    assert sensor.schedule_update_ha_state.called
+    assert sensor.async_write_ha_state.called
 
 
 @pytest.mark.asyncio
@@ -1468,7 +1567,7 @@ async def test_available_effect_template_target_ignores_template_error(hass, moc
         ROUNDING_PRECISION: 2,
     }
     sensor = GridCapWatcherAvailableEffectRemainingHour(hass, config, mock_coordinator)
-    sensor.schedule_update_ha_state = Mock()
+    sensor.async_write_ha_state = Mock()
     sensor._target_energy = 5.0  # previously resolved
 
     error = TemplateError(Exception("undefined variable"))
@@ -1476,7 +1575,7 @@ async def test_available_effect_template_target_ignores_template_error(hass, moc
     sensor._async_on_target_energy_template_result(None, [update])
 
     assert sensor._target_energy == 5.0, "target_energy must not be cleared by a template error"
-    assert not sensor.schedule_update_ha_state.called
+    assert not sensor.async_write_ha_state.called
 
 
 @pytest.mark.asyncio
@@ -1489,14 +1588,14 @@ async def test_available_effect_template_target_ignores_non_numeric(hass, mock_c
         ROUNDING_PRECISION: 2,
     }
     sensor = GridCapWatcherAvailableEffectRemainingHour(hass, config, mock_coordinator)
-    sensor.schedule_update_ha_state = Mock()
+    sensor.async_write_ha_state = Mock()
     sensor._target_energy = 5.0
 
     update = TrackTemplateResult(tmpl, "5.0", "not-a-number")
     sensor._async_on_target_energy_template_result(None, [update])
 
     assert sensor._target_energy == 5.0, "target_energy must not change when result is non-numeric"
-    assert not sensor.schedule_update_ha_state.called
+    assert not sensor.async_write_ha_state.called
 
 
 @pytest.mark.asyncio
@@ -1512,8 +1611,7 @@ async def test_available_effect_template_target_reads_initial_state(hass, mock_c
     }
 
     sensor = GridCapWatcherAvailableEffectRemainingHour(hass, config, mock_coordinator)
-    sensor.async_get_last_state = AsyncMock(return_value=None)
-    sensor.schedule_update_ha_state = Mock()
+    sensor.async_write_ha_state = Mock()
 
     await sensor.async_added_to_hass()
     await hass.async_block_till_done()
@@ -1536,8 +1634,7 @@ async def test_available_effect_template_target_initial_unavailable_state(hass,
     }
 
     sensor = GridCapWatcherAvailableEffectRemainingHour(hass, config, mock_coordinator)
-    sensor.async_get_last_state = AsyncMock(return_value=None)
-    sensor.schedule_update_ha_state = Mock()
+    sensor.async_write_ha_state = Mock()
 
     await sensor.async_added_to_hass()
     await hass.async_block_till_done()
@@ -1579,8 +1676,7 @@ async def test_available_effect_template_target_full_calculation(hass, mock_coor
     }
 
     sensor = GridCapWatcherAvailableEffectRemainingHour(hass, config, mock_coordinator)
-    sensor.async_get_last_state = AsyncMock(return_value=None)
-    sensor.schedule_update_ha_state = Mock()
+    sensor.async_write_ha_state = Mock()
 
     await sensor.async_added_to_hass()
     await hass.async_block_till_done()
@@ -1593,7 +1689,7 @@ async def test_available_effect_template_target_full_calculation(hass, mock_coor
     sensor._effect_state_change(energy_data)
 
     assert sensor._state is not None, "Sensor must calculate a value when template target is set"
-    assert sensor.schedule_update_ha_state.called
+    assert sensor.async_write_ha_state.called
 
 
 @pytest.mark.asyncio
@@ -1613,8 +1709,7 @@ async def test_available_effect_template_target_ha_state_change_integration(hass
     }
 
     sensor = GridCapWatcherAvailableEffectRemainingHour(hass, config, mock_coordinator)
-    sensor.async_get_last_state = AsyncMock(return_value=None)
-    sensor.schedule_update_ha_state = Mock()
+    sensor.async_write_ha_state = Mock()
     sensor._energy = 1.0
     sensor._effect = 500.0
 
@@ -1631,3 +1726,1053 @@ async def test_available_effect_template_target_ha_state_change_integration(hass
     )
     assert sensor.attr["grid_threshold_level"] == pytest.approx(8.0)
     assert sensor._state is not None
+
+
+# ---------------------------------------------------------------------------
+# Rate-limited, de-duplicated state publishing
+# ---------------------------------------------------------------------------
+
+
+def test_state_publisher_skips_unchanged_signature():
+    """A write is only issued when the published signature changes."""
+    write = Mock()
+    publisher = StatePublisher(write)
+
+    assert publisher.publish(1.23) is True
+    assert publisher.publish(1.23) is False
+    assert publisher.publish(1.24) is True
+    assert write.call_count == 2
+
+
+def test_state_publisher_min_interval_keeps_pending_until_flush():
+    """Changes inside min_interval are held back and written by flush()."""
+    write = Mock()
+    now = [1000.0]
+    publisher = StatePublisher(write, 10, clock=lambda: now[0])
+
+    assert publisher.publish(1.0) is True
+    now[0] += 5
+    assert publisher.publish(2.0) is False
+    assert publisher.pending
+    assert write.call_count == 1
+
+    assert publisher.flush() is True
+    assert not publisher.pending
+    assert write.call_count == 2
+    assert publisher.flush() is False
+
+    # After the interval has passed, changes are written directly again.
+    now[0] += 10
+    assert publisher.publish(3.0) is True
+    assert write.call_count == 3
+
+
+def test_state_publisher_reverting_value_clears_pending():
+    """A pending change that reverts to the written value needs no write."""
+    write = Mock()
+    now = [0.0]
+    publisher = StatePublisher(write, 10, clock=lambda: now[0])
+
+    publisher.publish(1.0)
+    publisher.publish(2.0)
+    publisher.publish(1.0)
+
+    assert not publisher.pending
+    assert publisher.flush() is False
+    assert write.call_count == 1
+
+
+def test_state_publisher_immediate_bypasses_interval():
+    """Boundary writes (hour/month reset) are never delayed."""
+    write = Mock()
+    now = [0.0]
+    publisher = StatePublisher(write, 60, clock=lambda: now[0])
+
+    publisher.publish(5.0)
+    assert publisher.publish(0, immediate=True) is True
+    assert write.call_count == 2
+
+
+def test_state_publisher_flushes_held_back_value_when_interval_ends(hass):
+    """A held back value is written at the end of the interval, even if no
+    other update arrives."""
+    write = Mock()
+    clock = ReplayClock(1000.0)
+    publisher = StatePublisher(
+        write,
+        10,
+        clock.monotonic,
+        lambda delay, action: clock.call_later(hass, delay, action),
+    )
+
+    publisher.publish(1.0)
+    clock.advance(1004.0)
+    publisher.publish(2.0)
+    clock.advance(1009.0)
+    assert write.call_count == 1
+
+    clock.advance(1010.0)
+    assert write.call_count == 2
+    assert not publisher.pending
+
+
+def test_state_publisher_write_cancels_trailing_flush(hass):
+    """A write starts a new interval, the flush of the last one is cancelled."""
+    write = Mock()
+    clock = ReplayClock(1000.0)
+    publisher = StatePublisher(
+        write,
+        10,
+        clock.monotonic,
+        lambda delay, action: clock.call_later(hass, delay, action),
+    )
+
+    publisher.publish(1.0)
+    clock.advance(1004.0)
+    publisher.publish(2.0)
+    publisher.publish(3.0, immediate=True)
+    clock.advance(1008.0)
+    publisher.publish(4.0)
+    # The flush of the first interval would write 4.0 here
+    clock.advance(1010.0)
+    assert write.call_count == 2
+
+    clock.advance(1014.0)
+    assert write.call_count == 3
+
+
+def test_state_publisher_counts_writes_and_skipped_values():
+    """Writes, unchanged values and held back values are counted."""
+    now = [0.0]
+    publisher = StatePublisher(Mock(), 10, clock=lambda: now[0])
+
+    publisher.publish(1.0)
+    publisher.publish(1.0)
+    publisher.publish(2.0)
+    publisher.flush()
+
+    assert (publisher.writes, publisher.deduped, publisher.held_back) == (2, 1, 1)
+
+
+@pytest.mark.asyncio
+async def test_energy_sensor_writes_only_when_rounded_value_changes(
+    hass, basic_config, mock_coordinator
+):
+    """Meter events that do not change the rounded energy value must not write state."""
+    sensor = GridCapWatcherEnergySensor(hass, basic_config, mock_coordinator)
+    sensor.async_write_ha_state = Mock()
+
+    # Consecutive meter intervals, from the start of an hour
+    clock = [dt.utcnow().replace(minute=0, second=0, microsecond=0)]
+
+    def make_event(seconds: float, watt: str = "1000"):
+        attributes = {"unit_of_measurement": "W"}
+        now = clock[0]
+        clock[0] = now + timedelta(seconds=seconds)
+        old_state = State("sensor.power_meter", watt, attributes, last_updated=now)
+        new_state = State("sensor.power_meter", watt, attributes, last_updated=clock[0])
+        event = Mock(spec=Event)
+        event.data = {"old_state": old_state, "new_state": new_state}
+        return event
+
+    # 1000 W for 36 s = 0.01 kWh, a visible change at precision 2.
+    sensor._async_on_change(make_event(36))
+    assert sensor.async_write_ha_state.call_count == 1
+
+    # 1000 W for 1 s = 0.00028 kWh, rounded value stays at 0.01.
+    sensor._async_on_change(make_event(1))
+    assert sensor.async_write_ha_state.call_count == 1
+    assert sensor._meter.energy == pytest.approx(0.01 + 1 / 3600)
+
+
+@pytest.mark.asyncio
+async def test_hourly_reset_flushes_pending_values(hass, mock_coordinator):
+    """Values held back by publish_interval are written before the hourly reset."""
+    config = {
+        CONF_EFFECT_ENTITY: "sensor.power_meter",
+        ROUNDING_PRECISION: 2,
+        PUBLISH_INTERVAL: {"estimate": 60},
+    }
+    energy_sensor = GridCapWatcherEnergySensor(hass, config, mock_coordinator)
+    energy_sensor.async_write_ha_state = Mock()
+    estimate_sensor = GridCapWatcherEstimatedEnergySensor(
+        hass, config, mock_coordinator
+    )
+    estimate_sensor.async_write_ha_state = Mock()
+    mock_coordinator.register_publisher(estimate_sensor._publisher)
+
+    timestamp = dt.now() - timedelta(minutes=30)
+    estimate_sensor._state_change(EnergyData(2.0, 1000.0, timestamp))
+    estimate_sensor._state_change(EnergyData(3.0, 1000.0, timestamp))
+    assert estimate_sensor.async_write_ha_state.call_count == 1
+    assert estimate_sensor._publisher.pending
+
+    energy_sensor._meter.hour = LOCAL_HOURS.hour_at(time.time())
+    mock_coordinator.hourclose.subscribe(energy_sensor._hour_closed)
+    mock_coordinator.close_hour(energy_sensor._meter.hour)
+
+    assert estimate_sensor.async_write_ha_state.call_count == 2
+    assert not estimate_sensor._publisher.pending
+    assert energy_sensor._meter.energy == 0
+    assert energy_sensor.async_write_ha_state.called
+
+
+@pytest.mark.asyncio
+async def test_energy_sensor_writes_full_hour_with_publish_interval(
+    hass, mock_coordinator
+):
+    """The energy of the whole hour is written before the reset, even when the
+    publish interval holds values back."""
+    config = {
+        CONF_EFFECT_ENTITY: "sensor.power_meter",
+        ROUNDING_PRECISION: 2,
+        PUBLISH_INTERVAL: {"energy": 600},
+    }
+    sensor = GridCapWatcherEnergySensor(hass, config, mock_coordinator)
+    written = []
+    sensor.async_write_ha_state = lambda: written.append(sensor.native_value)
+    mock_coordinator.hourclose.subscribe(sensor._hour_closed)
+    hour = LOCAL_HOURS.hour_at(time.time())
+    sensor._meter.hour = hour
+
+    sensor._meter.energy = 0.83
+    sensor._publisher.publish(sensor.native_value)
+    sensor._meter.energy = 1.0
+    mock_coordinator.close_hour(hour)
+
+    assert written == [0.83, 1.0, 0.0]
+    assert not sensor._publisher.pending
+
+
+@pytest.mark.asyncio
+async def test_pending_value_written_when_interval_ends(hass, mock_coordinator):
+    """A value held back by publish_interval is written when the interval
+    ends, without waiting for the next meter update."""
+    from pytest_homeassistant_custom_component.common import async_fire_time_changed
+
+    config = {
+        CONF_EFFECT_ENTITY: "sensor.power_meter",
+        ROUNDING_PRECISION: 2,
+        PUBLISH_INTERVAL: {"estimate": 60},
+    }
+    sensor = GridCapWatcherEstimatedEnergySensor(hass, config, mock_coordinator)
+    sensor.async_write_ha_state = Mock()
+
+    timestamp = dt.now() - timedelta(minutes=30)
+    sensor._state_change(EnergyData(2.0, 1000.0, timestamp))
+    sensor._state_change(EnergyData(3.0, 1000.0, timestamp))
+    assert sensor.async_write_ha_state.call_count == 1
+
+    async_fire_time_changed(hass, dt.utcnow() + timedelta(seconds=61))
+    await hass.async_block_till_done()
+    assert sensor.async_write_ha_state.call_count == 2
+    assert not sensor._publisher.pending
+
+
+def test_platform_schema_accepts_publish_interval():
+    """publish_interval accepts a number for all sensors or a per-sensor mapping."""
+    config = PLATFORM_SCHEMA(
+        {
+            "platform": "energytariff",
+            CONF_EFFECT_ENTITY: "sensor.power_meter",
+            PUBLISH_INTERVAL: 30,
+        }
+    )
+    assert get_publish_interval(config, "energy") == 30.0
+    assert get_publish_interval(config, "level_name") == 30.0
+
+    config = PLATFORM_SCHEMA(
+        {
+            "platform": "energytariff",
+            CONF_EFFECT_ENTITY: "sensor.power_meter",
+            PUBLISH_INTERVAL: {"energy": 10, "available_power": 5},
+        }
+    )
+    assert get_publish_interval(config, "energy") == 10.0
+    assert get_publish_interval(config, "available_power") == 5.0
+    assert get_publish_interval(config, "estimate") == 0
+
+    with pytest.raises(vol.Invalid):
+        PLATFORM_SCHEMA(
+            {
+                "platform": "energytariff",
+                CONF_EFFECT_ENTITY: "sensor.power_meter",
+                PUBLISH_INTERVAL: {"unknown_sensor": 10},
+            }
+        )
+
+
+@pytest.mark.asyncio
+async def test_meter_event_writes_state_without_creating_tasks(hass):
+    """Meter events are handled synchronously on the loop, no update tasks are created."""
+    await async_setup_energytariff(hass)
+
+    stats = await async_replay_meter(hass, 20)
+
+    assert stats.tasks == 0
+    assert stats.state_writes > 0
+    assert float(hass.states.get("sensor.energy_used_this_hour").state) > 0
+
+
+# ---------------------------------------------------------------------------
+# Monthly peaks persisted in PeakStore instead of recorded attributes
+# ---------------------------------------------------------------------------
+
+_PEAK_STORAGE_KEY = "energytariff.sensor_power_meter"
+
+
+def _stored_peaks(year: int, month: int, top_three: list, key: str = "month") -> dict:
+    return {
+        "version": 1,
+        "minor_version": 1,
+        "key": _PEAK_STORAGE_KEY,
+        "data": {
+            "peaks": {key: {"year": year, "month": month, "top_three": top_three}}
+        },
+    }
+
+
+def _saved_state_with_attributes() -> Mock:
+    savedstate = Mock()
+    savedstate.state = "9.0"
+    savedstate.attributes = {
+        "top_three": [
+            {"day": 3, "hour": 17, "energy": 10.2},
+            {"day": 14, "hour": 18, "energy": 9.7},
+            {"day": 8, "hour": 18, "energy": 9.5},
+        ]
+    }
+    return savedstate
+
+
+@pytest.mark.asyncio
+async def test_peaks_restored_from_store_instead_of_attributes(
+    hass, hass_storage, basic_config
+):
+    """Stored peaks take priority over top_three in the last recorded state."""
+    now = dt.as_local(dt.now())
+    stored = [
+        {"month": now.month, "day": 1, "hour": 8, "energy": 4.0},
+        {"month": now.month, "day": 2, "hour": 9, "energy": 3.0},
+    ]
+    hass_storage[_PEAK_STORAGE_KEY] = _stored_peaks(now.year, now.month, stored)
+    coordinator = GridCapacityCoordinator(hass, basic_config)
+    sensor = GridCapWatcherAverageThreePeakHours(hass, basic_config, coordinator)
+    sensor.async_write_ha_state = Mock()
+    coordinator.restored = RestoredState(
+        {SENSOR_AVERAGE: _saved_state_with_attributes()}
+    )
+
+    await sensor.async_added_to_hass()
+
+    assert sensor.attr["top_three"] == stored
+    assert sensor._state == pytest.approx(3.5)
+
+
+@pytest.mark.asyncio
+async def test_peaks_restored_from_per_sensor_store_key(
+    hass, hass_storage, basic_config
+):
+    """Peaks stored per sensor, before the coordinator tracked them, are restored."""
+    now = dt.as_local(dt.now())
+    stored = [{"month": now.month, "day": 1, "hour": 8, "energy": 4.0}]
+    hass_storage[_PEAK_STORAGE_KEY] = _stored_peaks(
+        now.year, now.month, stored, key="average"
+    )
+    coordinator = GridCapacityCoordinator(hass, basic_config)
+    sensor = GridCapWatcherAverageThreePeakHours(hass, basic_config, coordinator)
+    sensor.async_write_ha_state = Mock()
+
+    await sensor.async_added_to_hass()
+
+    assert sensor.attr["top_three"] == stored
+
+
+@pytest.mark.asyncio
+async def test_peaks_restored_from_attributes_when_store_is_empty(hass, basic_config):
+    """Upgrade path: without stored peaks, recorded attributes are still used."""
+    coordinator = GridCapacityCoordinator(hass, basic_config)
+    sensor = GridCapWatcherAverageThreePeakHours(hass, basic_config, coordinator)
+    sensor.async_write_ha_state = Mock()
+    coordinator.restored = RestoredState(
+        {SENSOR_AVERAGE: _saved_state_with_attributes()}
+    )
+
+    await sensor.async_added_to_hass()
+
+    assert len(sensor.attr["top_three"]) == 3
+
+
+@pytest.mark.asyncio
+async def test_peaks_from_previous_month_in_store_are_discarded(
+    hass, hass_storage, basic_config
+):
+    """Stored peaks from another month start the sensor from an empty list."""
+    now = dt.as_local(dt.now())
+    hass_storage[_PEAK_STORAGE_KEY] = _stored_peaks(
+        now.year - 1,
+        now.month,
+        [{"month": now.month, "day": 1, "hour": 8, "energy": 4.0}],
+    )
+    coordinator = GridCapacityCoordinator(hass, basic_config)
+    sensor = GridCapWatcherAverageThreePeakHours(hass, basic_config, coordinator)
+    sensor.async_write_ha_state = Mock()
+    coordinator.restored = RestoredState(
+        {SENSOR_AVERAGE: _saved_state_with_attributes()}
+    )
+
+    await sensor.async_added_to_hass()
+
+    assert sensor.attr["top_three"] == []
+
+
+@pytest.mark.asyncio
+async def test_peaks_saved_to_store_with_delay(hass, hass_storage, basic_config):
+    """Peak updates are batched into one delayed save."""
+    from pytest_homeassistant_custom_component.common import async_fire_time_changed
+
+    from custom_components.energytariff.store import SAVE_DELAY
+
+    coordinator = GridCapacityCoordinator(hass, basic_config)
+    await coordinator.async_track_peaks()
+
+    timestamp = dt.now()
+    coordinator.effectstate.publish(EnergyData(1.0, 1000.0, timestamp))
+    coordinator.effectstate.publish(EnergyData(2.0, 1000.0, timestamp))
+    assert _PEAK_STORAGE_KEY not in hass_storage
+
+    async_fire_time_changed(hass, dt.utcnow() + timedelta(seconds=SAVE_DELAY + 1))
+    await hass.async_block_till_done()
+
+    now = dt.as_local(dt.now())
+    saved = hass_storage[_PEAK_STORAGE_KEY]["data"]["peaks"]["month"]
+    assert saved["year"] == now.year
+    assert saved["month"] == now.month
+    assert [entry["energy"] for entry in saved["top_three"]] == [2.0]
+
+
+async def test_peaks_saved_with_their_own_month(hass, hass_storage):
+    """A save that runs after the month has ended keeps the month of the peaks."""
+    from pytest_homeassistant_custom_component.common import async_fire_time_changed
+
+    from custom_components.energytariff.store import SAVE_DELAY, PeakStore
+
+    store = PeakStore(hass, "sensor.power_meter")
+    top_three = [{"month": 1, "day": 31, "hour": 23, "energy": 4.0}]
+    store.async_set_top_three("month", top_three, 2025, 1)
+
+    async_fire_time_changed(hass, dt.utcnow() + timedelta(seconds=SAVE_DELAY + 1))
+    await hass.async_block_till_done()
+
+    saved = hass_storage[_PEAK_STORAGE_KEY]["data"]["peaks"]["month"]
+    assert (saved["year"], saved["month"]) == (2025, 1)
+    assert saved["top_three"] == top_three
+
+
+@pytest.mark.asyncio
+async def test_peak_sensors_show_a_summary_of_the_peaks(
+    hass, config_with_levels, mock_coordinator
+):
+    """The state holds the number of peak hours and the lowest of them, and
+    the threshold is not written again while the current peak hour grows."""
+    threshold = GridCapWatcherCurrentEffectLevelThreshold(
+        hass, config_with_levels, mock_coordinator
+    )
+    average = GridCapWatcherAverageThreePeakHours(
+        hass, config_with_levels, mock_coordinator
+    )
+    threshold.async_write_ha_state = Mock()
+    average.async_write_ha_state = Mock()
+    top_three = [
+        {"day": 1, "hour": 10, "energy": 2.0},
+        {"day": 2, "hour": 11, "energy": 3.0},
+        {"day": 3, "hour": 12, "energy": 3.5},
+    ]
+
+    for sensor in (threshold, average):
+        sensor._peaks_change(_peak_data(top_three))
+    assert threshold.extra_state_attributes == {
+        "peak_hours": 3,
+        "lowest_peak": 2.0,
+        "month": 5,
+    }
+    assert average.extra_state_attributes == {"peak_hours": 3, "lowest_peak": 2.0}
+
+    top_three[2]["energy"] = 3.6
+    for sensor in (threshold, average):
+        sensor._peaks_change(_peak_data(top_three))
+    assert threshold.async_write_ha_state.call_count == 1
+    assert average.async_write_ha_state.call_count == 2
+
+
+# ---------------------------------------------------------------------------
+# ReplaySignal dispatcher
+# ---------------------------------------------------------------------------
+
+
+def test_replay_signal_replays_last_value_to_new_listener():
+    """New listeners receive the last published value, but nothing before first publish."""
+    signal = ReplaySignal()
+    early = []
+    signal.subscribe(early.append)
+    assert early == []
+
+    signal.publish(1)
+    signal.publish(2)
+    late = []
+    signal.subscribe(late.append)
+
+    assert early == [1, 2]
+    assert late == [2]
+
+
+def test_replay_signal_unsubscribe_stops_delivery():
+    """The handle returned by subscribe removes only that listener."""
+    signal = ReplaySignal()
+    first, second = [], []
+    unsubscribe = signal.subscribe(first.append)
+    signal.subscribe(second.append)
+
+    signal.publish(1)
+    unsubscribe()
+    unsubscribe()  # Calling twice is harmless
+    signal.publish(2)
+
+    assert first == [1]
+    assert second == [1, 2]
+
+
+def test_replay_signal_listener_can_unsubscribe_during_publish():
+    """A listener removing itself while being notified does not skip other listeners."""
+    signal = ReplaySignal()
+    received = []
+    handles = {}
+
+    def once(value):
+        received.append(("once", value))
+        handles["once"]()
+
+    handles["once"] = signal.subscribe(once)
+    signal.subscribe(lambda value: received.append(("always", value)))
+
+    signal.publish(1)
+    signal.publish(2)
+
+    assert received == [("once", 1), ("always", 1), ("always", 2)]
+
+
+@pytest.mark.asyncio
+async def test_sensor_removal_unsubscribes_from_coordinator(
+    hass, config_with_levels, mock_coordinator
+):
+    """Subscriptions are released through async_on_remove when the entity is removed."""
+    sensor = GridCapacityWatcherCurrentLevelName(
+        hass, config_with_levels, mock_coordinator
+    )
+    sensor.async_write_ha_state = Mock()
+    await sensor.async_added_to_hass()
+
+    sensor._call_on_remove_callbacks()
+    mock_coordinator.thresholddata.publish(GridThresholdData("High", 8.0, 200, []))
+
+    assert sensor._state is None
+    assert not sensor.async_write_ha_state.called
+
+
+# ---------------------------------------------------------------------------
+# Monthly peaks tracked by the coordinator
+# ---------------------------------------------------------------------------
+
+
+def _at(day: int, hour: int) -> datetime:
+    return datetime(2025, 5, day, hour, 30, tzinfo=dt.DEFAULT_TIME_ZONE)
+
+
+def test_peak_tracker_keeps_highest_hour_per_day():
+    """Only updates that raise the maximum of their day change the top hours."""
+    tracker = PeakTracker()
+    assert tracker.update(EnergyData(2.0, 1000, _at(1, 10)))
+    data = tracker.data
+
+    # Lower than the day's peak, nothing is rebuilt
+    assert not tracker.update(EnergyData(1.5, 1000, _at(1, 11)))
+    assert tracker.data is data
+
+    assert tracker.update(EnergyData(2.5, 1000, _at(1, 12)))
+    assert tracker.top_three == [{"month": 5, "day": 1, "hour": 12, "energy": 2.5}]
+    assert tracker.data.top_three == (TopHour(5, 1, 12, 2.5),)
+    assert tracker.data.average == 2.5
+
+
+def test_peak_tracker_replaces_lowest_day_in_place():
+    """A new peak day replaces the lowest day without reordering the others."""
+    tracker = PeakTracker()
+    for day, energy in ((1, 4.0), (2, 2.0), (3, 3.0)):
+        tracker.update(EnergyData(energy, 1000, _at(day, 10)))
+    entries = list(tracker.top_three)
+
+    assert tracker.update(EnergyData(2.5, 1000, _at(4, 18)))
+    assert tracker.top_three[0] is entries[0] and tracker.top_three[2] is entries[2]
+    assert tracker.top_three[1] == {"month": 5, "day": 4, "hour": 18, "energy": 2.5}
+    assert tracker.data.average == pytest.approx(9.5 / 3)
+
+    # Lower than every peak, nothing changes
+    assert not tracker.update(EnergyData(1.0, 1000, _at(5, 10)))
+    assert [e["day"] for e in tracker.top_three] == [1, 4, 3]
+
+
+def test_peak_tracker_merge_keeps_highest_hour_of_each_day():
+    """Merging saved peaks never lowers a day that is already tracked."""
+    tracker = PeakTracker()
+    tracker.restore([{"day": 3, "hour": 4, "energy": 5.0}], 2025, 5)
+
+    assert not tracker.merge([{"day": 3, "hour": 0, "energy": 2.0}])
+    assert tracker.merge(
+        [{"day": 3, "hour": 6, "energy": 6.0}, {"day": 1, "hour": 8, "energy": 1.0}]
+    )
+    assert tracker.top_three == [
+        {"month": 5, "day": 3, "hour": 6, "energy": 6.0},
+        {"month": 5, "day": 1, "hour": 8, "energy": 1.0},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_coordinator_tracks_peaks_until_last_sensor_is_removed(hass):
+    """Meter updates, reset events and the monthly timer stop with the last user."""
+    coordinator = GridCapacityCoordinator(hass)
+    release_first = await coordinator.async_track_peaks()
+    release_second = await coordinator.async_track_peaks()
+    received = []
+    coordinator.peakdata.subscribe(received.append)
+
+    coordinator.effectstate.publish(EnergyData(1.0, 1000, dt.now()))
+    assert len(received[-1].top_three) == 1
+
+    release_first()
+    release_first()  # Releasing twice does not end the use of others
+    coordinator.effectstate.publish(EnergyData(2.0, 1000, dt.now()))
+    assert received[-1].top_three[0].energy == 2.0
+
+    release_second()
+    assert coordinator._unsub_hour_clock is None
+    count = len(received)
+    coordinator.effectstate.publish(EnergyData(3.0, 1000, dt.now()))
+    hass.bus.async_fire(RESET_TOP_THREE)
+    await hass.async_block_till_done()
+    assert len(received) == count
+
+
+@pytest.mark.asyncio
+async def test_reset_event_clears_peaks_of_both_sensors(hass, config_with_levels):
+    """One reset of the coordinator's peaks is shown by threshold and avg sensors."""
+    coordinator = GridCapacityCoordinator(hass, config_with_levels)
+    sensors = [
+        GridCapWatcherCurrentEffectLevelThreshold(
+            hass, config_with_levels, coordinator
+        ),
+        GridCapWatcherAverageThreePeakHours(hass, config_with_levels, coordinator),
+    ]
+    for sensor in sensors:
+        sensor.async_write_ha_state = Mock()
+        await sensor.async_added_to_hass()
+    coordinator.effectstate.publish(EnergyData(3.0, 3000, dt.now()))
+    assert all(len(sensor.attr["top_three"]) == 1 for sensor in sensors)
+
+    hass.bus.async_fire(RESET_TOP_THREE)
+    await hass.async_block_till_done()
+
+    assert all(sensor.attr["top_three"] == [] for sensor in sensors)
+    assert coordinator.peaks.top_three == []
+    for sensor in sensors:
+        sensor._call_on_remove_callbacks()
+
+
+# ---------------------------------------------------------------------------
+# Local hour boundaries from epoch timestamps
+# ---------------------------------------------------------------------------
+
+
+def _hours_of_day(table: HourTable, day: int) -> list[int]:
+    return [hour.hour for hour in table.hours if hour.day == day]
+
+
+def test_hour_table_has_23_and_25_hour_days_on_dst_changes():
+    """Clocks are turned forward on March 30 and back on October 26, 2025."""
+    oslo = ZoneInfo("Europe/Oslo")
+
+    march = HourTable(2025, 3, oslo)
+    assert len(march.hours) == 31 * 24 - 1
+    assert _hours_of_day(march, 30) == [0, 1] + list(range(3, 24))
+    assert march.start == datetime(2025, 3, 1, tzinfo=oslo).timestamp()
+    assert march.end == datetime(2025, 4, 1, tzinfo=oslo).timestamp()
+    assert march.day_starts[31] == datetime(2025, 3, 31, tzinfo=oslo).timestamp()
+    assert march.day_starts[32] == march.end
+
+    october = HourTable(2025, 10, oslo)
+    assert len(october.hours) == 31 * 24 + 1
+    assert _hours_of_day(october, 26) == [0, 1, 2, 2] + list(range(3, 24))
+    first, second = [h for h in october.hours if h.day == 26 and h.hour == 2]
+    assert first.end == second.start
+    assert second.end - first.start == 7200
+    assert october.day_starts[27] - october.day_starts[26] == 25 * 3600
+
+
+def test_hour_table_follows_half_hour_offsets():
+    kolkata = ZoneInfo("Asia/Kolkata")
+    table = HourTable(2025, 5, kolkata)
+    timestamp = datetime(2025, 5, 17, 13, 59, 30, tzinfo=kolkata).timestamp()
+
+    hour = table.find(timestamp)
+    assert (hour.day, hour.hour) == (17, 13)
+    assert hour.end - timestamp == 30
+    assert table.find(table.end) is None
+
+
+@pytest.mark.asyncio
+async def test_local_hours_match_local_time(hass):
+    await hass.config.async_set_time_zone("Europe/Oslo")
+    oslo = ZoneInfo("Europe/Oslo")
+
+    # Both daylight saving time changes and the turn of the year
+    for begin in (
+        datetime(2025, 3, 29, tzinfo=oslo),
+        datetime(2025, 10, 25, tzinfo=oslo),
+        datetime(2025, 12, 31, 20, tzinfo=oslo),
+    ):
+        timestamp = begin.timestamp()
+        for _ in range(1000):
+            local = datetime.fromtimestamp(timestamp, oslo)
+            hour = LOCAL_HOURS.hour_at(timestamp)
+            assert (hour.year, hour.month, hour.day, hour.hour) == (
+                local.year,
+                local.month,
+                local.day,
+                local.hour,
+            )
+            hour_start = local.replace(minute=0, second=0, microsecond=0)
+            assert hour.isoformat() == hour_start.isoformat()
+            next_hour = hour_start.astimezone(timezone.utc) + timedelta(hours=1)
+            assert LOCAL_HOURS.seconds_to_next_hour(timestamp) == pytest.approx(
+                next_hour.timestamp() - timestamp
+            )
+            timestamp += 187.5
+
+
+@pytest.mark.asyncio
+async def test_local_hours_follow_time_zone_changes(hass):
+    timestamp = datetime(2025, 5, 17, 12, 0, tzinfo=timezone.utc).timestamp()
+
+    await hass.config.async_set_time_zone("Europe/Oslo")
+    assert LOCAL_HOURS.hour_at(timestamp).hour == 14
+
+    await hass.config.async_set_time_zone("Asia/Kolkata")
+    hour = LOCAL_HOURS.hour_at(timestamp)
+    assert hour.hour == 17
+    assert hour.end - timestamp == 1800
+
+
+def test_energy_data_looks_up_local_hour_once():
+    timestamp = dt.as_local(dt.now()).replace(
+        hour=10, minute=15, second=0, microsecond=0
+    )
+    data = EnergyData(2.0, 1000.0, timestamp)
+
+    assert data.epoch == timestamp.timestamp()
+    assert (data.hour.day, data.hour.hour) == (timestamp.day, 10)
+    assert data.hour is data.hour
+    assert data.hour.end - data.epoch == 45 * 60
+
+
+# ---------------------------------------------------------------------------
+# Hour and month rollover from meter timestamps
+# ---------------------------------------------------------------------------
+
+
+def _meter_event(start: float, end: float, watt: float = 3600.0) -> Event:
+    attributes = {"unit_of_measurement": "W"}
+    old_state = State(
+        "sensor.power_meter",
+        str(watt),
+        attributes,
+        last_updated=dt.utc_from_timestamp(start),
+    )
+    new_state = State(
+        "sensor.power_meter",
+        str(watt),
+        attributes,
+        last_updated=dt.utc_from_timestamp(end),
+    )
+    return Event("state_changed", {"old_state": old_state, "new_state": new_state})
+
+
+def _rollover_sensors(hass, coordinator):
+    """Energy sensor and a listener of its meter updates, without timers"""
+    config = {CONF_EFFECT_ENTITY: "sensor.power_meter", ROUNDING_PRECISION: 3}
+    energy = GridCapWatcherEnergySensor(hass, config, coordinator)
+    energy.async_write_ha_state = Mock()
+    coordinator.register_publisher(energy._publisher)
+    coordinator.hourclose.subscribe(energy._hour_closed)
+    updates = []
+    coordinator.effectstate.subscribe(updates.append)
+    return energy, updates
+
+
+@pytest.mark.asyncio
+async def test_meter_interval_is_split_at_end_of_hour(hass, mock_coordinator):
+    """3600 W is 1 Wh per second, the part after the end of the hour
+    belongs to the next hour."""
+    energy, updates = _rollover_sensors(hass, mock_coordinator)
+    hour = LOCAL_HOURS.hour_at(time.time() - 3600)
+    energy._meter.hour = hour
+
+    energy._async_on_change(_meter_event(hour.end - 60, hour.end - 30))
+    energy._async_on_change(_meter_event(hour.end - 30, hour.end + 90))
+
+    # Final energy of the closed hour, then the first update of the next
+    assert updates[-2].hour is hour
+    assert updates[-2].energy_consumed == pytest.approx(0.06)
+    assert updates[-2].epoch == hour.end
+    assert mock_coordinator.hourclose.value is hour
+    assert energy._meter.hour.start == hour.end
+    assert energy._meter.energy == pytest.approx(0.09)
+    assert updates[-1].hour is energy._meter.hour
+    # 0.03, final value 0.06, reset to 0 and 0.09
+    assert energy.async_write_ha_state.call_count == 4
+
+
+@pytest.mark.asyncio
+async def test_hour_closed_by_clock_counts_until_end_of_hour(hass, mock_coordinator):
+    """A silent meter is assumed to keep its power until the end of the hour,
+    the next meter update only counts the time after it."""
+    energy, updates = _rollover_sensors(hass, mock_coordinator)
+    hour = LOCAL_HOURS.hour_at(time.time() - 3600)
+    energy._meter.hour = hour
+
+    energy._async_on_change(_meter_event(hour.end - 660, hour.end - 600))
+    mock_coordinator.close_hour(hour)
+
+    assert updates[-1].energy_consumed == pytest.approx(0.66)
+    assert energy._meter.energy == 0
+
+    # Timer fired late, the meter interval started in the closed hour
+    energy._async_on_change(_meter_event(hour.end - 600, hour.end + 60))
+    assert energy._meter.energy == pytest.approx(0.06)
+
+    # Closing an hour again does nothing
+    mock_coordinator.close_hour(hour)
+    assert energy._meter.energy == pytest.approx(0.06)
+
+
+@pytest.mark.asyncio
+async def test_close_of_last_hour_of_month_resets_peaks(hass, mock_coordinator):
+    release = await mock_coordinator.async_track_peaks()
+    now = dt.as_local(dt.now())
+    mock_coordinator.peaks.restore(
+        [{"month": now.month, "day": now.day, "hour": 1, "energy": 4.0}],
+        now.year,
+        now.month,
+    )
+
+    table = LOCAL_HOURS.table(now.year, now.month)
+    mock_coordinator.close_hour(table.hours[-2])
+    assert mock_coordinator.peaks.data.average == 4.0
+
+    mock_coordinator.close_hour(table.hours[-1])
+    assert mock_coordinator.peaks.month == (now.month % 12) + 1
+    assert mock_coordinator.peakdata.value.top_three == ()
+    release()
+
+
+@pytest.mark.asyncio
+async def test_hours_are_closed_by_one_shared_timer(hass, mock_coordinator):
+    release_first = mock_coordinator.track_hours()
+    unsub = mock_coordinator._unsub_hour_clock
+    release_second = mock_coordinator.track_hours()
+    assert mock_coordinator._unsub_hour_clock is unsub
+
+    release_first()
+    release_first()
+    assert mock_coordinator._unsub_hour_clock is unsub
+    release_second()
+    assert mock_coordinator._unsub_hour_clock is None
+
+
+@pytest.mark.asyncio
+async def test_coordinators_share_the_hour_clock(hass, freezer):
+    """One timer closes the hours of all coordinators."""
+    from pytest_homeassistant_custom_component.common import async_fire_time_changed
+
+    freezer.move_to("2025-03-10 10:30:00+00:00")
+    coordinators = [GridCapacityCoordinator(hass) for _ in range(3)]
+    closed = []
+    releases = []
+    for coordinator in coordinators:
+        coordinator.hourclose.subscribe(closed.append)
+        releases.append(coordinator.track_hours())
+    clock = hour_clock(hass)
+    assert clock._unsub_timer is not None
+
+    hour = LOCAL_HOURS.hour_at(time.time())
+    freezer.move_to(dt.utc_from_timestamp(hour.end))
+    async_fire_time_changed(hass, dt.utc_from_timestamp(hour.end))
+    await hass.async_block_till_done()
+    assert closed == [hour] * 3
+
+    for release in releases:
+        release()
+    assert clock._unsub_timer is None
+
+
+@pytest.mark.asyncio
+async def test_replay_clock_closes_hours_without_timers(hass):
+    """A coordinator on a replay clock closes hours as the clock is moved."""
+    await hass.config.async_set_time_zone("Europe/Oslo")
+    # Clocks are turned forward on 2025-03-30, the day has 23 hours
+    start = datetime(2025, 3, 29, 23, 30, tzinfo=dt.get_default_time_zone())
+    clock = ReplayClock(start.timestamp())
+    coordinator = GridCapacityCoordinator(hass, clock=clock)
+    closed = []
+    coordinator.hourclose.subscribe(closed.append)
+    release = coordinator.track_hours()
+    assert hour_clock(hass)._unsub_timer is None
+
+    clock.advance(start.timestamp() + 24 * 3600)
+    assert [hour.hour for hour in closed] == [23, 0, 1, *range(3, 24)]
+    assert clock.time() == start.timestamp() + 24 * 3600
+
+    # The clock does not go back
+    clock.advance(start.timestamp())
+    assert clock.time() == start.timestamp() + 24 * 3600
+    release()
+    assert clock._listeners == ()
+
+
+# ---------------------------------------------------------------------------
+# Change detection on thresholddata
+# ---------------------------------------------------------------------------
+
+
+@pytest.mark.asyncio
+async def test_threshold_data_emitted_only_when_level_price_or_hours_change(
+    hass, config_with_levels, mock_coordinator
+):
+    """Growing energy of the current peak hour does not wake threshold listeners."""
+    sensor = GridCapWatcherCurrentEffectLevelThreshold(
+        hass, config_with_levels, mock_coordinator
+    )
+    sensor.async_write_ha_state = Mock()
+    received = []
+    mock_coordinator.thresholddata.subscribe(received.append)
+
+    sensor.calculate_level(_peak_data([{"day": 1, "hour": 10, "energy": 3.0}]))
+    sensor.calculate_level(_peak_data([{"day": 1, "hour": 10, "energy": 3.0}]))
+    sensor.calculate_level(_peak_data([{"day": 1, "hour": 10, "energy": 3.5}]))
+    assert len(received) == 1
+
+    # Same level, but a new peak hour
+    sensor.calculate_level(_peak_data([{"day": 1, "hour": 11, "energy": 3.6}]))
+    assert len(received) == 2
+    assert received[1].top_three[0].hour == 11
+
+    # New level
+    sensor.calculate_level(_peak_data([{"day": 1, "hour": 11, "energy": 5.5}]))
+    assert len(received) == 3
+    assert received[2].name == "High"
+
+    counters = mock_coordinator.threshold_counters
+    assert (counters.emitted, counters.suppressed) == (3, 2)
+    assert sensor._state == 8.0
+
+
+@pytest.mark.asyncio
+async def test_threshold_data_suppressed_during_meter_replay(hass):
+    """In steady state almost no meter update reaches the level sensors."""
+    from homeassistant.helpers.entity_platform import async_get_platforms
+
+    await async_setup_energytariff(hass)
+    platform = async_get_platforms(hass, "energytariff")[0]
+    coordinator = platform.entities["sensor.energy_level_name"]._coordinator
+
+    # 20 minutes from the start of the next hour, without crossing an hour
+    start = LOCAL_HOURS.hour_at(time.time()).end
+    await async_replay_meter(hass, 600, interval=2.0, start=start)
+
+    counters = coordinator.threshold_counters
+    assert counters.emitted <= 3
+    assert counters.suppressed > 500
+
+
+# ---------------------------------------------------------------------------
+# Allocations on the meter event path
+# ---------------------------------------------------------------------------
+
+
+@pytest.mark.asyncio
+async def test_meter_event_allocations_are_bounded(hass, config_with_levels):
+    """A day of meter events through all sensors keeps memory flat.
+
+    Every event may allocate a few short-lived objects, but nothing may be
+    retained per event, and the transient peak of a single event stays small."""
+    coordinator = GridCapacityCoordinator(hass, config_with_levels)
+    sensors = [
+        sensor_class(hass, config_with_levels, coordinator)
+        for sensor_class in (
+            GridCapWatcherEnergySensor,
+            GridCapWatcherEstimatedEnergySensor,
+            GridCapWatcherAvailableEffectRemainingHour,
+            GridCapWatcherCurrentEffectLevelThreshold,
+            GridCapacityWatcherCurrentLevelName,
+            GridCapacityWatcherCurrentLevelPrice,
+            GridCapWatcherAverageThreePeakHours,
+        )
+    ]
+    for sensor in sensors:
+        sensor.async_write_ha_state = lambda: None
+    # The energy sensor is driven directly, without meter tracking.  Hours are
+    # closed by the meter timestamps.
+    coordinator.hourclose.subscribe(sensors[0]._hour_closed)
+    for sensor in sensors[1:]:
+        await sensor.async_added_to_hass()
+    energy = sensors[0]
+
+    start = dt.start_of_local_day()
+    states = [
+        State(
+            "sensor.power_meter",
+            str(400 + (i % 48) * 60),
+            {"unit_of_measurement": "W"},
+            last_updated=start + timedelta(seconds=30 * i),
+        )
+        for i in range(2 * 24 * 120 + 1)
+    ]
+    events = [
+        Event("state_changed", {"old_state": old, "new_state": new})
+        for old, new in zip(states, states[1:])
+    ]
+
+    def replay(chunk):
+        worst = 0
+        for event in chunk:
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            energy._async_on_change(event)
+            _, peak = tracemalloc.get_traced_memory()
+            worst = max(worst, peak - current)
+        return worst
+
+    # First day warms up caches and fills the top three hours
+    half = len(events) // 2
+    tracemalloc.start()
+    try:
+        replay(events[:half])
+        gc.collect()
+        baseline, _ = tracemalloc.get_traced_memory()
+        worst = replay(events[half:])
+        gc.collect()
+        retained = tracemalloc.get_traced_memory()[0] - baseline
+    finally:
+        tracemalloc.stop()
+
+    assert len(coordinator.thresholddata.value.top_three) == 2
+    assert worst < 4096
+    assert retained < 2048
@@ -0,0 +1,167 @@
+"""Soak test of the sensor pipeline over several simulated months.
+
+The full sensor graph is driven through month rollovers, reset events,
+template changes and removal and re-adding of all entities, while checking
+that listeners, timers, peaks and memory stay flat.
+
+Run with: pytest -m soak tests/test_soak.py
+"""
+
+import gc
+import tracemalloc
+from datetime import datetime, timedelta
+
+import pytest
+from homeassistant.helpers import storage
+from homeassistant.helpers.entity_platform import async_get_platforms
+from homeassistant.util import dt
+from pytest_homeassistant_custom_component.common import async_fire_time_changed
+
+from custom_components.energytariff.const import DOMAIN, RESET_TOP_THREE
+from custom_components.energytariff.coordinator import GridCapacityCoordinator
+from custom_components.energytariff.engine import _MAX_TABLES
+from custom_components.energytariff.store import SAVE_DELAY
+
+from .common import (
+    BENCHMARK_CONFIG,
+    METER_ENTITY,
+    async_setup_energytariff,
+    synthetic_power,
+)
+
+TARGET_ENTITY = "input_number.target_energy"
+PRICE_ENTITY = "input_number.level_price"
+
+SOAK_CONFIG = {
+    **BENCHMARK_CONFIG,
+    "target_energy": "{{ states('input_number.target_energy') | float(5) }}",
+    "levels": [
+        *BENCHMARK_CONFIG["levels"][:-1],
+        {
+            "name": "Max",
+            "threshold": 100.0,
+            "price": "{{ states('input_number.level_price') | float(400) }}",
+        },
+    ],
+}
+
+MONTHS = 3
+INTERVAL = 30
+EVENTS_PER_HOUR = 3600 // INTERVAL
+RESET_EVERY_DAYS = 7
+READD_EVERY_DAYS = 10
+# Memory that may be gained between the first and the last compared checkpoint
+MAX_GROWTH_BYTES = 256 * 1024
+
+
+def _resources(hass, coordinator: GridCapacityCoordinator) -> dict[str, int]:
+    """Count listeners, callbacks and timers that entities register."""
+    tracked = hass.data.get("track_state_change_data")
+    return {
+        "bus_listeners": sum(hass.bus.async_listeners().values()),
+        "state_callbacks": sum(len(jobs) for jobs in tracked.callbacks.values())
+        if tracked
+        else 0,
+        "timers": sum(1 for handle in hass.loop._scheduled if not handle.cancelled()),
+        "signal_listeners": sum(
+            len(signal._listeners)
+            for signal in (
+                coordinator.effectstate,
+                coordinator.thresholddata,
+                coordinator.peakdata,
+                coordinator.hourclose,
+            )
+        ),
+        "publishers": len(coordinator._publishers),
+        "peak_users": coordinator._peak_users,
+        "hour_users": coordinator._hour_users,
+    }
+
+
+async def _async_readd_entities(hass) -> None:
+    """Remove all entities of the platform and add new ones in their place."""
+    platform = async_get_platforms(hass, DOMAIN)[0]
+    entities = list(platform.entities.values())
+    coordinator = entities[0]._coordinator
+    for entity in entities:
+        await platform.async_remove_entity(entity.entity_id)
+    await platform.async_add_entities(
+        [type(entity)(hass, coordinator._config, coordinator) for entity in entities]
+    )
+    await hass.async_block_till_done()
+
+
+@pytest.mark.soak
+async def test_sensor_pipeline_stays_flat_for_months(hass, freezer):
+    """Nothing accumulates over months of meter updates."""
+    await hass.config.async_set_time_zone("Europe/Oslo")
+    start = datetime(2025, 1, 29, tzinfo=dt.get_default_time_zone()).timestamp()
+    freezer.move_to(dt.utc_from_timestamp(start))
+    hass.states.async_set(TARGET_ENTITY, "5")
+    hass.states.async_set(PRICE_ENTITY, "400")
+
+    attributes = {"unit_of_measurement": "W"}
+    checkpoints: list[tuple[dict[str, int], int]] = []
+    months_seen = set()
+    index = 0
+    # Traced from setup, so hour tables dropped from the cache are accounted
+    tracemalloc.start()
+    try:
+        await async_setup_energytariff(hass, SOAK_CONFIG)
+        for day in range(MONTHS * 31):
+            if day and day % READD_EVERY_DAYS == 0:
+                await _async_readd_entities(hass)
+            if day and day % RESET_EVERY_DAYS == 0:
+                hass.bus.async_fire(RESET_TOP_THREE)
+            hass.states.async_set(TARGET_ENTITY, str(4 + day % 3))
+            hass.states.async_set(PRICE_ENTITY, str(400 + day % 5 * 10))
+
+            for _ in range(24):
+                for _ in range(EVENTS_PER_HOUR):
+                    hass.states.async_set(
+                        METER_ENTITY,
+                        f"{synthetic_power(index):.0f}",
+                        attributes,
+                        force_update=True,
+                        timestamp=start + index * INTERVAL,
+                    )
+                    index += 1
+                # Hour timers fire after the meter has crossed the hour
+                now = dt.utc_from_timestamp(start + index * INTERVAL)
+                freezer.move_to(now)
+                async_fire_time_changed(hass, now)
+                await hass.async_block_till_done()
+
+            platform = async_get_platforms(hass, DOMAIN)[0]
+            coordinator = next(iter(platform.entities.values()))._coordinator
+            assert len(coordinator.peaks.top_three) <= 3
+            assert len(coordinator.peakdata.value.top_three) <= 3
+            average = hass.states.get("sensor.average_peak_hour_energy")
+            assert average.attributes["peak_hours"] <= 3
+            months_seen.add(coordinator.peaks.month)
+
+            # Hour tables of the last months are cached, compare once it is full
+            if day % 7 == 6 and len(months_seen) >= _MAX_TABLES:
+                # Let delayed writes of the peak store finish
+                async_fire_time_changed(hass, now + timedelta(seconds=SAVE_DELAY + 1))
+                await hass.async_block_till_done()
+                # The storage mock of the test harness records every write
+                storage.Store._async_write_data.reset_mock()
+                gc.collect()
+                checkpoints.append(
+                    (_resources(hass, coordinator), tracemalloc.get_traced_memory()[0])
+                )
+    finally:
+        tracemalloc.stop()
+
+    assert len(months_seen) >= MONTHS
+    assert len(checkpoints) >= 6
+    # The first checkpoint warms up the remaining caches, later weeks must not
+    # add anything
+    first_resources, first_memory = checkpoints[1]
+    for resources, memory in checkpoints[2:]:
+        assert resources == first_resources
+        assert memory - first_memory < MAX_GROWTH_BYTES
+    # Energy and available power sensors share the hour timer of the coordinator
+    assert first_resources["hour_users"] == 2
+    assert coordinator._unsub_hour_clock is not None
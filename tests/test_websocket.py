@@ -0,0 +1,146 @@
+"""Test the live data subscription over the websocket API."""
+
+import json
+import logging
+import time
+
+from homeassistant.components.websocket_api import ActiveConnection
+
+from custom_components.energytariff.utils import LOCAL_HOURS
+
+from .common import METER_ENTITY, async_setup_energytariff, set_meter
+
+
+async def _connect(hass, user) -> tuple[ActiveConnection, list[dict]]:
+    """A websocket connection that keeps the messages sent to the client"""
+    messages: list[dict] = []
+
+    def _send(message) -> None:
+        messages.append(message if isinstance(message, dict) else json.loads(message))
+
+    refresh_token = await hass.auth.async_create_refresh_token(user, "test")
+    connection = ActiveConnection(
+        logging.getLogger(__name__), hass, _send, user, refresh_token
+    )
+    return connection, messages
+
+
+async def _subscribe(hass, user, interval: float) -> tuple[float, list[dict]]:
+    """Subscribe with the meter at 3.6 kW from 30 seconds before the end of
+    an hour, ahead of the meter state set up now.  Returns that time and the
+    messages sent after the result"""
+    start = LOCAL_HOURS.hour_at(time.time() + 60).end - 30
+    set_meter(hass, 3600, start)
+    await hass.async_block_till_done()
+    connection, messages = await _connect(hass, user)
+    connection.async_handle(
+        {
+            "id": 1,
+            "type": "energytariff/subscribe",
+            "entity_id": METER_ENTITY,
+            "interval": interval,
+        }
+    )
+    assert messages.pop(0)["success"]
+    return start, messages
+
+
+async def test_subscribe_sends_decimated_frames(hass, hass_admin_user):
+    """Meter updates make frames, decimated to the requested interval."""
+    await async_setup_energytariff(hass)
+    start, messages = await _subscribe(hass, hass_admin_user, 10)
+
+    for second in range(2, 42, 2):
+        set_meter(hass, 3600, start + second)
+    await hass.async_block_till_done()
+
+    frames = [message["event"] for message in messages]
+    # The last update before subscribing comes first
+    assert frames[0]["time"] < start
+    # Frames are timed by the start of the interval an update ends
+    assert [frame["time"] - start for frame in frames[1:]] == [0, 10, 20, 30, 30]
+    assert frames[2] == {
+        "time": start + 10,
+        "power": 3600.0,
+        "energy": 0.01,
+        "estimate": 0.03,
+        "threshold": 2.0,
+        "available": 11400.0,
+    }
+    # The total of the hour, then the first update of the next hour
+    assert frames[4]["energy"] == 0.03
+    assert (frames[5]["energy"], frames[5]["estimate"]) == (0.0, 3.6)
+
+
+async def test_total_of_an_hour_is_not_decimated(hass, hass_admin_user):
+    """The last update of an hour is sent when the hour ends, even if it was
+    held back by the interval."""
+    await async_setup_energytariff(hass)
+    start, messages = await _subscribe(hass, hass_admin_user, 60)
+
+    for second in (5, 25, 33):
+        set_meter(hass, 3600, start + second)
+    await hass.async_block_till_done()
+
+    frames = [message["event"] for message in messages]
+    assert [frame["time"] - start for frame in frames if frame["time"] > start] == [
+        30,
+        30,
+    ]
+    assert [frame["energy"] for frame in frames[-2:]] == [0.03, 0.0]
+
+
+async def test_subscribe_to_unknown_meter(hass, hass_admin_user):
+    """Subscribing to a meter without an instance is an error."""
+    await async_setup_energytariff(hass)
+    connection, messages = await _connect(hass, hass_admin_user)
+
+    connection.async_handle(
+        {"id": 1, "type": "energytariff/subscribe", "entity_id": "sensor.other"}
+    )
+    assert not messages[0]["success"]
+    assert messages[0]["error"]["code"] == "not_found"
+
+
+async def test_unsubscribe_stops_frames(hass, hass_admin_user):
+    """Frames stop when the subscription ends."""
+    await async_setup_energytariff(hass)
+    connection, messages = await _connect(hass, hass_admin_user)
+    connection.async_handle(
+        {"id": 1, "type": "energytariff/subscribe", "entity_id": METER_ENTITY}
+    )
+    # As on unsubscribe_events or when the connection closes
+    connection.subscriptions.pop(1)()
+    messages.clear()
+
+    hass.states.async_set(METER_ENTITY, "1000", {"unit_of_measurement": "W"})
+    await hass.async_block_till_done()
+    assert messages == []
+
+
+async def test_peaks_are_sent_on_request(hass, hass_admin_user):
+    """The peak hours of the month are sent with the month they belong to."""
+    await async_setup_energytariff(hass)
+    start = LOCAL_HOURS.hour_at(time.time()).start
+    set_meter(hass, 3600, start)
+    set_meter(hass, 3600, start + 600)
+    await hass.async_block_till_done()
+    hour = LOCAL_HOURS.hour_at(start)
+    connection, messages = await _connect(hass, hass_admin_user)
+
+    connection.async_handle(
+        {"id": 1, "type": "energytariff/peaks", "entity_id": METER_ENTITY}
+    )
+    assert messages[0]["success"]
+    assert messages[0]["result"] == {
+        "year": hour.year,
+        "month": hour.month,
+        "top_three": [
+            {"month": hour.month, "day": hour.day, "hour": hour.hour, "energy": 0.6}
+        ],
+    }
+
+    connection.async_handle(
+        {"id": 2, "type": "energytariff/peaks", "entity_id": "sensor.other"}
+    )
+    assert messages[1]["error"]["code"] == "not_found"